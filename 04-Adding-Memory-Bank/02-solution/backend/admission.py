@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Chat turns running at once per worker process (each can hold several image generations)
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "4"))
+# Turns that may wait for a slot, and for how long, before they are turned away with 429
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "8"))
+CHAT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "10"))
+# Running plus waiting turns per user
+CHAT_MAX_PER_USER = int(os.getenv("CHAT_MAX_PER_USER", "2"))
+# Initial estimate of a turn's duration, used for Retry-After until turns have been measured
+CHAT_TURN_SECONDS_ESTIMATE = 20.0
+
+
+class AdmissionRejected(Exception):
+    """Raised when a turn cannot be admitted; maps to 429 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after: int, queue_position: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+
+
+class AdmissionController:
+    """
+    Bounded concurrency for chat turns with a short, fair wait queue.
+
+    Up to `max_concurrency` turns run at once. Further turns wait up to
+    `queue_timeout` seconds in a queue of at most `queue_size`; freed slots are
+    handed out round-robin across users, so one client submitting many turns
+    cannot starve the others, and each user may hold at most `max_per_user`
+    running or waiting turns. Turns that cannot be admitted raise
+    `AdmissionRejected` with a Retry-After estimated from recent turn durations.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = CHAT_MAX_CONCURRENCY,
+        queue_size: int = CHAT_QUEUE_SIZE,
+        queue_timeout: float = CHAT_QUEUE_TIMEOUT_SECONDS,
+        max_per_user: int = CHAT_MAX_PER_USER,
+    ):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self.running = 0
+        self._running_by_user: Counter = Counter()
+        # user -> waiting turns (oldest first); the dict order is the round-robin order
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Counter = Counter()
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.avg_turn_seconds = CHAT_TURN_SECONDS_ESTIMATE
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+    def _queue_position(self, user: str, future: Optional[asyncio.Future] = None) -> int:
+        """1-based position in the round-robin order (the next position if `future` is None)."""
+        users = list(self._waiting)
+        if future is None:
+            return self.waiting + 1
+        queue = self._waiting.get(user, deque())
+        rank = queue.index(future) if future in queue else len(queue)
+        turn = users.index(user) if user in users else len(users)
+        # Turns ahead: every user gets one grant per round until their queue runs out
+        ahead = sum(min(len(q), rank + (1 if i < turn else 0)) for i, q in enumerate(self._waiting.values()) if i != turn)
+        return ahead + rank + 1
+
+    def _retry_after(self, position: int) -> int:
+        return max(1, math.ceil(self.avg_turn_seconds * position / self.max_concurrency))
+
+    def _reject(self, reason: str, user: str, position: int):
+        self.rejected[reason] += 1
+        retry_after = self._retry_after(position)
+        logger.warning(f"Rejected chat turn of {user}: {reason} (position {position}, retry after {retry_after}s)")
+        raise AdmissionRejected(reason, retry_after, position)
+
+    def _grant(self, user: str):
+        self.running += 1
+        self._running_by_user[user] += 1
+        self.admitted += 1
+
+    def _grant_next(self):
+        while self.running < self.max_concurrency and self._waiting:
+            user, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            # Rotate: the user goes to the back of the round-robin order
+            del self._waiting[user]
+            if queue:
+                self._waiting[user] = queue
+            if not future.done():
+                self._grant(user)
+                future.set_result(True)
+
+    def _remove(self, user: str, future: asyncio.Future):
+        queue = self._waiting.get(user)
+        if queue and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._waiting[user]
+
+    async def acquire(self, user: str):
+        if self._running_by_user[user] + len(self._waiting.get(user, ())) >= self.max_per_user:
+            self._reject("per_user_limit", user, self._queue_position(user))
+        if self.running < self.max_concurrency and not self._waiting:
+            self._grant(user)
+            return
+        if self.waiting >= self.queue_size:
+            self._reject("queue_full", user, self._queue_position(user))
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user, deque()).append(future)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                position = self._queue_position(user, future)
+                self._remove(user, future)
+                future.cancel()
+                self._reject("queue_timeout", user, position)
+        except BaseException:
+            # Cancelled while waiting (e.g. the client went away): give the slot back if it was granted
+            self._remove(user, future)
+            if future.done() and not future.cancelled():
+                self.release(user)
+            else:
+                future.cancel()
+            raise
+        waited = time.monotonic() - started
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def release(self, user: str, turn_seconds: Optional[float] = None):
+        self.running -= 1
+        self._running_by_user[user] -= 1
+        if self._running_by_user[user] <= 0:
+            del self._running_by_user[user]
+        if turn_seconds is not None:
+            # Moving average of the turn duration for Retry-After
+            self.avg_turn_seconds = 0.8 * self.avg_turn_seconds + 0.2 * turn_seconds
+        self._grant_next()
+
+    @asynccontextmanager
+    async def admit(self, user: str):
+        """Holds a turn slot for `user` for the duration of the block; raises `AdmissionRejected`."""
+        await self.acquire(user)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(user, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_size": self.queue_size,
+            "max_per_user": self.max_per_user,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "avg_queue_wait_seconds": round(self.total_wait_seconds / self.queued, 3) if self.queued else 0.0,
+            "max_queue_wait_seconds": round(self.max_wait_seconds, 3),
+            "avg_turn_seconds": round(self.avg_turn_seconds, 3),
+            "running_by_user": dict(self._running_by_user),
+        }
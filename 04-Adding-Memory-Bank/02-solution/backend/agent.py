@@ -1,12 +1,21 @@
 import os
 import sys
+import asyncio
 import logging
 from dotenv import load_dotenv
-from google.adk.agents import Agent
-from google.adk.tools.mcp_tool import McpToolset
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
-from mcp import StdioServerParameters
-from typing import Dict, Any, List
+from history_compaction import HistoryCompactor
+from context_cache import StaticContextCache
+from cassette import open_cassette
+from state_store import TREE, get_state_store
+from jobs import get_job_store, unknown_tools
+from usage import image_filenames, tool_output_text
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.adk.agents import Agent
+    from google.adk.agents.callback_context import CallbackContext
+    from google.adk.tools.tool_context import ToolContext
+    from google.genai import types
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -14,22 +23,20 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-import vertexai
 PROJECT_ID = os.getenv("PROJECT_ID")
 LOCATION = os.getenv("LOCATION", "us-central1")
 
-if PROJECT_ID:
-    vertexai.init(project=PROJECT_ID, location=LOCATION)
-
 if not os.getenv("GOOGLE_API_KEY"):
     logger.warning("GOOGLE_API_KEY not found in environment variables. Agent may fail to initialize.")
 
-# Mock state for the tree
+# Mock state for the tree (defaults; current values live in the shared state store
+# so every uvicorn worker sees the same tree)
 TREE_STATE = {
     "lights_color": "warm_white",
     "ornament_texture": "default_gold",
     "theme": "emerald_gold"
 }
+state_store = get_state_store()
 
 def update_tree_config(config_key: str, value: str) -> Dict[str, Any]:
     """
@@ -43,8 +50,8 @@ def update_tree_config(config_key: str, value: str) -> Dict[str, Any]:
         The updated tree state.
     """
     if config_key in TREE_STATE:
-        TREE_STATE[config_key] = value
-        return {"status": "success", "updated_state": TREE_STATE, "message": f"Updated {config_key} to {value}"}
+        state_store.set(TREE, config_key, value)
+        return {"status": "success", "updated_state": get_tree_state(), "message": f"Updated {config_key} to {value}"}
     else:
         return {"status": "error", "message": f"Invalid configuration key: {config_key}"}
 
@@ -55,32 +62,70 @@ def get_tree_state() -> Dict[str, Any]:
     Returns:
         The current tree state.
     """
-    return TREE_STATE
+    return {**TREE_STATE, **state_store.get_all(TREE)}
+
+# Keeps the replayed conversation history under a token budget
+history_compactor = HistoryCompactor(facts_provider=get_tree_state)
+# Static instruction + tool schemas, cached on the model side at startup (see warmup.py)
+context_cache = StaticContextCache()
+# Records the agent's model calls, or replays them instead of calling the model (MODEL_CASSETTE_MODE)
+model_cassette = open_cassette("agent")
 
-def analyze_image_and_suggest_texture(image_description: str) -> Dict[str, Any]:
+def analyze_image_and_suggest_texture(image_path: str) -> Dict[str, Any]:
     """
-    Analyzes an image description (provided by the model's vision capabilities) and suggests a texture.
+    Analyzes the colors of an uploaded image and suggests a matching tree theme, lights color and ornament texture.
     
     Args:
-        image_description: A description of the uploaded image.
+        image_path: The absolute path of the uploaded image.
         
     Returns:
-        A suggestion for the ornament texture.
+        The suggested tree settings with the image's dominant palette, brightness and saturation.
     """
-    # In a real scenario, this might involve more complex logic or generation.
-    # For now, we'll return a mock texture URL based on keywords.
-    
-    texture_url = "https://example.com/textures/default_gold.jpg"
-    if "red" in image_description.lower():
-        texture_url = "https://example.com/textures/red_velvet.jpg"
-    elif "blue" in image_description.lower():
-        texture_url = "https://example.com/textures/blue_ice.jpg"
-    elif "star" in image_description.lower():
-        texture_url = "https://example.com/textures/star_pattern.jpg"
-        
+    # NumPy is only needed here; keep it out of the module import
+    from palette import suggest_tree_config
+
+    if not os.path.exists(image_path):
+        return {"status": "error", "message": f"Image not found: {image_path}"}
+    try:
+        suggestion = suggest_tree_config(image_path)
+    except Exception as e:
+        logger.error(f"Palette analysis of {image_path} failed: {e}")
+        return {"status": "error", "message": f"Could not analyze the image: {e}"}
+
+    suggestion["status"] = "success"
+    suggestion["reasoning"] = (
+        f"Dominant colors {', '.join(c['color'] for c in suggestion['palette'][:3])} "
+        f"(brightness {suggestion['brightness']}, saturation {suggestion['saturation']}) "
+        f"match the '{suggestion['theme']}' theme. Apply with update_tree_config."
+    )
+    return suggestion
+
+async def start_render_job(steps: List[Dict[str, Any]], tool_context: "ToolContext") -> Dict[str, Any]:
+    """
+    Starts a long image generation in the background and returns right away with a job handle.
+    The steps run in order, e.g. [{"tool": "generate_sweater_pattern", "arguments": {"motif": "reindeer"}},
+    {"tool": "generate_wearing_sweater", "arguments": {}}]. The app shows the images when the job is done.
+
+    Args:
+        steps: Image tool calls to run, each with a "tool" name and its "arguments".
+
+    Returns:
+        The job ID and where its status can be polled.
+    """
+    # Same check as /api/jobs, so a misspelled tool is reported now instead of failing in the worker
+    tool_names = [tool.name for tool in await mcp_toolset.get_tools()]
+    unknown = unknown_tools(steps, tool_names)
+    if unknown:
+        return {"status": "error", "message": f"Unknown image tools: {unknown}. Available: {tool_names}"}
+    try:
+        job = get_job_store().submit(steps, session_id=tool_context._invocation_context.session.id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
     return {
-        "suggested_texture": texture_url,
-        "reasoning": f"Based on the image description '{image_description}', we suggest this texture."
+        "status": "queued",
+        "job_id": job["id"],
+        "status_url": f"/api/jobs/{job['id']}",
+        "message": "The render runs in the background; the image appears in the chat when it is done.",
     }
 
 agent_instruction = """
@@ -100,65 +145,87 @@ Your goal is to bring holiday cheer by customizing 3D Christmas trees AND genera
     *   Pass these arguments to the tool: `generate_wearing_sweater(pattern_description="...", image_path="...")`.
     *   If no specific pattern is mentioned, use a default like "festive holiday pattern" or ask the user.
     *   **ALWAYS DISPLAY THE GENERATED IMAGE.** The tool returns a filename (e.g., "generated_selfie.png"). You MUST tell the user "Here is the image!" and ensure the UI shows it (the backend handles the URL, but your text confirmation helps).
-5.  **Tree Customization:** You can still help with the tree using `update_tree_config`.
+5.  **Tree Customization:** You can still help with the tree using `update_tree_config`. To match the tree to an uploaded photo, call `analyze_image_and_suggest_texture` with the photo's absolute path and apply the suggested values with `update_tree_config`.
+6.  **Comparing Options:** When the user wants to compare several motifs or scene ideas, call `generate_variants` ONCE with all of them instead of one tool call per option. Then let the user pick; generate the chosen one with `generate_sweater_pattern` or `generate_holiday_scene` if it is needed for later steps.
+7.  **Long Renders:** For a chain of several images (e.g. pattern, then wearing it, then the final photo), use `start_render_job` with the steps in order and reply right away that the images are being created, including the job ID.
 
 **Available Tools:**
 * `generate_wearing_sweater`: Generate a cute character wearing a sweater with a specific pattern. Can optionally take an `image_path` to personalize the avatar.
 * `generate_holiday_scene`: Generate a holiday scene.
 * `generate_sweater_pattern`: Generate a sweater pattern.
 * `generate_final_photo`: Generate a final photo.
+* `generate_variants`: Generate several sweater patterns or holiday scenes in parallel plus a contact sheet comparing them.
 * `update_tree_config`: Change tree settings.
 * `get_tree_state`: Get current settings.
-* `analyze_image_and_suggest_texture`: Suggest textures.
+* `analyze_image_and_suggest_texture`: Analyze an uploaded image's colors (pass its absolute path) and suggest `theme`, `lights_color` and `ornament_texture`.
+* `start_render_job`: Run image tools in the background and return a job ID immediately.
 
 **Example User Requests & Actions:**
 * "Generate a cute person wearing a snowflake sweater" -> Call `generate_wearing_sweater(pattern_description="snowflake pattern")`.
 * "Make me wear this sweater" (with uploaded photo) -> Call `generate_wearing_sweater(pattern_description="...", image_path="/path/to/photo.jpg")`.
 * "Make a holiday scene" -> Call `generate_holiday_scene`.
 * "Design a sweater pattern" -> Call `generate_sweater_pattern`.
+* "Show me reindeer, snowflake and penguin sweater options" -> Call `generate_variants(kind="sweater_pattern", descriptions=["reindeer", "snowflake", "penguin"])`.
 """
 
 # Path to the MCP server script
 MCP_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_server.py")
 
-# Initialize the agent
-# Note: In a real app, you'd likely inject the model client.
-# For this example, we assume the ADK handles the model connection via env vars or default config.
-from google.adk.agents.callback_context import CallbackContext
-from google.adk.tools.preload_memory_tool import PreloadMemoryTool
-from google.genai import types
-from typing import Optional
-
-# ... (existing code)
-
-import asyncio
+from memory_ingestion import ingestion_worker
 
 async def add_session_to_memory(
-        callback_context: CallbackContext
-) -> Optional[types.Content]:
-    """Automatically save completed sessions to memory bank in the background"""
+        callback_context: "CallbackContext"
+) -> Optional["types.Content"]:
+    """Queue the session for debounced, incremental ingestion into the memory bank"""
     if hasattr(callback_context, "_invocation_context"):
         invocation_context = callback_context._invocation_context
         if invocation_context.memory_service:
-            # Use create_task to run this in the background without blocking the response
-            asyncio.create_task(
-                invocation_context.memory_service.add_session_to_memory(
-                    invocation_context.session
-                )
-            )
+            # The worker debounces per session, caps concurrent writes and tracks its tasks
+            ingestion_worker.schedule(invocation_context.memory_service, invocation_context.session)
             logger.info("Scheduled session save to memory bank in background")
 
-# Initialize the agent
-# Note: In a real app, you'd likely inject the model client.
-# For this example, we assume the ADK handles the model connection via env vars or default config.
+async def save_generated_images(
+        tool, args: Dict[str, Any], tool_context: "ToolContext", tool_response: Any
+) -> Optional[Dict[str, Any]]:
+    """Saves the images an MCP tool reports as written as versioned session artifacts"""
+    if getattr(tool, "_mcp_session_manager", None) is None:
+        return None
+    from local_artifact_service import artifact_name, read_file_part
+
+    for filename in image_filenames(tool_output_text(tool_response)):
+        path = os.path.join("static", filename)
+        if not os.path.exists(path):
+            continue
+        try:
+            part = await asyncio.to_thread(read_file_part, path)
+            version = await tool_context.save_artifact(artifact_name(filename), part)
+            logger.info(f"Saved {filename} as artifact version {version}")
+        except Exception as e:
+            logger.warning(f"Could not save {filename} as an artifact: {e}")
+    return None
 
 USE_MEMORY_BANK = os.getenv("USE_MEMORY_BANK", "false").lower() == "true"
 
-agent_tools = [
-    update_tree_config,
-    get_tree_state,
-    analyze_image_and_suggest_texture,
-    McpToolset(
+# MCP toolset of the agent, set by create_agent()
+mcp_toolset = None
+
+def create_agent() -> "Agent":
+    """
+    Builds the Christmas tree agent and its MCP toolset.
+
+    The ADK is imported here rather than at module level so that importing this
+    module (e.g. for the tree state) stays cheap.
+    Note: In a real app, you'd likely inject the model client.
+    For this example, we assume the ADK handles the model connection via env vars or default config.
+    """
+    global mcp_toolset
+    from google.adk.agents import Agent
+    from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+    from google.adk.tools.preload_memory_tool import PreloadMemoryTool
+    from mcp import StdioServerParameters
+    from mcp_tools import CachedMcpToolset
+
+    mcp_toolset = CachedMcpToolset(
         connection_params=StdioConnectionParams(
             server_params=StdioServerParameters(
                 command=sys.executable,
@@ -168,15 +235,36 @@ agent_tools = [
             timeout=120 # Increase timeout for image generation
         )
     )
-]
-
-if USE_MEMORY_BANK:
-    agent_tools.append(PreloadMemoryTool())
-
-christmas_agent = Agent(
-    model="gemini-2.5-flash",
-    name="christmas_tree_agent",
-    instruction=agent_instruction,
-    tools=agent_tools,
-    after_agent_callback=add_session_to_memory if USE_MEMORY_BANK else None
-)
+
+    agent_tools = [
+        update_tree_config,
+        get_tree_state,
+        analyze_image_and_suggest_texture,
+        start_render_job,
+        mcp_toolset,
+    ]
+
+    if USE_MEMORY_BANK:
+        agent_tools.append(PreloadMemoryTool())
+
+    # Compaction rewrites the contents first; the context cache then swaps the static prefix for its reference
+    before_model_callbacks = [history_compactor.before_model_callback, context_cache.before_model_callback]
+    after_model_callbacks = [context_cache.after_model_callback]
+    if model_cassette is not None:
+        # Keys the request as the agent built it; a replayed response skips the other callbacks and the model
+        before_model_callbacks.insert(0, model_cassette.before_model_callback)
+        after_model_callbacks.append(model_cassette.after_model_callback)
+
+    return Agent(
+        model="gemini-2.5-flash",
+        name="christmas_tree_agent",
+        instruction=agent_instruction,
+        tools=agent_tools,
+        before_model_callback=before_model_callbacks,
+        after_model_callback=after_model_callbacks,
+        # Fails MCP tool calls fast with a friendly error while the tool server restarts
+        on_tool_error_callback=mcp_toolset.supervisor.on_tool_error_callback,
+        # Registers generated images with the Runner's artifact service
+        after_tool_callback=save_generated_images,
+        after_agent_callback=add_session_to_memory if USE_MEMORY_BANK else None
+    )
@@ -0,0 +1,402 @@
+import fnmatch
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from image_encoding import STATIC_DIR, delivery_filename, resolve_delivery
+from jobs import pid_alive
+
+logger = logging.getLogger(__name__)
+
+# SQLite index of the artifacts under static/ (shared by the backend workers and the MCP server)
+ARTIFACT_INDEX_PATH = os.getenv("ARTIFACT_INDEX_PATH", "artifacts.db")
+# Bytes all artifacts together may use; each category also has its own quota (see RETENTION_POLICIES)
+ARTIFACT_QUOTA_MB = float(os.getenv("ARTIFACT_QUOTA_MB", "1024"))
+# JSON overrides of the policies below, e.g. '{"upload": {"quota_mb": 100, "max_age_hours": 24}}'
+ARTIFACT_RETENTION = os.getenv("ARTIFACT_RETENTION", "")
+# Artifacts used more recently than this are never evicted (later steps of a turn still read them)
+ARTIFACT_MIN_IDLE_SECONDS = float(os.getenv("ARTIFACT_MIN_IDLE_SECONDS", "600"))
+# How often the sweeper enforces the quotas, and how many file operations per second it may do
+ARTIFACT_SWEEP_INTERVAL_SECONDS = float(os.getenv("ARTIFACT_SWEEP_INTERVAL_SECONDS", "60"))
+ARTIFACT_SWEEP_MAX_OPS_PER_SECOND = float(os.getenv("ARTIFACT_SWEEP_MAX_OPS_PER_SECOND", "20"))
+# Indexed files the sweeper re-checks on disk per pass (catches files deleted or replaced outside the store)
+ARTIFACT_VERIFY_BATCH = int(os.getenv("ARTIFACT_VERIFY_BATCH", "50"))
+# Access times are written at most this often per artifact
+ARTIFACT_TOUCH_INTERVAL_SECONDS = 60.0
+
+UPLOAD = "upload"              # photos users uploaded (uploads/)
+INTERMEDIATE = "intermediate"  # inputs of later steps: patterns, scenes, selfies, variants, contact sheets
+FINAL = "final"                # final photos
+
+# Category of a file by its path under static/ without extension; other files are app assets and never evicted
+CATEGORY_PATTERNS: List[Tuple[str, str]] = [
+    ("uploads/*", UPLOAD),
+    ("generated_final_photo", FINAL),
+    ("generated_*", INTERMEDIATE),
+    ("variants/*", INTERMEDIATE),
+]
+
+# Files that ship with the repository (defaults read by the tools, demo uploads); they are
+# indexed and counted but never evicted, so sweeps do not delete tracked files
+PINNED_ARTIFACTS = {
+    "generated_pattern.png",
+    "generated_selfie.png",
+    "uploads/IMG_6147.jpeg",
+}
+
+
+@dataclass
+class RetentionPolicy:
+    quota_mb: float
+    max_age_hours: Optional[float] = None
+
+    @property
+    def quota_bytes(self) -> int:
+        return int(self.quota_mb * 1024 * 1024)
+
+
+RETENTION_POLICIES: Dict[str, RetentionPolicy] = {
+    UPLOAD: RetentionPolicy(quota_mb=256, max_age_hours=24 * 7),
+    INTERMEDIATE: RetentionPolicy(quota_mb=256, max_age_hours=24),
+    FINAL: RetentionPolicy(quota_mb=512),
+}
+
+if ARTIFACT_RETENTION:
+    for _category, _overrides in json.loads(ARTIFACT_RETENTION).items():
+        RETENTION_POLICIES[_category] = RetentionPolicy(**{**vars(RETENTION_POLICIES[_category]), **_overrides})
+
+
+def category_for(filename: str) -> Optional[str]:
+    """
+    Returns the retention category of a file.
+
+    Args:
+        filename: Path relative to static/ (e.g. "uploads/me.jpg").
+
+    Returns:
+        The category, or None for files the store does not manage.
+    """
+    stem = os.path.splitext(filename)[0]
+    for pattern, category in CATEGORY_PATTERNS:
+        if fnmatch.fnmatch(stem, pattern):
+            return category
+    return None
+
+
+def master_of(filename: str) -> str:
+    """The generated PNG master of a delivery copy; any other file is its own master."""
+    master = os.path.splitext(filename)[0] + ".png"
+    return master if master != filename and delivery_filename(master) == filename else filename
+
+
+class ArtifactStore:
+    """
+    Index of uploaded and generated images with per-category quotas and LRU eviction.
+
+    Writers register each file they create and readers touch the files they use,
+    so the index knows every artifact's size and last access without listing
+    static/. A generated master and its delivery copy are one artifact. The
+    sweeper evicts artifacts past their category's maximum age, then the least
+    recently used ones until every category and the total are within quota,
+    pacing its file operations so it never competes with generation for disk I/O.
+    """
+
+    def __init__(self, path: str = ARTIFACT_INDEX_PATH, static_dir: str = STATIC_DIR, quota_mb: float = ARTIFACT_QUOTA_MB):
+        self.path = path
+        self.static_dir = static_dir
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self._local = threading.local()
+        self._touched: Dict[str, float] = {}
+        self._touch_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self.sweeps = 0
+        self.evicted: Counter = Counter()
+        self.evicted_bytes: Counter = Counter()
+        self.missing = 0
+        self.last_sweep_seconds = 0.0
+        self._conn().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                path TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                delivery TEXT NOT NULL,
+                session_id TEXT,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                verified_at REAL NOT NULL DEFAULT 0,
+                pinned INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_artifacts_lru ON artifacts (category, accessed_at);
+            CREATE INDEX IF NOT EXISTS idx_artifacts_verified ON artifacts (verified_at);
+            CREATE TABLE IF NOT EXISTS artifact_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        try:
+            # Indexes created before files could be pinned
+            self._conn().execute("ALTER TABLE artifacts ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        self._conn().execute(
+            f"UPDATE artifacts SET pinned = 1 WHERE path IN ({','.join('?' * len(PINNED_ARTIFACTS))})", tuple(PINNED_ARTIFACTS)
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _relpath(self, path: str) -> Optional[str]:
+        """Path relative to static/, or None if `path` lies outside it."""
+        relpath = os.path.relpath(os.path.abspath(path), os.path.abspath(self.static_dir))
+        return None if relpath.startswith("..") else relpath.replace(os.sep, "/")
+
+    def _sizes(self, filename: str) -> Tuple[int, str]:
+        """Bytes on disk of a master plus its delivery copy, and the file to serve."""
+        size = os.path.getsize(os.path.join(self.static_dir, filename))
+        delivery = resolve_delivery(filename, self.static_dir)
+        if delivery != filename:
+            size += os.path.getsize(os.path.join(self.static_dir, delivery))
+        return size, delivery
+
+    def register(self, path: str, session_id: Optional[str] = None):
+        """
+        Adds or refreshes an artifact after it was written (again).
+
+        Args:
+            path: The file, relative to the working directory or absolute. Files
+                outside static/ or outside every category are ignored.
+            session_id: The session that produced it, if known.
+        """
+        filename = self._relpath(path)
+        category = category_for(filename) if filename else None
+        if category is None:
+            return
+        try:
+            size, delivery = self._sizes(filename)
+        except OSError:
+            return
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO artifacts (path, category, size, delivery, session_id, created_at, accessed_at, verified_at, pinned) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+            "size = excluded.size, delivery = excluded.delivery, created_at = excluded.created_at, accessed_at = excluded.accessed_at, "
+            "verified_at = excluded.verified_at, session_id = COALESCE(excluded.session_id, session_id)",
+            (filename, category, size, delivery, session_id, now, now, now, int(filename in PINNED_ARTIFACTS)),
+        )
+        with self._touch_lock:
+            self._touched[filename] = now
+        if self._thread is not None:
+            self._wakeup.set()
+
+    def touch(self, path: str):
+        """Records an access (of the master or its delivery copy) for LRU eviction."""
+        filename = self._relpath(path)
+        if not filename or category_for(filename) is None:
+            return
+        filename = master_of(filename)
+        now = time.time()
+        with self._touch_lock:
+            if now - self._touched.get(filename, 0.0) < ARTIFACT_TOUCH_INTERVAL_SECONDS:
+                return
+            self._touched[filename] = now
+        self._conn().execute("UPDATE artifacts SET accessed_at = ? WHERE path = ?", (now, filename))
+
+    def list_files(self, categories: Tuple[str, ...] = (INTERMEDIATE, FINAL), top_level: bool = True) -> List[str]:
+        """Files to serve (delivery copies where available) of the given categories, newest first."""
+        rows = self._conn().execute(
+            f"SELECT path, delivery FROM artifacts WHERE category IN ({','.join('?' * len(categories))}) ORDER BY created_at DESC",
+            categories,
+        ).fetchall()
+        return [row["delivery"] for row in rows if not (top_level and "/" in row["path"])]
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        rows = self._conn().execute("SELECT category, COUNT(*) AS files, SUM(size) AS bytes FROM artifacts GROUP BY category").fetchall()
+        return {row["category"]: {"files": row["files"], "bytes": row["bytes"]} for row in rows}
+
+    def adopt_existing(self) -> int:
+        """Indexes the artifacts already on disk. Runs once per index; later sweeps never list static/."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM artifact_meta WHERE key = 'adopted'").fetchone():
+            return 0
+        adopted = 0
+        for root, _, files in os.walk(self.static_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = self._relpath(path)
+                # Delivery copies are counted with their master
+                if category_for(filename) is None or master_of(filename) != filename or filename.endswith(".tmp"):
+                    continue
+                self.register(path)
+                adopted += 1
+        conn.execute("INSERT OR REPLACE INTO artifact_meta (key, value) VALUES ('adopted', ?)", (str(time.time()),))
+        logger.info(f"Indexed {adopted} existing artifacts")
+        return adopted
+
+    def _pace(self) -> bool:
+        """Waits out one file operation's share of the I/O budget; False once the sweeper is stopping."""
+        return not self._stop.wait(1.0 / ARTIFACT_SWEEP_MAX_OPS_PER_SECOND)
+
+    def _evict(self, row: sqlite3.Row, reason: str) -> bool:
+        # Skip it if it was written or used again since it was selected
+        deleted = self._conn().execute(
+            "DELETE FROM artifacts WHERE path = ? AND accessed_at = ?", (row["path"], row["accessed_at"])
+        ).rowcount
+        if not deleted:
+            return False
+        for filename in {row["path"], delivery_filename(row["path"])}:
+            try:
+                os.remove(os.path.join(self.static_dir, filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to delete artifact {filename}: {e}")
+        with self._touch_lock:
+            self._touched.pop(row["path"], None)
+        self.evicted[row["category"]] += 1
+        self.evicted_bytes[row["category"]] += row["size"]
+        logger.info(f"Evicted {row['category']} artifact {row['path']} ({row['size']} bytes, {reason})")
+        return True
+
+    def _evict_lru(self, excess: int, category: Optional[str] = None) -> bool:
+        """Evicts least recently used artifacts until `excess` bytes are freed; False if interrupted."""
+        idle_before = time.time() - ARTIFACT_MIN_IDLE_SECONDS
+        query = "SELECT * FROM artifacts WHERE accessed_at < ? AND NOT pinned"
+        params: Tuple = (idle_before,)
+        if category is not None:
+            query += " AND category = ?"
+            params += (category,)
+        for row in self._conn().execute(query + " ORDER BY accessed_at", params).fetchall():
+            if excess <= 0:
+                break
+            if self._evict(row, "over quota"):
+                excess -= row["size"]
+            if not self._pace():
+                return False
+        if excess > 0:
+            logger.warning(f"Artifacts of {category or 'all categories'} exceed their quota by {excess} bytes; the rest is in use or pinned")
+        return True
+
+    def sweep(self) -> int:
+        """
+        One pass: expiry, per-category quotas, total quota, then verification of a batch of index rows.
+
+        Returns:
+            Number of artifacts evicted.
+        """
+        started = time.perf_counter()
+        evicted_before = sum(self.evicted.values())
+        conn = self._conn()
+        now = time.time()
+        for category, policy in RETENTION_POLICIES.items():
+            if policy.max_age_hours is not None:
+                expired = conn.execute(
+                    "SELECT * FROM artifacts WHERE category = ? AND accessed_at < ? AND NOT pinned ORDER BY accessed_at",
+                    (category, now - policy.max_age_hours * 3600),
+                ).fetchall()
+                for row in expired:
+                    self._evict(row, "expired")
+                    if not self._pace():
+                        return sum(self.evicted.values()) - evicted_before
+            used = self.usage().get(category, {}).get("bytes") or 0
+            if used > policy.quota_bytes and not self._evict_lru(used - policy.quota_bytes, category):
+                return sum(self.evicted.values()) - evicted_before
+        total = sum(entry["bytes"] or 0 for entry in self.usage().values())
+        if total > self.quota_bytes and not self._evict_lru(total - self.quota_bytes):
+            return sum(self.evicted.values()) - evicted_before
+
+        for row in conn.execute("SELECT path FROM artifacts ORDER BY verified_at LIMIT ?", (ARTIFACT_VERIFY_BATCH,)).fetchall():
+            try:
+                size, delivery = self._sizes(row["path"])
+                conn.execute("UPDATE artifacts SET size = ?, delivery = ?, verified_at = ? WHERE path = ?", (size, delivery, time.time(), row["path"]))
+            except OSError:
+                conn.execute("DELETE FROM artifacts WHERE path = ?", (row["path"],))
+                self.missing += 1
+            if not self._pace():
+                break
+
+        self.sweeps += 1
+        self.last_sweep_seconds = time.perf_counter() - started
+        return sum(self.evicted.values()) - evicted_before
+
+    def _claim_sweeper(self) -> bool:
+        """One sweeper per index: the lease passes to another process when its holder exits or lets it lapse."""
+        conn = self._conn()
+        pid = os.getpid()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM artifact_meta WHERE key = 'sweeper'").fetchone()
+            lease = json.loads(row["value"]) if row else None
+            claimed = lease is None or lease["pid"] == pid or lease["expires_at"] < time.time() or not pid_alive(lease["pid"])
+            if claimed:
+                conn.execute(
+                    "INSERT OR REPLACE INTO artifact_meta (key, value) VALUES ('sweeper', ?)",
+                    (json.dumps({"pid": pid, "expires_at": time.time() + 3 * ARTIFACT_SWEEP_INTERVAL_SECONDS}),),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return claimed
+
+    def _sweeper(self):
+        try:
+            if self._claim_sweeper():
+                self.adopt_existing()
+        except Exception as e:
+            logger.error(f"Failed to index existing artifacts: {e}")
+        while not self._stop.is_set():
+            try:
+                if self._claim_sweeper():
+                    evicted = self.sweep()
+                    if evicted:
+                        logger.info(f"Artifact sweep evicted {evicted} artifacts in {self.last_sweep_seconds:.2f}s")
+            except Exception as e:
+                logger.error(f"Artifact sweep failed: {e}")
+            self._wakeup.wait(ARTIFACT_SWEEP_INTERVAL_SECONDS)
+            self._wakeup.clear()
+
+    def start(self):
+        """Starts the background sweeper thread (idempotent)."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sweeper, name="artifact-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        usage = self.usage()
+        return {
+            "quota_bytes": self.quota_bytes,
+            "used_bytes": sum(entry["bytes"] or 0 for entry in usage.values()),
+            "categories": {
+                category: {**usage.get(category, {"files": 0, "bytes": 0}), "quota_bytes": policy.quota_bytes, "max_age_hours": policy.max_age_hours}
+                for category, policy in RETENTION_POLICIES.items()
+            },
+            "sweeps": self.sweeps,
+            "last_sweep_seconds": round(self.last_sweep_seconds, 3),
+            "evicted": dict(self.evicted),
+            "evicted_bytes": dict(self.evicted_bytes),
+            "missing": self.missing,
+        }
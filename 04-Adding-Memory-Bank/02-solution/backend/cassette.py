@@ -0,0 +1,343 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from google.adk.agents.callback_context import CallbackContext
+    from google.adk.models import LlmRequest, LlmResponse
+
+logger = logging.getLogger(__name__)
+
+# Directory of the cassette, and whether model calls are recorded into it or replayed from it ("off", "record", "replay")
+MODEL_CASSETTE = os.getenv("MODEL_CASSETTE", "")
+MODEL_CASSETTE_MODE = os.getenv("MODEL_CASSETTE_MODE", "off").lower()
+# Replay with each call's recorded duration instead of instantly
+MODEL_CASSETTE_REALTIME = os.getenv("MODEL_CASSETTE_REALTIME", "false").lower() == "true"
+# Fail a call whose request was not recorded, instead of serving the next unused recording
+MODEL_CASSETTE_STRICT = os.getenv("MODEL_CASSETTE_STRICT", "false").lower() == "true"
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Summaries of recorded requests are cut to this length (they only help reading a cassette)
+SUMMARY_CHARS = 160
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when no recorded call is left for a request."""
+
+
+class RecordedModelError(RuntimeError):
+    """Replays a model call that failed while recording."""
+
+
+def _b64decode(data: str) -> bytes:
+    if "-" in data or "_" in data:
+        return base64.urlsafe_b64decode(data)
+    return base64.b64decode(data)
+
+
+def _normalize(value: Any) -> Any:
+    """JSON form of a request for hashing: call IDs and thought signatures vary between runs, image bytes are digested."""
+    if isinstance(value, dict):
+        normalized = {}
+        for key, item in value.items():
+            if key in ("id", "thought_signature"):
+                continue
+            if key == "data" and isinstance(item, str):
+                item = hashlib.sha256(item.encode("ascii")).hexdigest()
+            normalized[key] = _normalize(item)
+        return normalized
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _summary(contents: List[Dict[str, Any]]) -> str:
+    for content in reversed(contents):
+        for part in reversed(content.get("parts", [])):
+            if "text" in part:
+                return part["text"][:SUMMARY_CHARS]
+            for field in ("function_response", "function_call"):
+                if field in part:
+                    return json.dumps(part[field])[:SUMMARY_CHARS]
+    return ""
+
+
+class Cassette:
+    """
+    Records model calls (request digest, response, duration) and serves them back.
+
+    A cassette is a directory with one JSONL file per process role ("agent" for
+    the ADK agent's LLM calls, "mcp" for the MCP server's model calls), `turns.jsonl`
+    with the chat messages that drove the recording, and `blobs/` holding every
+    image once under its SHA-256, so responses stay small and repeated images are
+    stored once.
+
+    In replay mode a call is matched by the digest of its request (the nth call
+    with a digest gets the nth recording of it); calls whose request changed get
+    the next unused recording, unless the cassette is strict.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        mode: str,
+        realtime: bool = MODEL_CASSETTE_REALTIME,
+        strict: bool = MODEL_CASSETTE_STRICT,
+    ):
+        self.directory = directory
+        self.name = name
+        self.mode = mode
+        self.realtime = realtime
+        self.strict = strict
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, tuple] = {}
+        self._records: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, Deque[int]] = {}
+        self._used: List[bool] = []
+        self._cursor = 0
+        self.recorded = 0
+        self.replayed = 0
+        self.fallbacks = 0
+        self.misses = 0
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        if mode == REPLAY:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    # --- Blobs ---
+
+    def put_blob(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, "blobs", digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get_blob(self, digest: str) -> bytes:
+        with open(os.path.join(self.directory, "blobs", digest), "rb") as f:
+            return f.read()
+
+    def _pack(self, value: Any) -> Any:
+        """Moves inline image bytes (base64 in the JSON dump) into blobs."""
+        if isinstance(value, dict):
+            inline = value.get("inline_data")
+            if isinstance(inline, dict) and isinstance(inline.get("data"), str):
+                value = {**value, "inline_data": {**{k: v for k, v in inline.items() if k != "data"}, "blob": self.put_blob(_b64decode(inline["data"]))}}
+            return {key: self._pack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._pack(item) for item in value]
+        return value
+
+    def _unpack(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            inline = value.get("inline_data")
+            if isinstance(inline, dict) and "blob" in inline:
+                data = base64.b64encode(self.get_blob(inline["blob"])).decode("ascii")
+                value = {**value, "inline_data": {**{k: v for k, v in inline.items() if k != "blob"}, "data": data}}
+            return {key: self._unpack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._unpack(item) for item in value]
+        return value
+
+    # --- Recording and lookup ---
+
+    def _append(self, filename: str, entry: Dict[str, Any]):
+        line = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            with open(os.path.join(self.directory, filename), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def record(self, key: str, model: str, seconds: float, response: Optional[Dict[str, Any]] = None, error: Optional[str] = None, summary: str = ""):
+        """
+        Appends one call.
+
+        Args:
+            key: Digest of the request.
+            model: The model that was called.
+            seconds: Duration of the call.
+            response: JSON dump of the response (inline bytes are moved to blobs).
+            error: Message of the exception the call raised instead.
+            summary: Short description of the request, for people reading the cassette.
+        """
+        entry = {"key": key, "model": model, "seconds": round(seconds, 4), "at": time.time(), "summary": summary}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["response"] = self._pack(response)
+        self._append(f"{self.name}.jsonl", entry)
+        with self._lock:
+            self.recorded += 1
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            logger.warning(f"Cassette {self.path} does not exist; every {self.name} model call will miss")
+            return
+        with open(self.path, encoding="utf-8") as f:
+            self._records = [json.loads(line) for line in f if line.strip()]
+        self._used = [False] * len(self._records)
+        for index, entry in enumerate(self._records):
+            self._by_key.setdefault(entry["key"], deque()).append(index)
+        logger.info(f"Loaded {len(self._records)} recorded {self.name} model calls from {self.path}")
+
+    def lookup(self, key: str) -> Dict[str, Any]:
+        """
+        Returns the recording for a request (with its response unpacked).
+
+        Raises:
+            CassetteMiss: If no recording is left for it.
+        """
+        with self._lock:
+            queue = self._by_key.get(key)
+            while queue and self._used[queue[0]]:
+                queue.popleft()
+            if queue:
+                index = queue.popleft()
+            elif self.strict:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded {self.name} model call for request {key}")
+            else:
+                while self._cursor < len(self._records) and self._used[self._cursor]:
+                    self._cursor += 1
+                if self._cursor >= len(self._records):
+                    self.misses += 1
+                    raise CassetteMiss(f"Cassette {self.path} has no {self.name} model calls left")
+                index = self._cursor
+                self.fallbacks += 1
+                logger.warning(f"Request {key} was not recorded; replaying the next {self.name} call ({self._records[index]['summary']!r})")
+            self._used[index] = True
+            self.replayed += 1
+        entry = dict(self._records[index])
+        if "response" in entry:
+            entry["response"] = self._unpack(entry["response"])
+        return entry
+
+    def delay(self, entry: Dict[str, Any]) -> float:
+        """Seconds a replayed call should take."""
+        return entry["seconds"] if self.realtime else 0.0
+
+    def replay(self, key: str) -> Dict[str, Any]:
+        """Blocking lookup for synchronous callers: waits out the recorded duration and re-raises recorded errors."""
+        entry = self.lookup(key)
+        if self.delay(entry):
+            time.sleep(self.delay(entry))
+        if "error" in entry:
+            raise RecordedModelError(entry["error"])
+        return entry["response"]
+
+    def call(self, key: str, model: str, summary: str, send: Callable[[], Any], dump: Callable[[Any], Dict[str, Any]]) -> Any:
+        """Makes a synchronous call and records it (record mode only)."""
+        started = time.perf_counter()
+        try:
+            response = send()
+        except Exception as e:
+            self.record(key, model, time.perf_counter() - started, error=f"{type(e).__name__}: {e}", summary=summary)
+            raise
+        self.record(key, model, time.perf_counter() - started, response=dump(response), summary=summary)
+        return response
+
+    # --- Chat turns ---
+
+    def record_turn(self, message: str, upload_path: Optional[str] = None):
+        """Records a chat message (and its upload) that drove the recorded calls."""
+        entry: Dict[str, Any] = {"message": message, "at": time.time()}
+        if upload_path:
+            with open(upload_path, "rb") as f:
+                entry["upload"] = {"filename": os.path.basename(upload_path), "blob": self.put_blob(f.read())}
+        self._append("turns.jsonl", entry)
+
+    def turns(self) -> List[Dict[str, Any]]:
+        path = os.path.join(self.directory, "turns.jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    # --- ADK agent callbacks ---
+
+    def _request_key(self, llm_request: "LlmRequest") -> tuple:
+        contents = [content.model_dump(mode="json", exclude_none=True) for content in llm_request.contents]
+        canonical = json.dumps({"model": llm_request.model, "contents": _normalize(contents)}, sort_keys=True)
+        # Uploads are referenced by absolute path; keep keys stable across checkouts
+        canonical = canonical.replace(json.dumps(os.getcwd())[1:-1], "<backend>")
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), _summary(contents)
+
+    async def before_model_callback(self, callback_context: "CallbackContext", llm_request: "LlmRequest") -> Optional["LlmResponse"]:
+        """
+        Agent callback; registered first, so the request is keyed before compaction
+        and the context cache rewrite it. Replay returns the recorded response,
+        which skips the model call and the other callbacks.
+        """
+        key, summary = self._request_key(llm_request)
+        if self.recording:
+            self._pending[callback_context.invocation_id] = (key, llm_request.model, summary, time.perf_counter())
+            return None
+        from google.adk.models import LlmResponse
+
+        entry = self.lookup(key)
+        if self.delay(entry):
+            await asyncio.sleep(self.delay(entry))
+        if "error" in entry:
+            raise RecordedModelError(entry["error"])
+        return LlmResponse.model_validate(entry["response"])
+
+    def after_model_callback(self, callback_context: "CallbackContext", llm_response: "LlmResponse") -> Optional["LlmResponse"]:
+        """Agent callback (record mode): stores the response of the request keyed before the call."""
+        if llm_response.partial:
+            return None
+        pending = self._pending.pop(callback_context.invocation_id, None)
+        if pending is not None:
+            key, model, summary, started = pending
+            self.record(key, model, time.perf_counter() - started, response=llm_response.model_dump(mode="json", exclude_none=True), summary=summary)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "realtime": self.realtime,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "fallbacks": self.fallbacks,
+                "misses": self.misses,
+                "remaining": self._used.count(False),
+            }
+
+
+def open_cassette(name: str) -> Optional[Cassette]:
+    """
+    Opens the cassette configured by MODEL_CASSETTE and MODEL_CASSETTE_MODE for one process role.
+
+    Returns:
+        The cassette, or None when recording and replay are off.
+    """
+    if MODEL_CASSETTE_MODE not in (RECORD, REPLAY):
+        if MODEL_CASSETTE_MODE != "off":
+            logger.warning(f"Unknown MODEL_CASSETTE_MODE '{MODEL_CASSETTE_MODE}'. Recording and replay are off.")
+        return None
+    if not MODEL_CASSETTE:
+        logger.warning(f"MODEL_CASSETTE_MODE={MODEL_CASSETTE_MODE} needs MODEL_CASSETTE (a directory). Recording and replay are off.")
+        return None
+    logger.info(f"{MODEL_CASSETTE_MODE.capitalize()}ing {name} model calls with cassette {MODEL_CASSETTE}")
+    return Cassette(MODEL_CASSETTE, name, MODEL_CASSETTE_MODE)
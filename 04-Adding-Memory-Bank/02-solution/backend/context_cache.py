@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+# The ADK and genai SDKs are only needed at call time; keep module import cheap
+if TYPE_CHECKING:
+    from google.adk.agents.callback_context import CallbackContext
+    from google.adk.models import LlmRequest, LlmResponse
+
+logger = logging.getLogger(__name__)
+
+# Cache the agent's system instruction and tool schemas on the model side
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# The TTL is extended when less than this remains
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = int(os.getenv("CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", "300"))
+
+
+def _fingerprint(system_instruction: str, tools, tool_config) -> str:
+    data = {
+        "system_instruction": system_instruction,
+        "tools": [tool.model_dump(exclude_none=True, mode="json") for tool in tools or []],
+        "tool_config": tool_config.model_dump(exclude_none=True, mode="json") if tool_config else None,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class StaticContextCache:
+    """
+    Explicit model-side cache of the agent's static request prefix.
+
+    The system instruction and the tool schemas (local functions and MCP tools) are
+    identical on every LLM call, so they are cached once at startup with
+    `caches.create` and each request references the cache by name instead of
+    resending them. The TTL is extended in the background before it expires.
+
+    Requests whose prefix does not match the cache (e.g. after the tools changed)
+    are sent uncached. Instructions appended per request, such as preloaded
+    memories, are moved into the contents, since a request that uses a cache cannot
+    carry its own system instruction.
+    """
+
+    def __init__(self, ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS, refresh_margin: int = CONTEXT_CACHE_REFRESH_MARGIN_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.cache_name: Optional[str] = None
+        self.expire_time = 0.0
+        self._client = None
+        self._model: Optional[str] = None
+        self._system_instruction: Optional[str] = None
+        self._tools = None
+        self._tool_config = None
+        self._fingerprint: Optional[str] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.cached_requests = 0
+        self.uncached_requests = 0
+        self.prefix_mismatches = 0
+        self.cached_tokens = 0
+        self.uncached_prompt_tokens = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    async def create(self, runner, agent):
+        """
+        Builds the agent's static request prefix exactly as the ADK flow does for an
+        empty session, then caches it on the model side.
+        """
+        from google.adk.agents.run_config import RunConfig
+        from google.adk.models import LlmRequest
+        from google.adk.sessions import Session
+
+        session = Session(id="context-cache", app_name=runner.app_name, user_id="context-cache", state={})
+        ctx = runner._new_invocation_context(session, new_message=None, run_config=RunConfig())
+        llm_request = LlmRequest(model=agent.canonical_model.model)
+        async for _ in agent._llm_flow._preprocess_async(ctx, llm_request):
+            pass
+
+        self._client = agent.canonical_model.api_client
+        self._model = llm_request.model
+        self._system_instruction = llm_request.config.system_instruction or ""
+        self._tools = llm_request.config.tools
+        self._tool_config = llm_request.config.tool_config
+        self._fingerprint = _fingerprint(self._system_instruction, self._tools, self._tool_config)
+        await self._create_cache()
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _create_cache(self):
+        from google.genai import types
+
+        try:
+            cache = await self._client.aio.caches.create(
+                model=self._model,
+                config=types.CreateCachedContentConfig(
+                    display_name="christmas_tree_agent-static",
+                    system_instruction=self._system_instruction,
+                    tools=self._tools,
+                    tool_config=self._tool_config,
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+        except Exception as e:
+            self.cache_name = None
+            self.failures += 1
+            self.last_error = str(e)
+            raise
+        self.cache_name = cache.name
+        self.expire_time = time.time() + self.ttl_seconds
+        tokens = cache.usage_metadata.total_token_count if cache.usage_metadata else None
+        logger.info(f"Created context cache {cache.name} ({tokens} tokens, ttl {self.ttl_seconds}s)")
+
+    async def _refresh_loop(self):
+        from google.genai import types
+
+        while True:
+            await asyncio.sleep(max(1.0, self.expire_time - self.refresh_margin - time.time()))
+            try:
+                if self.cache_name:
+                    await self._client.aio.caches.update(
+                        name=self.cache_name,
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+                    )
+                    self.expire_time = time.time() + self.ttl_seconds
+                    self.refreshes += 1
+                    logger.info(f"Extended context cache {self.cache_name} by {self.ttl_seconds}s")
+                else:
+                    await self._create_cache()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The cache may have been deleted or expired; recreate it on the next round
+                logger.warning(f"Failed to refresh context cache {self.cache_name}: {e}")
+                self.failures += 1
+                self.last_error = str(e)
+                self.cache_name = None
+                self.expire_time = time.time() + self.refresh_margin + 30
+
+    def before_model_callback(self, callback_context: "CallbackContext", llm_request: "LlmRequest") -> Optional["LlmResponse"]:
+        """Replaces the static prefix of the request with a reference to the cache."""
+        from google.genai import types
+
+        config = llm_request.config
+        # Leave a few seconds of slack so the cache cannot expire in flight
+        if not self.cache_name or time.time() >= self.expire_time - 10:
+            self.uncached_requests += 1
+            return None
+        system_instruction = config.system_instruction or ""
+        if (
+            not isinstance(system_instruction, str)
+            or not system_instruction.startswith(self._system_instruction)
+            or _fingerprint(self._system_instruction, config.tools, config.tool_config) != self._fingerprint
+        ):
+            self.prefix_mismatches += 1
+            self.uncached_requests += 1
+            return None
+
+        suffix = system_instruction[len(self._system_instruction):].strip()
+        if suffix:
+            llm_request.contents.insert(0, types.Content(role="user", parts=[types.Part(text=suffix)]))
+        config.system_instruction = None
+        config.tools = None
+        config.tool_config = None
+        config.cached_content = self.cache_name
+        self.cached_requests += 1
+        return None
+
+    def after_model_callback(self, callback_context: "CallbackContext", llm_response: "LlmResponse") -> Optional["LlmResponse"]:
+        """Accounts cached vs. uncached prompt tokens."""
+        usage = llm_response.usage_metadata
+        if usage and usage.prompt_token_count:
+            cached = usage.cached_content_token_count or 0
+            self.cached_tokens += cached
+            self.uncached_prompt_tokens += usage.prompt_token_count - cached
+        return None
+
+    async def close(self):
+        """Stops the refresher and deletes the cache so it does not accrue storage."""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+        if self.cache_name and self._client:
+            try:
+                await self._client.aio.caches.delete(name=self.cache_name)
+                logger.info(f"Deleted context cache {self.cache_name}")
+            except Exception as e:
+                logger.warning(f"Failed to delete context cache {self.cache_name}: {e}")
+            self.cache_name = None
+
+    def stats(self) -> Dict[str, Any]:
+        prompt_tokens = self.cached_tokens + self.uncached_prompt_tokens
+        return {
+            "enabled": CONTEXT_CACHE_ENABLED,
+            "cache_name": self.cache_name,
+            "expires_in_seconds": round(max(0.0, self.expire_time - time.time()), 1) if self.cache_name else 0.0,
+            "cached_requests": self.cached_requests,
+            "uncached_requests": self.uncached_requests,
+            "prefix_mismatches": self.prefix_mismatches,
+            "cached_tokens": self.cached_tokens,
+            "uncached_prompt_tokens": self.uncached_prompt_tokens,
+            "cached_token_ratio": round(self.cached_tokens / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
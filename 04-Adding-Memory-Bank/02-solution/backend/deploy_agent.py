@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 import logging
 from dotenv import load_dotenv
 import vertexai
@@ -17,9 +19,8 @@ load_dotenv()
 PROJECT_ID = os.getenv("PROJECT_ID")
 LOCATION = os.getenv("LOCATION", "us-central1")
 AGENT_DISPLAY_NAME = "christmas_tree_agent_engine_custom"
-
-if not PROJECT_ID:
-    raise ValueError("PROJECT_ID not found in environment variables.")
+# Label on the engine that records which memory bank configuration it was provisioned with
+CONFIG_HASH_LABEL = "memory_config_hash"
 
 # Basic configuration types
 MemoryBankConfig = types.ReasoningEngineContextSpecMemoryBankConfig
@@ -45,15 +46,10 @@ ExampleGeneratedMemory = (
 Content = genai_types.Content
 Part = genai_types.Part
 
-def register_agent_engine():
+def build_customization_config():
     """
-    Registers an Agent Engine resource in Vertex AI to enable Sessions and Memory Bank.
-    This does NOT deploy the agent code to the cloud.
+    Builds the Memory Bank customization config (custom topics and few-shot examples).
     """
-    logger.info(f"Initializing Vertex AI for project: {PROJECT_ID}, location: {LOCATION}")
-    vertexai.init(project=PROJECT_ID, location=LOCATION)
-    client = vertexai.Client(project=PROJECT_ID, location=LOCATION)
-
     # --- Define Custom Topics ---
     logger.info("Defining custom topics...")
     
@@ -160,33 +156,91 @@ def register_agent_engine():
     ]
 
     # --- Create Customization Config ---
-    customization_config = CustomizationConfig(
+    return CustomizationConfig(
         memory_topics=custom_topics,
         generate_memories_examples=few_shot_examples
     )
 
-    logger.info(f"Creating/Registering Agent Engine: {AGENT_DISPLAY_NAME}")
-    
-    # Create Agent Engine with Memory Bank configuration
-    agent_engine = client.agent_engines.create(
-        config={
-            "display_name": AGENT_DISPLAY_NAME,
-            "context_spec": {
-                "memory_bank_config": {
-                    "generation_config": {
-                        "model": f"projects/{PROJECT_ID}/locations/{LOCATION}/publishers/google/models/gemini-2.5-flash"
-                    },
-                    "customization_configs": [customization_config]
-                }
-            },
-        }
-    )
+def memory_bank_config_hash(generation_model: str, customization_config) -> str:
+    """
+    Returns a stable hash of the Memory Bank configuration (model, topics and few-shot examples).
+    Truncated so it fits in a resource label value.
+    """
+    payload = {
+        "generation_model": generation_model,
+        "customization_config": customization_config.model_dump(mode="json", exclude_none=True),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:40]
+
+def find_agent_engine(client, display_name: str):
+    """
+    Returns the existing Agent Engine with the given display name, or None.
+    """
+    for agent_engine in client.agent_engines.list(config={"filter": f'display_name="{display_name}"'}):
+        if agent_engine.api_resource.display_name == display_name:
+            return agent_engine
+    return None
+
+def register_agent_engine(client=None) -> str:
+    """
+    Registers an Agent Engine resource in Vertex AI to enable Sessions and Memory Bank.
+    This does NOT deploy the agent code to the cloud.
+
+    Reruns are idempotent: an engine with the same display name is reused, and it is only
+    updated in place when the Memory Bank configuration hash changed.
+
+    Args:
+        client: Optional `vertexai.Client` (or a fake exposing `agent_engines.list/create/update`).
+
+    Returns:
+        The Agent Engine ID.
+    """
+    if client is None:
+        if not PROJECT_ID:
+            raise ValueError("PROJECT_ID not found in environment variables.")
+        logger.info(f"Initializing Vertex AI for project: {PROJECT_ID}, location: {LOCATION}")
+        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        client = vertexai.Client(project=PROJECT_ID, location=LOCATION)
+
+    customization_config = build_customization_config()
+    generation_model = f"projects/{PROJECT_ID}/locations/{LOCATION}/publishers/google/models/gemini-2.5-flash"
+    config_hash = memory_bank_config_hash(generation_model, customization_config)
+
+    engine_config = {
+        "display_name": AGENT_DISPLAY_NAME,
+        "labels": {CONFIG_HASH_LABEL: config_hash},
+        "context_spec": {
+            "memory_bank_config": {
+                "generation_config": {
+                    "model": generation_model
+                },
+                "customization_configs": [customization_config]
+            }
+        },
+    }
+
+    existing = find_agent_engine(client, AGENT_DISPLAY_NAME)
+    if existing is None:
+        logger.info(f"Creating/Registering Agent Engine: {AGENT_DISPLAY_NAME}")
+        # Create Agent Engine with Memory Bank configuration
+        agent_engine = client.agent_engines.create(config=engine_config)
+        logger.info("✅ Agent Engine Registered Successfully!")
+    else:
+        labels = existing.api_resource.labels or {}
+        if labels.get(CONFIG_HASH_LABEL) == config_hash:
+            logger.info(f"✅ Agent Engine {AGENT_DISPLAY_NAME} is already up to date.")
+            agent_engine = existing
+        else:
+            logger.info(f"Memory Bank configuration changed. Updating Agent Engine {AGENT_DISPLAY_NAME} in place...")
+            agent_engine = client.agent_engines.update(name=existing.api_resource.name, config=engine_config)
+            logger.info("✅ Agent Engine Updated Successfully!")
 
     agent_engine_id = agent_engine.api_resource.name.split("/")[-1]
-    logger.info("✅ Agent Engine Registered Successfully!")
     logger.info(f"Agent Engine ID: {agent_engine_id}")
     logger.info("\nIMPORTANT: Add the following line to your backend/.env file:")
     logger.info(f"AGENT_ENGINE_ID={agent_engine_id}")
+    return agent_engine_id
 
 if __name__ == "__main__":
     try:
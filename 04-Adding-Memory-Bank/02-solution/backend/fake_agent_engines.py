@@ -0,0 +1,82 @@
+"""
+In-memory fake of the Vertex AI Agent Engines API, and a check of deploy_agent.py against it.
+
+    python fake_agent_engines.py
+
+The check registers the engine three times without network access or credentials:
+the first run creates it, a rerun with the same Memory Bank configuration leaves it
+alone, and a rerun after the configuration changed updates it in place.
+"""
+import itertools
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+class FakeAgentEngines:
+    """Mimics the subset of `vertexai.Client.agent_engines` used by deploy_agent.py."""
+
+    def __init__(self):
+        self.engines: Dict[str, SimpleNamespace] = {}
+        self.calls: List[str] = []
+        self._ids = itertools.count(1)
+
+    def list(self, config: Optional[Dict[str, Any]] = None) -> List[SimpleNamespace]:
+        self.calls.append("list")
+        engines = list(self.engines.values())
+        # Supports the only filter deploy_agent.py sends: display_name="<name>"
+        flt = (config or {}).get("filter", "")
+        if flt.startswith("display_name="):
+            display_name = flt[len("display_name="):].strip('"')
+            engines = [e for e in engines if e.api_resource.display_name == display_name]
+        return engines
+
+    def create(self, config: Dict[str, Any]) -> SimpleNamespace:
+        self.calls.append("create")
+        name = f"projects/fake/locations/us-central1/reasoningEngines/{next(self._ids)}"
+        engine = SimpleNamespace(api_resource=SimpleNamespace(name=name, display_name=config["display_name"], labels=dict(config.get("labels") or {})))
+        self.engines[name] = engine
+        return engine
+
+    def update(self, name: str, config: Dict[str, Any]) -> SimpleNamespace:
+        self.calls.append("update")
+        engine = self.engines[name]
+        engine.api_resource.labels = dict(config.get("labels") or {})
+        return engine
+
+
+class FakeClient:
+    """Stand-in for `vertexai.Client` to pass to `register_agent_engine(client=...)`."""
+
+    def __init__(self):
+        self.agent_engines = FakeAgentEngines()
+
+
+def check():
+    from deploy_agent import CONFIG_HASH_LABEL, register_agent_engine
+
+    client = FakeClient()
+    engines = client.agent_engines
+
+    engine_id = register_agent_engine(client)
+    assert engines.calls == ["list", "create"], engines.calls
+    print(f"create: registered engine {engine_id}")
+
+    engines.calls.clear()
+    assert register_agent_engine(client) == engine_id
+    assert engines.calls == ["list"], engines.calls
+    print("unchanged config: no create or update")
+
+    # The engine was provisioned with another Memory Bank configuration
+    engine = next(iter(engines.engines.values()))
+    current_hash = engine.api_resource.labels[CONFIG_HASH_LABEL]
+    engine.api_resource.labels[CONFIG_HASH_LABEL] = "outdated"
+    engines.calls.clear()
+    assert register_agent_engine(client) == engine_id
+    assert engines.calls == ["list", "update"], engines.calls
+    assert engine.api_resource.labels[CONFIG_HASH_LABEL] == current_hash
+    assert len(engines.engines) == 1
+    print("changed config: updated in place")
+
+
+if __name__ == "__main__":
+    check()
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
+
+# The ADK and genai SDKs are only needed at call time; keep module import cheap
+if TYPE_CHECKING:
+    from google.adk.agents.callback_context import CallbackContext
+    from google.adk.models import LlmRequest, LlmResponse
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# Compaction kicks in once the replayed history is estimated above this many tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+# Most recent history (in tokens) that is always replayed verbatim
+HISTORY_KEEP_RECENT_TOKENS = int(os.getenv("HISTORY_KEEP_RECENT_TOKENS", "3000"))
+# Sessions whose compaction is kept in memory; the least recently used are dropped (and recompacted if they return)
+HISTORY_MAX_COMPACTED_SESSIONS = int(os.getenv("HISTORY_MAX_COMPACTED_SESSIONS", "256"))
+
+# Rough cost of an inline image part in the prompt
+IMAGE_PART_TOKENS = 258
+SUMMARY_SNIPPET_CHARS = 160
+# Number of earlier requests and tool calls listed in a summary
+SUMMARY_MAX_ITEMS = 10
+UPLOAD_NOTE_MARKER = "[System: User uploaded an image."
+
+
+def estimate_part_tokens(part: "types.Part") -> int:
+    """Cheap token estimate (~4 characters per token) for a single content part."""
+    if part.text:
+        return len(part.text) // 4 + 1
+    if part.function_call:
+        return len(json.dumps(part.function_call.args or {}, default=str)) // 4 + 8
+    if part.function_response:
+        return len(json.dumps(part.function_response.response or {}, default=str)) // 4 + 8
+    if part.inline_data:
+        return IMAGE_PART_TOKENS
+    return 1
+
+
+def estimate_content_tokens(content: Optional["types.Content"]) -> int:
+    if not content or not content.parts:
+        return 0
+    return sum(estimate_part_tokens(part) for part in content.parts)
+
+
+def _is_turn_start(content: "types.Content") -> bool:
+    """A content where replay can safely resume: user text, no pending function response."""
+    return content.role == "user" and not any(p.function_response for p in content.parts or [])
+
+
+@dataclass
+class Compaction:
+    summary: str
+    kept_events: int
+    cutoff_timestamp: float
+    # First content replayed verbatim, and how many identical contents follow the cutoff;
+    # the request contents are cut at the matching occurrence (they are not 1:1 with events)
+    boundary: "types.Content"
+    boundary_occurrences: int
+
+
+class HistoryCompactor:
+    """
+    Bounds the prompt replayed to the model for long sessions.
+
+    Between turns, `schedule` summarizes session events older than the most recent
+    `keep_recent_tokens` once the history exceeds `token_budget`. Before each model
+    call, `before_model_callback` replaces the covered contents with that summary.
+    The latest uploads, generated artifacts and tree settings are carried verbatim.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        keep_recent_tokens: int = HISTORY_KEEP_RECENT_TOKENS,
+        facts_provider: Optional[Callable[[], Dict[str, Any]]] = None,
+        max_sessions: int = HISTORY_MAX_COMPACTED_SESSIONS,
+    ):
+        self.token_budget = token_budget
+        self.keep_recent_tokens = keep_recent_tokens
+        self.facts_provider = facts_provider
+        self.max_sessions = max_sessions
+        self._compactions: "OrderedDict[str, Compaction]" = OrderedDict()
+        self._tasks = set()
+        self.compactions = 0
+        self.tokens_saved = 0
+
+    def schedule(self, session_service, app_name: str, user_id: str, session_id: str):
+        """Compacts the session in the background so the current response is not delayed."""
+        task = asyncio.create_task(self._compact_session(session_service, app_name, user_id, session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compact_session(self, session_service, app_name: str, user_id: str, session_id: str):
+        try:
+            session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            if session:
+                self.compact(session)
+        except Exception as e:
+            logger.warning(f"History compaction failed for session {session_id}: {e}")
+
+    def compact(self, session) -> Optional[Compaction]:
+        events = [e for e in session.events if e.content and e.content.parts and not e.partial]
+        total = sum(estimate_content_tokens(e.content) for e in events)
+        if total <= self.token_budget:
+            self._compactions.pop(session.id, None)
+            return None
+
+        # Walk back from the newest event until the verbatim window is full,
+        # then further back to a turn boundary so tool calls stay paired.
+        kept_tokens = 0
+        cut = len(events)
+        while cut > 0 and kept_tokens < self.keep_recent_tokens:
+            cut -= 1
+            kept_tokens += estimate_content_tokens(events[cut].content)
+        while cut > 0 and not _is_turn_start(events[cut].content):
+            cut -= 1
+        if cut == 0:
+            # Nothing to fold away; an older compaction would hide turns
+            self._compactions.pop(session.id, None)
+            return None
+
+        boundary = events[cut].content
+        compaction = Compaction(
+            summary=self._summarize(events[:cut]),
+            kept_events=len(events) - cut,
+            cutoff_timestamp=events[cut].timestamp,
+            boundary=boundary.model_copy(deep=True),
+            boundary_occurrences=sum(1 for e in events[cut:] if e.content == boundary),
+        )
+        self._compactions[session.id] = compaction
+        self._compactions.move_to_end(session.id)
+        while len(self._compactions) > self.max_sessions:
+            self._compactions.popitem(last=False)
+        self.compactions += 1
+        logger.info(
+            f"Compacted session {session.id}: {cut} events summarized, "
+            f"{compaction.kept_events} kept verbatim (~{total} tokens before)"
+        )
+        return compaction
+
+    def _summarize(self, events: List[Any]) -> str:
+        requests = []
+        tool_calls = []
+        latest_upload = None
+        latest_artifacts: Dict[str, str] = {}
+        latest_tree_updates: Dict[str, str] = {}
+
+        for event in events:
+            for part in event.content.parts:
+                if part.text and event.content.role == "user":
+                    text = part.text
+                    if UPLOAD_NOTE_MARKER in text:
+                        latest_upload = text[text.index(UPLOAD_NOTE_MARKER):]
+                        text = text[:text.index(UPLOAD_NOTE_MARKER)]
+                    if text.strip():
+                        requests.append(text.strip()[:SUMMARY_SNIPPET_CHARS])
+                elif part.function_call:
+                    args = json.dumps(part.function_call.args or {}, default=str)
+                    tool_calls.append(f"{part.function_call.name}({args[:SUMMARY_SNIPPET_CHARS]})")
+                elif part.function_response:
+                    name = part.function_response.name or ""
+                    response = json.dumps(part.function_response.response or {}, default=str)
+                    if name.startswith("generate_"):
+                        latest_artifacts[name] = response
+                    elif name == "update_tree_config":
+                        latest_tree_updates[name] = response
+
+        lines = [f"[Summary of {len(events)} earlier conversation events]"]
+        if requests:
+            lines.append("Earlier user requests:")
+            lines.extend(f"- {r}" for r in requests[-SUMMARY_MAX_ITEMS:])
+        if tool_calls:
+            lines.append("Earlier tool calls:")
+            lines.extend(f"- {c}" for c in tool_calls[-SUMMARY_MAX_ITEMS:])
+        if latest_upload:
+            lines.append(f"Latest upload: {latest_upload}")
+        for name, response in latest_artifacts.items():
+            lines.append(f"Latest {name} result: {response}")
+        for name, response in latest_tree_updates.items():
+            lines.append(f"Latest {name} result: {response}")
+        if self.facts_provider:
+            lines.append(f"Current tree state: {json.dumps(self.facts_provider())}")
+        return "\n".join(lines)
+
+    def before_model_callback(self, callback_context: "CallbackContext", llm_request: "LlmRequest") -> Optional["LlmResponse"]:
+        """Swaps the summarized prefix of the request history for the compaction summary."""
+        from google.genai import types
+
+        session = callback_context._invocation_context.session
+        compaction = self._compactions.get(session.id)
+        if not compaction:
+            return None
+        self._compactions.move_to_end(session.id)
+
+        # Everything from the first kept content on (including this turn) stays verbatim
+        contents = llm_request.contents
+        matches = [i for i, content in enumerate(contents) if content == compaction.boundary]
+        if len(matches) < compaction.boundary_occurrences:
+            return None
+        start = matches[len(matches) - compaction.boundary_occurrences]
+        if start == 0:
+            return None
+
+        dropped = contents[:start]
+        summary = types.Content(role="user", parts=[types.Part(text=compaction.summary)])
+        saved = sum(estimate_content_tokens(c) for c in dropped) - estimate_content_tokens(summary)
+        if saved <= 0:
+            return None
+        llm_request.contents = [summary] + contents[start:]
+        self.tokens_saved += saved
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "compacted_sessions": len(self._compactions),
+            "compactions": self.compactions,
+            "tokens_saved": self.tokens_saved,
+            "pending_tasks": len(self._tasks),
+        }
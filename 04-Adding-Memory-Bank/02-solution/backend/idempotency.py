@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long the result of a completed request is returned for repeats of its key
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+# How long a duplicate waits for the original request when that runs in another worker
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "300"))
+IDEMPOTENCY_POLL_INTERVAL_SECONDS = 0.5
+# A claim without a request entry after this long belongs to a worker that died right after claiming
+IDEMPOTENCY_STALE_CLAIM_SECONDS = 5.0
+# Lease of a running request, renewed every third of it; a repeat takes over a request whose lease lapsed
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+# Retry-After suggested to a repeat that gave up waiting for a still running original
+IDEMPOTENCY_RETRY_AFTER_SECONDS = 5
+
+RUNNING = "running"
+DONE = "done"
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+class IdempotencyTimeout(TimeoutError):
+    """Another worker was still running the key when the wait expired."""
+
+
+def request_fingerprint(*parts: Any) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Runs each idempotency key at most once and replays its result.
+
+    A repeat of a key that is still running attaches to the original request (in
+    this process via its future, in other workers by polling the shared state
+    store); a repeat of a completed key gets the stored result until the TTL
+    expires. Only successful results are kept, so a failed request can be retried
+    with the same key. The first worker to claim a key (an atomic counter in the
+    state store) runs it, and renews a lease on the running entry until it is
+    done; a running entry whose lease lapsed belongs to a worker that died.
+    """
+
+    def __init__(self, state_store, namespace: str, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.state_store = state_store
+        self.namespace = namespace
+        self.ttl = ttl
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.executed = 0
+        self.attached = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.expired = 0
+
+    def _forget(self, key: str):
+        self.state_store.delete(self.namespace, key)
+        self.state_store.delete(self.namespace, f"claim:{key}")
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.state_store.get(self.namespace, key)
+        if entry is None:
+            return None
+        if entry["status"] == DONE and entry["expires_at"] < time.time():
+            self.expired += 1
+            self._forget(key)
+            return None
+        if entry["status"] == RUNNING and entry.get("lease_expires_at", 0) < time.time():
+            # The worker running it died or hung; let this request take over
+            self._forget(key)
+            return None
+        return entry
+
+    async def run(self, key: str, fingerprint: str, func: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Runs `func` once per key.
+
+        Args:
+            key: The client's idempotency key (scoped by the caller, e.g. per user).
+            fingerprint: Digest of the request; a repeat with another fingerprint is a conflict.
+            func: Produces the JSON-serializable result.
+
+        Returns:
+            (result, replayed): replayed is True if the result came from an earlier request.
+
+        Raises:
+            IdempotencyConflict: If the key was used for a different request.
+            IdempotencyTimeout: If another worker still runs the key after IDEMPOTENCY_WAIT_SECONDS.
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(key)
+            self.attached += 1
+            return await asyncio.shield(inflight[1]), True
+
+        started = time.monotonic()
+        waiting = False
+        while True:
+            entry = self._lookup(key)
+            if entry is not None and entry["fingerprint"] != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(key)
+            if entry is not None and entry["status"] == DONE:
+                self.replayed += 1
+                return entry["result"], True
+            if entry is None and self.state_store.incr(self.namespace, f"claim:{key}") == 1:
+                break
+            # Claimed by another worker: wait for its result
+            waited = time.monotonic() - started
+            if waited >= IDEMPOTENCY_WAIT_SECONDS:
+                raise IdempotencyTimeout(f"Request with idempotency key {key} is still running")
+            if entry is None and waited >= IDEMPOTENCY_STALE_CLAIM_SECONDS:
+                self._forget(key)
+            if not waiting:
+                waiting = True
+                self.attached += 1
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL_SECONDS)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        started_at = time.time()
+        self._renew(key, fingerprint, started_at)
+        heartbeat = asyncio.create_task(self._heartbeat(key, fingerprint, started_at))
+        try:
+            result = await func()
+        except BaseException as e:
+            heartbeat.cancel()
+            self._forget(key)
+            if isinstance(e, Exception):
+                future.set_exception(e)
+            else:
+                future.cancel()
+            if not future.cancelled():
+                # Retrieve it, so an exception without attached waiters is not reported as unhandled
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        heartbeat.cancel()
+        self.executed += 1
+        self.state_store.set(self.namespace, key, {"status": DONE, "fingerprint": fingerprint, "result": result, "expires_at": time.time() + self.ttl})
+        future.set_result(result)
+        if self.executed % 100 == 0:
+            self.prune()
+        return result, False
+
+    def _renew(self, key: str, fingerprint: str, started_at: float):
+        self.state_store.set(
+            self.namespace,
+            key,
+            {"status": RUNNING, "fingerprint": fingerprint, "started_at": started_at, "lease_expires_at": time.time() + IDEMPOTENCY_LEASE_SECONDS},
+        )
+
+    async def _heartbeat(self, key: str, fingerprint: str, started_at: float):
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+            try:
+                self._renew(key, fingerprint, started_at)
+            except Exception as e:
+                logger.warning(f"Failed to renew the lease of idempotency key {key}: {e}")
+
+    def prune(self) -> int:
+        """Deletes expired results (results of keys that are never repeated are not seen by lookups)."""
+        now = time.time()
+        expired = [
+            key for key, entry in self.state_store.get_all(self.namespace).items()
+            if isinstance(entry, dict) and entry.get("status") == DONE and entry["expires_at"] < now
+        ]
+        for key in expired:
+            self._forget(key)
+        self.expired += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_seconds": self.ttl,
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "attached": self.attached,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+            "expired": self.expired,
+        }
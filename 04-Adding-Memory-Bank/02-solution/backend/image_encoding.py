@@ -0,0 +1,245 @@
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = "static"
+# Write a delivery copy next to each PNG master
+IMAGE_DELIVERY_COPIES = os.getenv("IMAGE_DELIVERY_COPIES", "true").lower() == "true"
+# JSON overrides of the policies below, e.g. '{"generated_final_photo": {"format": "AVIF", "quality": 55}}'
+IMAGE_ENCODING_POLICY = os.getenv("IMAGE_ENCODING_POLICY", "")
+# Background encoder threads
+IMAGE_ENCODING_WORKERS = int(os.getenv("IMAGE_ENCODING_WORKERS", "1"))
+
+EXTENSIONS = {"WEBP": ".webp", "AVIF": ".avif", "JPEG": ".jpg", "PNG": ".png"}
+
+
+@dataclass
+class EncodingPolicy:
+    format: str = "WEBP"
+    quality: int = 85
+    lossless: bool = False
+    progressive: bool = False
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.format]
+
+    def save_kwargs(self) -> Dict[str, Any]:
+        if self.format == "JPEG":
+            return {"quality": self.quality, "optimize": True, "progressive": self.progressive}
+        if self.format == "WEBP":
+            return {"lossless": True, "quality": 100, "method": 4} if self.lossless else {"quality": self.quality, "method": 4}
+        if self.format == "AVIF":
+            return {"quality": 100 if self.lossless else self.quality}
+        return {"optimize": True}
+
+
+# Delivery encoding per generated output (path under static/ without extension).
+# The pattern is a tiling texture, where lossy artifacts show at the seams; photos are lossy.
+ENCODING_POLICIES: Dict[str, EncodingPolicy] = {
+    "generated_pattern": EncodingPolicy("WEBP", lossless=True),
+    "generated_scene": EncodingPolicy("WEBP", quality=82),
+    "generated_selfie": EncodingPolicy("WEBP", quality=85),
+    "generated_final_photo": EncodingPolicy("JPEG", quality=85, progressive=True),
+    "generated_contact_sheet": EncodingPolicy("JPEG", quality=80, progressive=True),
+    "variants/pattern_*": EncodingPolicy("WEBP", lossless=True),
+    "variants/scene_*": EncodingPolicy("WEBP", quality=80),
+}
+
+if IMAGE_ENCODING_POLICY:
+    for _name, _overrides in json.loads(IMAGE_ENCODING_POLICY).items():
+        _overrides["format"] = _overrides.get("format", "WEBP").upper()
+        ENCODING_POLICIES[_name] = EncodingPolicy(**_overrides)
+
+
+def policy_for(filename: str) -> Optional[EncodingPolicy]:
+    """
+    Returns the delivery policy of a generated image.
+
+    Args:
+        filename: Path of the master relative to static/ (e.g. "generated_scene.png").
+
+    Returns:
+        The policy, or None if the image is only kept as its master.
+    """
+    stem = os.path.splitext(filename)[0]
+    for pattern, policy in ENCODING_POLICIES.items():
+        if fnmatch.fnmatch(stem, pattern):
+            return policy
+    return None
+
+
+def delivery_filename(filename: str) -> str:
+    policy = policy_for(filename)
+    if policy is None or policy.extension == os.path.splitext(filename)[1]:
+        return filename
+    return os.path.splitext(filename)[0] + policy.extension
+
+
+def resolve_delivery(filename: str, static_dir: str = STATIC_DIR) -> str:
+    """Returns the delivery copy of a master when it is up to date, otherwise the master itself."""
+    delivery = delivery_filename(filename)
+    if delivery == filename:
+        return filename
+    try:
+        if os.path.getmtime(os.path.join(static_dir, delivery)) >= os.path.getmtime(os.path.join(static_dir, filename)):
+            return delivery
+    except OSError:
+        pass
+    return filename
+
+
+# Image formats of model outputs by MIME type, and of masters by file extension
+MIME_FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP", "image/avif": "AVIF"}
+FILE_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP", ".avif": "AVIF"}
+
+# Counters of write_image_bytes: bytes written as-is vs decoded and re-encoded
+WRITE_STATS = {"direct_writes": 0, "transcodes": 0}
+_write_stats_lock = threading.Lock()
+
+
+def temp_path(path: str) -> str:
+    """Temporary name for writing `path`, unique per process and thread so concurrent writers never share it."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_image_bytes(data: bytes, mime_type: Optional[str], output_path: str) -> bool:
+    """
+    Persists encoded image bytes returned by the model.
+
+    When the MIME type already matches the format of `output_path`, the bytes are
+    written as-is without decoding; otherwise they are decoded and transcoded.
+    The file is replaced atomically, so concurrent readers see the old or the new image.
+
+    Args:
+        data: The encoded image (e.g. `inline_data.data`).
+        mime_type: MIME type of `data` (e.g. "image/png").
+        output_path: Destination; its extension selects the target format.
+
+    Returns:
+        True if the image had to be transcoded.
+    """
+    target = FILE_FORMATS.get(os.path.splitext(output_path)[1].lower(), "PNG")
+    tmp_path = temp_path(output_path)
+    transcoded = MIME_FORMATS.get((mime_type or "").lower()) != target
+    try:
+        if transcoded:
+            import io
+            from PIL import Image
+
+            with Image.open(io.BytesIO(data)) as image:
+                if target == "JPEG" and image.mode != "RGB":
+                    image = image.convert("RGB")
+                image.save(tmp_path, format=target)
+        else:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    with _write_stats_lock:
+        WRITE_STATS["transcodes" if transcoded else "direct_writes"] += 1
+    return transcoded
+
+
+class DeliveryEncoder:
+    """
+    Encodes delivery copies of PNG masters in background threads.
+
+    The master stays at its known path (later generation steps read it); the smaller
+    copy is what the frontend loads. Files are written to a temporary name and
+    renamed, so readers never see a partial image. `on_encoded(master_path)` is
+    called after each delivery copy is written.
+    """
+
+    def __init__(self, workers: int = IMAGE_ENCODING_WORKERS, static_dir: str = STATIC_DIR, on_encoded: Optional[Callable[[str], None]] = None):
+        self.static_dir = static_dir
+        self.on_encoded = on_encoded
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-encoder")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.encoded = 0
+        self.failures = 0
+        self.not_smaller = 0
+        self.master_bytes = 0
+        self.delivery_bytes = 0
+        self.encode_seconds = 0.0
+
+    def submit(self, master_path: str) -> Optional[Future]:
+        filename = os.path.relpath(master_path, self.static_dir)
+        policy = policy_for(filename)
+        if not IMAGE_DELIVERY_COPIES or policy is None or delivery_filename(filename) == filename:
+            return None
+        with self._lock:
+            self.pending += 1
+        return self._executor.submit(self._encode, master_path, policy)
+
+    def _encode(self, master_path: str, policy: EncodingPolicy):
+        from PIL import Image
+
+        started = time.perf_counter()
+        output_path = os.path.join(self.static_dir, delivery_filename(os.path.relpath(master_path, self.static_dir)))
+        # Encodes of the same master can overlap on the pool
+        tmp_path = temp_path(output_path)
+        try:
+            with Image.open(master_path) as image:
+                image.load()
+                if policy.format == "JPEG" and image.mode != "RGB":
+                    image = image.convert("RGB")
+                image.save(tmp_path, format=policy.format, **policy.save_kwargs())
+            master_size = os.path.getsize(master_path)
+            delivery_size = os.path.getsize(tmp_path)
+            if delivery_size >= master_size:
+                # Flat or synthetic images can compress better as PNG; keep serving the master
+                os.remove(tmp_path)
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                with self._lock:
+                    self.not_smaller += 1
+                logger.info(f"Skipped delivery copy of {master_path}: {delivery_size} >= {master_size} bytes")
+                return
+            os.replace(tmp_path, output_path)
+            with self._lock:
+                self.encoded += 1
+                self.master_bytes += master_size
+                self.delivery_bytes += delivery_size
+                self.encode_seconds += time.perf_counter() - started
+            logger.info(
+                f"Encoded {output_path} as {policy.format}: {master_size} -> {delivery_size} bytes "
+                f"in {time.perf_counter() - started:.3f}s"
+            )
+            if self.on_encoded is not None:
+                self.on_encoded(master_path)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logger.error(f"Failed to encode delivery copy of {master_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "encoded": self.encoded,
+                "failures": self.failures,
+                "not_smaller": self.not_smaller,
+                "master_bytes": self.master_bytes,
+                "delivery_bytes": self.delivery_bytes,
+                "bytes_saved": self.master_bytes - self.delivery_bytes,
+                "saved_ratio": round(1 - self.delivery_bytes / self.master_bytes, 4) if self.master_bytes else 0.0,
+                "encode_seconds": round(self.encode_seconds, 3),
+            }
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# Memory budget of the prepared image parts kept for chained generation steps
+IMAGE_PART_CACHE_BYTES = int(os.getenv("IMAGE_PART_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Leading bytes of the encoded formats the model accepts as-is
+MAGIC_MIME_TYPES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+]
+
+
+def sniff_mime_type(data: bytes) -> Optional[str]:
+    for magic, mime_type in MAGIC_MIME_TYPES:
+        if data.startswith(magic):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _stat_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class PreparedPartCache:
+    """
+    LRU of image request parts, bounded by their encoded size.
+
+    Parts are keyed by content hash, and each path remembers the hash and the
+    (mtime, size) of the file it was prepared from. A file that is unchanged since
+    it was written or read is served without touching the disk; a changed file is
+    read once and only wrapped into a new part if its content is new. Files written
+    by this process are added with `put`, so the next generation step that reads
+    them skips both the disk read and the re-encode.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_PART_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # content hash -> prepared part
+        self._parts: "OrderedDict[str, types.Part]" = OrderedDict()
+        # path -> (stat signature, content hash)
+        self._paths: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.content_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _digest(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def _insert(self, digest: str, part: "types.Part"):
+        if digest in self._parts:
+            self._parts.move_to_end(digest)
+            return
+        self._parts[digest] = part
+        self.bytes += len(part.inline_data.data)
+        while self.bytes > self.max_bytes and len(self._parts) > 1:
+            _, evicted = self._parts.popitem(last=False)
+            self.bytes -= len(evicted.inline_data.data)
+            self.evictions += 1
+
+    def put(self, path: str, data: bytes, mime_type: str):
+        """Registers bytes just written to `path`."""
+        path = os.path.abspath(path)
+        signature = _stat_signature(path)
+        digest = self._digest(data)
+        with self._lock:
+            self._insert(digest, types.Part.from_bytes(data=data, mime_type=mime_type))
+            if signature:
+                self._paths[path] = (signature, digest)
+
+    def get(self, path: str) -> "types.Part":
+        """
+        Returns a request part for the image at `path`.
+
+        Args:
+            path: Image file to attach to a model request.
+
+        Returns:
+            An inline-data part with the image's encoded bytes.
+        """
+        path = os.path.abspath(path)
+        signature = _stat_signature(path)
+        with self._lock:
+            known = self._paths.get(path)
+            if known and known[0] == signature and known[1] in self._parts:
+                self.hits += 1
+                self._parts.move_to_end(known[1])
+                return self._parts[known[1]]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = self._digest(data)
+        with self._lock:
+            self._paths[path] = (signature, digest)
+            if digest in self._parts:
+                self.content_hits += 1
+                self._parts.move_to_end(digest)
+                return self._parts[digest]
+            self.misses += 1
+
+        mime_type = sniff_mime_type(data)
+        if mime_type is None:
+            # Formats the model does not take directly (e.g. BMP, TIFF) are converted to PNG once
+            from PIL import Image
+
+            with Image.open(io.BytesIO(data)) as image:
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+            data, mime_type = buffer.getvalue(), "image/png"
+        part = types.Part.from_bytes(data=data, mime_type=mime_type)
+        with self._lock:
+            self._insert(digest, part)
+        return part
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.content_hits + self.misses
+            return {
+                "entries": len(self._parts),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "content_hits": self.content_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.content_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
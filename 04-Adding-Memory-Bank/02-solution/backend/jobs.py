@@ -0,0 +1,387 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from image_encoding import resolve_delivery
+from usage import image_filenames
+
+logger = logging.getLogger(__name__)
+
+# SQLite file holding the job table (shared by all workers on the host)
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+# Concurrent jobs per backend process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# How often idle workers and long-polls re-check the table for jobs of other processes
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "0.5"))
+# Upper bound for the long-poll wait of GET /api/jobs/{id}
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))
+# A running job's lease; its worker renews it every third of this, and a job whose
+# lease lapsed (its process died or hung) is taken over by another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = {SUCCEEDED, FAILED}
+
+
+def normalize_steps(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Validates job steps, each `{"tool": <MCP tool name>, "arguments": {...}}`.
+
+    Raises:
+        ValueError: If the steps are empty or malformed.
+    """
+    if not steps:
+        raise ValueError("A job needs at least one step.")
+    normalized = []
+    for step in steps:
+        if not isinstance(step, dict) or not isinstance(step.get("tool"), str):
+            raise ValueError(f"Invalid job step {step!r}: expected {{'tool': str, 'arguments': dict}}.")
+        arguments = step.get("arguments") or {}
+        if not isinstance(arguments, dict):
+            raise ValueError(f"Arguments of step '{step['tool']}' must be an object.")
+        normalized.append({"tool": step["tool"], "arguments": arguments})
+    return normalized
+
+
+def unknown_tools(steps: List[Any], tool_names: List[str]) -> List[Any]:
+    """Tool names of the steps that are not among `tool_names` (the MCP server's tools)."""
+    return [step.get("tool") for step in steps if isinstance(step, dict) and step.get("tool") not in tool_names]
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """
+    Persistent job table in SQLite (WAL mode).
+
+    A job is a list of MCP tool calls run in order. Jobs are claimed atomically,
+    so several backend processes can share one table. A claim records the worker
+    pool's instance ID and a lease that the pool renews while the job runs; PIDs
+    are not used to detect dead owners since containers reuse them.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                steps TEXT NOT NULL,
+                results TEXT NOT NULL DEFAULT '[]',
+                error TEXT,
+                session_id TEXT,
+                claimed_by TEXT,
+                lease_expires_at REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs (session_id, created_at);
+            """
+        )
+        columns = {row["name"] for row in self._conn().execute("PRAGMA table_info(jobs)")}
+        if "lease_expires_at" not in columns:
+            # Tables created before leases; their running jobs count as expired
+            self._conn().execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["steps"] = json.loads(job["steps"])
+        job["results"] = json.loads(job["results"])
+        return job
+
+    def submit(self, steps: List[Dict[str, Any]], session_id: Optional[str] = None) -> Dict[str, Any]:
+        steps = normalize_steps(steps)
+        job_id = uuid.uuid4().hex
+        self._conn().execute(
+            "INSERT INTO jobs (id, status, steps, session_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(steps), session_id, time.time()),
+        )
+        logger.info(f"Queued job {job_id} with {len(steps)} step(s)")
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_for_session(self, session_id: str, created_after: float = 0.0) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT * FROM jobs WHERE session_id = ? AND created_at >= ? ORDER BY created_at",
+            (session_id, created_after),
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, instance_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Marks the oldest claimable job as running and returns it.
+
+        Queued jobs are claimable, and so are running jobs whose lease expired.
+
+        Args:
+            instance_id: ID of the claiming worker pool, unique per process start.
+            lease_seconds: How long the claim holds without being renewed.
+
+        Returns:
+            The claimed job, or None if there is nothing to run.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT id, status FROM jobs WHERE status = ? OR (status = ? AND COALESCE(lease_expires_at, 0) < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now),
+            ).fetchone()
+            if row:
+                if row["status"] == RUNNING:
+                    logger.info(f"Taking over job {row['id']} after its lease expired")
+                conn.execute(
+                    "UPDATE jobs SET status = ?, claimed_by = ?, lease_expires_at = ?, started_at = ?, results = '[]' WHERE id = ?",
+                    (RUNNING, instance_id, now + lease_seconds, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"]) if row else None
+
+    def renew(self, job_id: str, instance_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+        """Extends the lease of a running job; False if `instance_id` no longer holds it."""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ? AND claimed_by = ?",
+            (time.time() + lease_seconds, job_id, RUNNING, instance_id),
+        )
+        return cursor.rowcount > 0
+
+    def update_results(self, job_id: str, results: List[Dict[str, Any]]):
+        self._conn().execute("UPDATE jobs SET results = ? WHERE id = ?", (json.dumps(results), job_id))
+
+    def finish(self, job_id: str, results: List[Dict[str, Any]], error: Optional[str] = None):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, results = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED if error else SUCCEEDED, json.dumps(results), error, time.time(), job_id),
+        )
+
+    def requeue_orphans(self) -> int:
+        """Puts running jobs back in the queue when their lease expired."""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = ?, claimed_by = NULL, lease_expires_at = NULL, started_at = NULL "
+            "WHERE status = ? AND COALESCE(lease_expires_at, 0) < ?",
+            (QUEUED, RUNNING, time.time()),
+        )
+        if cursor.rowcount:
+            logger.info(f"Requeued {cursor.rowcount} orphaned jobs")
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class JobWorkerPool:
+    """
+    Background workers that run queued jobs through `call_tool(name, arguments)`.
+
+    Workers sleep until `notify` is called or the poll interval expires, so jobs
+    submitted by other processes are picked up too. `on_output(job, output)` is
+    awaited after each successful step (e.g. to save the images it wrote).
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        call_tool: Callable[[str, Dict[str, Any]], Awaitable[str]],
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL_SECONDS,
+        on_output: Optional[Callable[[Dict[str, Any], str], Awaitable[None]]] = None,
+    ):
+        self.store = store
+        self.call_tool = call_tool
+        self.on_output = on_output
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._finished: Dict[str, asyncio.Event] = {}
+        # Identifies this pool's claims; a fresh ID per start, unlike PIDs
+        self.instance_id = uuid.uuid4().hex
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_run_seconds = 0.0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self.store.requeue_orphans()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers")
+
+    def notify(self):
+        """Wakes an idle worker after a job was submitted."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            try:
+                job = self.store.claim(self.instance_id)
+            except Exception as e:
+                # E.g. "database is locked" while other workers write; keep the worker alive
+                logger.error(f"Failed to claim a job: {e}")
+                await asyncio.sleep(self.poll_interval * 4)
+                continue
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Job worker failed on job {job['id']}: {e}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                if not self.store.renew(job_id, self.instance_id):
+                    logger.warning(f"Lost the lease of job {job_id}")
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to renew the lease of job {job_id}: {e}")
+
+    async def _run(self, job: Dict[str, Any]):
+        started = time.monotonic()
+        results: List[Dict[str, Any]] = []
+        error = None
+        self.in_flight += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            for step in job["steps"]:
+                output = await self.call_tool(step["tool"], step["arguments"])
+                result = {"tool": step["tool"], "output": output}
+                filenames = image_filenames(output)
+                if filenames:
+                    result["image_url"] = f"/static/{resolve_delivery(filenames[0])}?t={int(time.time())}"
+                results.append(result)
+                self.store.update_results(job["id"], results)
+                if output.startswith("Error"):
+                    error = output
+                    break
+                if self.on_output is not None:
+                    try:
+                        await self.on_output(job, output)
+                    except Exception as e:
+                        logger.warning(f"Output hook of job {job['id']} failed: {e}")
+        except asyncio.CancelledError:
+            # Leave the job running; another worker takes it over once its lease expires
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            heartbeat.cancel()
+            self.in_flight -= 1
+
+        self.store.finish(job["id"], results, error)
+        self.total_run_seconds += time.monotonic() - started
+        if error:
+            self.failed += 1
+            logger.warning(f"Job {job['id']} failed: {error}")
+        else:
+            self.completed += 1
+            logger.info(f"Job {job['id']} finished in {time.monotonic() - started:.2f}s")
+        finished = self._finished.pop(job["id"], None)
+        if finished:
+            finished.set()
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Long-poll: returns the job once it is finished or `timeout` seconds have passed.
+
+        Args:
+            job_id: The job to wait for.
+            timeout: Maximum wait in seconds (0 returns immediately).
+
+        Returns:
+            The job, or None if it does not exist.
+        """
+        deadline = time.monotonic() + min(timeout, JOB_MAX_WAIT_SECONDS)
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in TERMINAL_STATUSES or remaining <= 0:
+                if job is None or job["status"] in TERMINAL_STATUSES:
+                    self._finished.pop(job_id, None)
+                return job
+            finished = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                # Jobs run by this process signal completion; others are seen on the next poll
+                await asyncio.wait_for(finished.wait(), timeout=min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_run_seconds": round(self.total_run_seconds / finished, 3) if finished else 0.0,
+            "table": self.store.counts(),
+        }
+
+
+_job_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    """Returns the process-wide job store, creating it on first use."""
+    global _job_store
+    if _job_store is None:
+        _job_store = JobStore(JOBS_DB_PATH)
+    return _job_store
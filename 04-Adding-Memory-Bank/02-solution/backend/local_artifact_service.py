@@ -0,0 +1,406 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.artifacts import BaseArtifactService
+from google.adk.artifacts import artifact_util
+from google.adk.artifacts.base_artifact_service import ArtifactVersion
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# Versions kept per artifact; older versions are dropped and their blobs deleted once unreferenced
+ARTIFACT_MAX_VERSIONS = int(os.getenv("ARTIFACT_MAX_VERSIONS", "10"))
+# Versions older than this are dropped (sessions end; their artifacts are not read again)
+ARTIFACT_SERVICE_MAX_AGE_HOURS = float(os.getenv("ARTIFACT_SERVICE_MAX_AGE_HOURS", str(24 * 7)))
+# Bytes the blobs may use; beyond it the blobs saved least recently are deleted with their versions
+ARTIFACT_SERVICE_QUOTA_MB = float(os.getenv("ARTIFACT_SERVICE_QUOTA_MB", "512"))
+# How often a save triggers garbage collection, and how many blobs one collection transaction evicts
+ARTIFACT_SERVICE_GC_INTERVAL_SECONDS = float(os.getenv("ARTIFACT_SERVICE_GC_INTERVAL_SECONDS", "300"))
+ARTIFACT_SERVICE_GC_BATCH = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    id TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mime_type TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    blob_id TEXT,
+    file_uri TEXT,
+    mime_type TEXT,
+    custom_metadata TEXT NOT NULL,
+    create_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, scope, filename, version)
+);
+CREATE INDEX IF NOT EXISTS versions_by_blob ON versions (blob_id);
+CREATE INDEX IF NOT EXISTS versions_by_time ON versions (create_time);
+"""
+
+# Scope of user-scoped ("user:" prefixed) artifacts
+USER_SCOPE = ""
+
+
+def artifact_name(filename: str) -> str:
+    """Artifact filename of a file under static/ (artifact URIs allow no slashes)."""
+    return filename.replace("/", "_")
+
+
+def read_file_part(path: str) -> types.Part:
+    """Reads an image (or any file) into an inline-data part."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return types.Part.from_bytes(data=data, mime_type=mimetypes.guess_type(path)[0] or "application/octet-stream")
+
+
+class LocalArtifactService(BaseArtifactService):
+    """
+    Content-addressed artifact service on local disk.
+
+    Every version's bytes are stored once under their SHA-256 (`blobs/ab/abcd...`),
+    so saving identical bytes again, under any name, session or user, only adds
+    an index row. The digest is the artifact ID: `load_by_id` resolves it to a
+    path without a lookup. Versions live in a SQLite index (WAL mode), shared by
+    all workers on the host; the newest `max_versions` of each artifact are kept.
+
+    Saves periodically run `collect()`, which drops versions older than
+    `max_age_hours` and then evicts the least recently saved blobs (with every
+    version referring to them) until the blobs fit in `quota_mb`.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_versions: int = ARTIFACT_MAX_VERSIONS,
+        max_age_hours: Optional[float] = ARTIFACT_SERVICE_MAX_AGE_HOURS,
+        quota_mb: float = ARTIFACT_SERVICE_QUOTA_MB,
+    ):
+        self.root = root
+        self.max_versions = max_versions
+        self.max_age_hours = max_age_hours
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.saves = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+        self.bytes_deduplicated = 0
+        self.blobs_deleted = 0
+        self.versions_expired = 0
+        self.blobs_evicted = 0
+        self._last_collect = time.monotonic()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), isolation_level=None, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, artifact_id: str) -> str:
+        return os.path.join(self.root, "blobs", artifact_id[:2], artifact_id)
+
+    @staticmethod
+    def _scope(filename: str, session_id: Optional[str]) -> str:
+        if filename.startswith("user:"):
+            return USER_SCOPE
+        if session_id is None:
+            raise ValueError("Session ID must be provided for session-scoped artifacts.")
+        return session_id
+
+    def _store_blob(self, conn: sqlite3.Connection, artifact_id: str, data: bytes, mime_type: Optional[str]):
+        """Writes a blob unless it is already stored; runs inside the save transaction."""
+        if conn.execute("SELECT 1 FROM blobs WHERE id = ?", (artifact_id,)).fetchone():
+            with self._lock:
+                self.deduplicated += 1
+                self.bytes_deduplicated += len(data)
+            return
+        path = self.blob_path(artifact_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        conn.execute(
+            "INSERT INTO blobs (id, size, mime_type, created_at) VALUES (?, ?, ?, ?)",
+            (artifact_id, len(data), mime_type, time.time()),
+        )
+        with self._lock:
+            self.bytes_written += len(data)
+
+    def _delete_unreferenced(self, conn: sqlite3.Connection, blob_ids: List[Optional[str]]):
+        """Deletes blobs no version refers to any more; runs inside the transaction that dropped the versions."""
+        for blob_id in set(filter(None, blob_ids)):
+            if conn.execute("SELECT 1 FROM versions WHERE blob_id = ? LIMIT 1", (blob_id,)).fetchone():
+                continue
+            conn.execute("DELETE FROM blobs WHERE id = ?", (blob_id,))
+            try:
+                os.remove(self.blob_path(blob_id))
+                with self._lock:
+                    self.blobs_deleted += 1
+            except FileNotFoundError:
+                pass
+
+    def _transaction(self, work):
+        # Blob writes and deletes happen under the database's write lock, so a concurrent
+        # save never refers to a blob that a delete is removing
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _save(self, app_name: str, user_id: str, filename: str, artifact: types.Part, session_id: Optional[str], custom_metadata: Optional[Dict[str, Any]]) -> int:
+        scope = self._scope(filename, session_id)
+        data, file_uri, mime_type = None, None, None
+        if artifact.inline_data is not None:
+            data, mime_type = artifact.inline_data.data or b"", artifact.inline_data.mime_type
+        elif artifact.text is not None:
+            data, mime_type = artifact.text.encode("utf-8"), "text/plain"
+        elif artifact.file_data is not None:
+            if artifact_util.is_artifact_ref(artifact) and not artifact_util.parse_artifact_uri(artifact.file_data.file_uri):
+                raise ValueError(f"Invalid artifact reference URI: {artifact.file_data.file_uri}")
+            file_uri, mime_type = artifact.file_data.file_uri, artifact.file_data.mime_type
+        else:
+            raise ValueError("Not supported artifact type.")
+        blob_id = hashlib.sha256(data).hexdigest() if data is not None else None
+        key = (app_name, user_id, scope, filename)
+        where = "app_name = ? AND user_id = ? AND scope = ? AND filename = ?"
+
+        def save(conn: sqlite3.Connection) -> int:
+            if blob_id:
+                self._store_blob(conn, blob_id, data, mime_type)
+            latest = conn.execute(f"SELECT MAX(version) AS latest FROM versions WHERE {where}", key).fetchone()["latest"]
+            version = 0 if latest is None else latest + 1
+            conn.execute(
+                "INSERT INTO versions (app_name, user_id, scope, filename, version, blob_id, file_uri, mime_type, custom_metadata, create_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, version, blob_id, file_uri, mime_type, json.dumps(custom_metadata or {}), time.time()),
+            )
+            oldest_kept = version - self.max_versions + 1
+            dropped = conn.execute(f"SELECT blob_id FROM versions WHERE {where} AND version < ?", (*key, oldest_kept)).fetchall()
+            if dropped:
+                conn.execute(f"DELETE FROM versions WHERE {where} AND version < ?", (*key, oldest_kept))
+                self._delete_unreferenced(conn, [row["blob_id"] for row in dropped])
+            return version
+
+        version = self._transaction(save)
+        with self._lock:
+            self.saves += 1
+            collect = time.monotonic() - self._last_collect >= ARTIFACT_SERVICE_GC_INTERVAL_SECONDS
+            if collect:
+                self._last_collect = time.monotonic()
+        if collect:
+            try:
+                self.collect()
+            except sqlite3.Error as e:
+                logger.warning(f"Artifact garbage collection failed: {e}")
+        return version
+
+    def collect(self) -> int:
+        """
+        Drops expired versions, then evicts blobs until the quota holds.
+
+        Returns:
+            Number of blobs deleted.
+        """
+        deleted_before = self.blobs_deleted
+
+        def expire(conn: sqlite3.Connection):
+            cutoff = time.time() - self.max_age_hours * 3600
+            rows = conn.execute("SELECT blob_id FROM versions WHERE create_time < ?", (cutoff,)).fetchall()
+            conn.execute("DELETE FROM versions WHERE create_time < ?", (cutoff,))
+            self._delete_unreferenced(conn, [row["blob_id"] for row in rows])
+            with self._lock:
+                self.versions_expired += len(rows)
+
+        def evict(conn: sqlite3.Connection) -> bool:
+            used = conn.execute("SELECT COALESCE(SUM(size), 0) AS bytes FROM blobs").fetchone()["bytes"]
+            if used <= self.quota_bytes:
+                return False
+            candidates = conn.execute(
+                "SELECT blobs.id, blobs.size FROM blobs LEFT JOIN versions ON versions.blob_id = blobs.id "
+                "GROUP BY blobs.id ORDER BY COALESCE(MAX(versions.create_time), blobs.created_at) LIMIT ?",
+                (ARTIFACT_SERVICE_GC_BATCH,),
+            ).fetchall()
+            for row in candidates:
+                if used <= self.quota_bytes:
+                    break
+                conn.execute("DELETE FROM versions WHERE blob_id = ?", (row["id"],))
+                self._delete_unreferenced(conn, [row["id"]])
+                used -= row["size"]
+                with self._lock:
+                    self.blobs_evicted += 1
+            return used > self.quota_bytes and bool(candidates)
+
+        if self.max_age_hours is not None:
+            self._transaction(expire)
+        # Short transactions, so saves of other workers are not held up by a long eviction
+        while self._transaction(evict):
+            pass
+        deleted = self.blobs_deleted - deleted_before
+        if deleted:
+            logger.info(f"Artifact garbage collection deleted {deleted} blobs")
+        return deleted
+
+    def _delete(self, key: Tuple[str, str, str, str]):
+        where = "app_name = ? AND user_id = ? AND scope = ? AND filename = ?"
+
+        def delete(conn: sqlite3.Connection):
+            rows = conn.execute(f"SELECT blob_id FROM versions WHERE {where}", key).fetchall()
+            conn.execute(f"DELETE FROM versions WHERE {where}", key)
+            self._delete_unreferenced(conn, [row["blob_id"] for row in rows])
+
+        self._transaction(delete)
+
+    def _version_row(self, app_name: str, user_id: str, filename: str, session_id: Optional[str], version: Optional[int]) -> Optional[sqlite3.Row]:
+        key = (app_name, user_id, self._scope(filename, session_id), filename)
+        where = "app_name = ? AND user_id = ? AND scope = ? AND filename = ?"
+        if version is None:
+            return self._conn().execute(f"SELECT * FROM versions WHERE {where} ORDER BY version DESC LIMIT 1", key).fetchone()
+        return self._conn().execute(f"SELECT * FROM versions WHERE {where} AND version = ?", (*key, version)).fetchone()
+
+    def _load_blob(self, artifact_id: str, mime_type: Optional[str]) -> Optional[types.Part]:
+        try:
+            with open(self.blob_path(artifact_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            logger.warning(f"Artifact blob {artifact_id} is missing")
+            return None
+        if mime_type == "text/plain":
+            return types.Part(text=data.decode("utf-8"))
+        return types.Part.from_bytes(data=data, mime_type=mime_type or "application/octet-stream")
+
+    def _version(self, row: sqlite3.Row) -> ArtifactVersion:
+        return ArtifactVersion(
+            version=row["version"],
+            canonical_uri=f"cas://sha256/{row['blob_id']}" if row["blob_id"] else row["file_uri"],
+            custom_metadata=json.loads(row["custom_metadata"]),
+            create_time=row["create_time"],
+            mime_type=row["mime_type"],
+        )
+
+    async def save_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        artifact: types.Part,
+        session_id: Optional[str] = None,
+        custom_metadata: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        # Hashing and writing image bytes stays off the event loop
+        return await asyncio.to_thread(self._save, app_name, user_id, filename, artifact, session_id, custom_metadata)
+
+    async def load_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: Optional[str] = None,
+        version: Optional[int] = None,
+    ) -> Optional[types.Part]:
+        row = self._version_row(app_name, user_id, filename, session_id, version)
+        if row is None:
+            return None
+        if row["blob_id"]:
+            return await asyncio.to_thread(self._load_blob, row["blob_id"], row["mime_type"])
+        part = types.Part(file_data=types.FileData(file_uri=row["file_uri"], mime_type=row["mime_type"]))
+        if not artifact_util.is_artifact_ref(part):
+            return part
+        parsed = artifact_util.parse_artifact_uri(row["file_uri"])
+        return await self.load_artifact(
+            app_name=parsed.app_name,
+            user_id=parsed.user_id,
+            filename=parsed.filename,
+            session_id=parsed.session_id,
+            version=parsed.version,
+        )
+
+    async def load_by_id(self, artifact_id: str) -> Optional[types.Part]:
+        """Loads the bytes of any saved version by its artifact ID (the SHA-256 of its content)."""
+        row = self._conn().execute("SELECT mime_type FROM blobs WHERE id = ?", (artifact_id,)).fetchone()
+        if row is None:
+            return None
+        return await asyncio.to_thread(self._load_blob, artifact_id, row["mime_type"])
+
+    def blob_info(self, artifact_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Path and MIME type of an artifact ID, or None if it is unknown."""
+        row = self._conn().execute("SELECT mime_type FROM blobs WHERE id = ?", (artifact_id,)).fetchone()
+        return (self.blob_path(artifact_id), row["mime_type"]) if row else None
+
+    async def list_artifact_keys(self, *, app_name: str, user_id: str, session_id: Optional[str] = None) -> List[str]:
+        scopes = [USER_SCOPE] + ([session_id] if session_id else [])
+        rows = self._conn().execute(
+            f"SELECT DISTINCT filename FROM versions WHERE app_name = ? AND user_id = ? AND scope IN ({','.join('?' * len(scopes))}) ORDER BY filename",
+            (app_name, user_id, *scopes),
+        ).fetchall()
+        return [row["filename"] for row in rows]
+
+    async def delete_artifact(self, *, app_name: str, user_id: str, filename: str, session_id: Optional[str] = None) -> None:
+        await asyncio.to_thread(self._delete, (app_name, user_id, self._scope(filename, session_id), filename))
+
+    async def list_versions(self, *, app_name: str, user_id: str, filename: str, session_id: Optional[str] = None) -> List[int]:
+        return [v.version for v in await self.list_artifact_versions(app_name=app_name, user_id=user_id, filename=filename, session_id=session_id)]
+
+    async def list_artifact_versions(self, *, app_name: str, user_id: str, filename: str, session_id: Optional[str] = None) -> List[ArtifactVersion]:
+        rows = self._conn().execute(
+            "SELECT * FROM versions WHERE app_name = ? AND user_id = ? AND scope = ? AND filename = ? ORDER BY version",
+            (app_name, user_id, self._scope(filename, session_id), filename),
+        ).fetchall()
+        return [self._version(row) for row in rows]
+
+    async def get_artifact_version(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: Optional[str] = None,
+        version: Optional[int] = None,
+    ) -> Optional[ArtifactVersion]:
+        row = self._version_row(app_name, user_id, filename, session_id, version)
+        return self._version(row) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        row = self._conn().execute("SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS bytes FROM blobs").fetchone()
+        versions = self._conn().execute("SELECT COUNT(*) AS n FROM versions").fetchone()["n"]
+        with self._lock:
+            return {
+                "blobs": row["blobs"],
+                "blob_bytes": row["bytes"],
+                "versions": versions,
+                "saves": self.saves,
+                "deduplicated": self.deduplicated,
+                "bytes_written": self.bytes_written,
+                "bytes_deduplicated": self.bytes_deduplicated,
+                "blobs_deleted": self.blobs_deleted,
+                "versions_expired": self.versions_expired,
+                "blobs_evicted": self.blobs_evicted,
+                "quota_bytes": self.quota_bytes,
+            }
@@ -0,0 +1,224 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List
+
+import numpy as np
+from google.adk.memory import BaseMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = int(os.getenv("LOCAL_MEMORY_EMBEDDING_DIM", "256"))
+LOCAL_MEMORY_TOP_K = int(os.getenv("LOCAL_MEMORY_TOP_K", "5"))
+LOCAL_MEMORY_MIN_SCORE = float(os.getenv("LOCAL_MEMORY_MIN_SCORE", "0.1"))
+# Facts closer than this to an existing fact of the same user are treated as duplicates
+DUPLICATE_SCORE = 0.97
+INITIAL_CAPACITY = 1024
+
+# Mirrors the custom memory topics registered in deploy_agent.py
+MEMORY_TOPICS = {
+    "sweater_preference": [
+        "sweater", "pattern", "knit", "cardigan", "pullover", "turtleneck", "hoodie", "oversized",
+        "fitted", "wool", "cotton", "cashmere", "itchy", "soft", "snowflake", "reindeer", "fair isle",
+        "geometric", "retro", "ugly", "elegant", "color", "colour", "red", "green", "navy", "blue",
+        "pastel", "gold", "yellow", "black", "white", "style", "motif",
+    ],
+    "personal_context": [
+        "dog", "cat", "pet", "puppy", "kitten", "retriever", "named", "hobby", "hobbies", "love",
+        "enjoy", "skiing", "reading", "gaming", "cooking", "job", "work", "engineer", "programmer",
+        "developer", "teacher", "nurse", "scene", "mountain", "beach", "fireplace", "city", "cozy",
+        "sci-fi", "nature", "vintage", "tech", "cyberpunk",
+    ],
+}
+
+UPLOAD_NOTE = re.compile(r"\[System:.*?\]", re.DOTALL)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Hashing-trick embedding of words and word bigrams, L2-normalized.
+
+    Deterministic across processes (unlike the built-in `hash`), so vectors written
+    by one run stay comparable with queries of the next.
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = TOKEN.findall(text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def extract_facts(text: str) -> List[tuple]:
+    """
+    Splits a user message into sentences and keeps those that match a memory topic.
+
+    Returns:
+        A list of (topic, fact) tuples.
+    """
+    text = UPLOAD_NOTE.sub("", text)
+    facts = []
+    for sentence in SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip()
+        if len(sentence) < 8:
+            continue
+        lowered = sentence.lower()
+        for topic, keywords in MEMORY_TOPICS.items():
+            if any(re.search(rf"\b{re.escape(k)}\b", lowered) for k in keywords):
+                facts.append((topic, sentence))
+                break
+    return facts
+
+
+class LocalVectorMemoryService(BaseMemoryService):
+    """
+    Offline memory service with a persistent, memory-mapped vector index.
+
+    Layout of `directory`:
+      - vectors.f32: float32 matrix (capacity x EMBEDDING_DIM), memory-mapped
+      - users.i32:   int32 user code of each row, memory-mapped
+      - offsets.i64: byte offset of each row's record in facts.jsonl
+      - facts.jsonl: one JSON record (topic, fact, session, timestamp) per row
+      - meta.json:   row count, capacity and the user-key -> code table
+
+    Opening the store only maps the files, so startup cost does not grow with the
+    number of memories, and search is a single matrix-vector product over the
+    user's rows.
+    """
+
+    def __init__(self, directory: str = "memory_store"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._facts_path = os.path.join(directory, "facts.jsonl")
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"count": 0, "capacity": INITIAL_CAPACITY, "dim": EMBEDDING_DIM, "users": {}}
+        if meta["dim"] != EMBEDDING_DIM:
+            raise ValueError(f"Memory store at {directory} uses dim {meta['dim']}, expected {EMBEDDING_DIM}")
+        self.count: int = meta["count"]
+        self.capacity: int = meta["capacity"]
+        self._users: Dict[str, int] = meta["users"]
+        self._open_arrays()
+        logger.info(f"Local memory store opened with {self.count} memories at {directory}")
+
+    def _open_arrays(self):
+        self._vectors = self._map("vectors.f32", np.float32, (self.capacity, EMBEDDING_DIM))
+        self._user_codes = self._map("users.i32", np.int32, (self.capacity,))
+        self._offsets = self._map("offsets.i64", np.int64, (self.capacity,))
+
+    def _map(self, name: str, dtype, shape: tuple) -> np.memmap:
+        path = os.path.join(self.directory, name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        for array in (self._vectors, self._user_codes, self._offsets):
+            array.flush()
+        while self.capacity < needed:
+            self.capacity *= 2
+        self._open_arrays()
+
+    def _save_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"count": self.count, "capacity": self.capacity, "dim": EMBEDDING_DIM, "users": self._users}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    @staticmethod
+    def _user_key(app_name: str, user_id: str) -> str:
+        return f"{app_name}/{user_id}"
+
+    def _user_rows(self, user_code: int) -> np.ndarray:
+        return np.flatnonzero(self._user_codes[:self.count] == user_code)
+
+    async def add_session_to_memory(self, session):
+        user_key = self._user_key(session.app_name, session.user_id)
+        user_code = self._users.setdefault(user_key, len(self._users))
+
+        candidates = []
+        for event in session.events:
+            if event.author != "user" or not event.content or not event.content.parts:
+                continue
+            for part in event.content.parts:
+                if part.text:
+                    candidates.extend((topic, fact, event.timestamp) for topic, fact in extract_facts(part.text))
+        if not candidates:
+            return
+
+        rows = self._user_rows(user_code)
+        existing = np.asarray(self._vectors[rows]) if len(rows) else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        added = 0
+        with open(self._facts_path, "ab") as facts_file:
+            for topic, fact, timestamp in candidates:
+                vector = embed(fact)
+                if len(existing) and float((existing @ vector).max()) >= DUPLICATE_SCORE:
+                    continue
+                self._grow(self.count + 1)
+                record = {"topic": topic, "fact": fact, "session_id": session.id, "timestamp": timestamp}
+                self._offsets[self.count] = facts_file.tell()
+                facts_file.write((json.dumps(record) + "\n").encode("utf-8"))
+                self._vectors[self.count] = vector
+                self._user_codes[self.count] = user_code
+                self.count += 1
+                existing = np.vstack([existing, vector[None, :]])
+                added += 1
+
+        if added:
+            for array in (self._vectors, self._user_codes, self._offsets):
+                array.flush()
+            self._save_meta()
+            logger.info(f"Stored {added} new memories for {user_key}")
+
+    def _read_record(self, row: int) -> Dict[str, Any]:
+        with open(self._facts_path, "rb") as f:
+            f.seek(int(self._offsets[row]))
+            return json.loads(f.readline())
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        user_code = self._users.get(self._user_key(app_name, user_id))
+        if user_code is None or not query or not query.strip():
+            return SearchMemoryResponse(memories=[])
+        rows = self._user_rows(user_code)
+        if not len(rows):
+            return SearchMemoryResponse(memories=[])
+
+        scores = self._vectors[rows] @ embed(query)
+        k = min(LOCAL_MEMORY_TOP_K, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        memories = []
+        for index in top:
+            if scores[index] < LOCAL_MEMORY_MIN_SCORE:
+                break
+            record = self._read_record(int(rows[index]))
+            memories.append(MemoryEntry(
+                content=types.Content(role="user", parts=[types.Part(text=record["fact"])]),
+                author="user",
+                timestamp=datetime.datetime.fromtimestamp(record["timestamp"]).isoformat(),
+            ))
+        return SearchMemoryResponse(memories=memories)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memories": self.count, "users": len(self._users), "capacity": self.capacity}
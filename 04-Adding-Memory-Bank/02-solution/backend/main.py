@@ -1,19 +1,16 @@
 import os
+import json
 import time
+import asyncio
 import logging
 import shutil
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
-import vertexai
-from google.adk.runners import Runner
-from google.adk.sessions import VertexAiSessionService
-from google.adk.memory import VertexAiMemoryBankService
-from google.genai import types
-from agent import christmas_agent
 
 # Configure logging
 logging.basicConfig(
@@ -28,13 +25,23 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-PROJECT_ID = os.getenv("PROJECT_ID")
-LOCATION = os.getenv("LOCATION", "us-central1")
+# Heavy SDKs (google.adk, google.genai, vertexai) and the agent are imported lazily
+# in the startup hook below, so importing this module stays fast.
+import services
+from services import PROJECT_ID, USE_VERTEX_SESSIONS, SESSION_BACKEND
+from warmup import SessionPool, WarmupState, warm_up, WARMUP_SESSION_POOL
+from context_cache import CONTEXT_CACHE_ENABLED
+from state_store import APP, ARTIFACTS, IDEMPOTENCY, STATE_BACKEND, USAGE, get_state_store
+from usage import TurnUsage, UsageTracker, image_filenames
+from admission import AdmissionController, AdmissionRejected
+from idempotency import IDEMPOTENCY_RETRY_AFTER_SECONDS, IdempotencyConflict, IdempotencyStore, IdempotencyTimeout, request_fingerprint
+from jobs import JobWorkerPool, get_job_store, unknown_tools
+from image_encoding import resolve_delivery
+from artifact_store import ArtifactStore, category_for
 
 if not PROJECT_ID:
     logger.warning("PROJECT_ID not found in environment variables. Vertex AI services may fail.")
 
-# Initialize Vertex AI
 if PROJECT_ID:
     # If we are using Vertex AI (implied by PROJECT_ID), we should ensure GOOGLE_API_KEY is not set
     # to avoid "Project/location and API key are mutually exclusive" error in some SDK versions.
@@ -42,15 +49,24 @@ if PROJECT_ID:
         logger.info("Unsetting GOOGLE_API_KEY to avoid conflict with Vertex AI Project/Location configuration.")
         del os.environ["GOOGLE_API_KEY"]
 
-    vertexai.init(project=PROJECT_ID, location=LOCATION)
-    client = vertexai.Client(project=PROJECT_ID, location=LOCATION)
-
 app = FastAPI(title="Smart Christmas Tree API")
 
+# Uploads and generated images with per-category quotas; the sweeper evicts the least recently used
+artifact_store = ArtifactStore()
+
+class ArtifactStaticFiles(StaticFiles):
+    """Serves static/ and records each artifact served, for LRU eviction."""
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code == 200:
+            artifact_store.touch(os.path.join("static", path))
+        return response
+
 # Mount static directory for serving images
 # Ensure directory exists
 os.makedirs("static/uploads", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", ArtifactStaticFiles(directory="static"), name="static")
 
 # CORS configuration
 app.add_middleware(
@@ -70,51 +86,240 @@ class ChatResponse(BaseModel):
     response: str
     tree_state: dict
     generated_image: Optional[str] = None
+    jobs: List[str] = []
 
-# Initialize ADK services with Vertex AI
-AGENT_ENGINE_ID = os.getenv("AGENT_ENGINE_ID")
-USE_MEMORY_BANK = os.getenv("USE_MEMORY_BANK", "false").lower() == "true"
+class JobRequest(BaseModel):
+    # Either a single tool call...
+    tool: Optional[str] = None
+    arguments: Dict[str, Any] = {}
+    # ...or several run in order
+    steps: Optional[List[Dict[str, Any]]] = None
 
-if USE_MEMORY_BANK and AGENT_ENGINE_ID:
-    logger.info(f"Using Agent Engine ID: {AGENT_ENGINE_ID}")
-    session_service = VertexAiSessionService(
-        project=PROJECT_ID, location=LOCATION, agent_engine_id=AGENT_ENGINE_ID
-    )
-    memory_service = VertexAiMemoryBankService(
-        project=PROJECT_ID, location=LOCATION, agent_engine_id=AGENT_ENGINE_ID
-    )
-else:
-    if not USE_MEMORY_BANK:
-        logger.info("USE_MEMORY_BANK is false. Using InMemory services.")
+# ADK services, agent and runner; populated by initialize_backend() at startup
+session_service = None
+memory_service = None
+artifact_service = None
+runner = None
+agent_module = None
+session_pool = None
+warmup_state = WarmupState()
+job_store = get_job_store()
+job_pool = None
+
+# Readiness signal: set once initialize_backend() has finished (successfully or not)
+backend_initialized = asyncio.Event()
+INIT_ERROR: Optional[str] = None
+STARTUP_TIMINGS = {}
+
+# State shared by all uvicorn workers: current session ID, tree state, artifact metadata
+state_store = get_state_store()
+# Per-session token, latency and tool-call accounting
+usage_tracker = UsageTracker(state_store, USAGE)
+# Bounded, per-user fair concurrency for chat turns
+admission = AdmissionController()
+# Results of chat requests by Idempotency-Key, so resubmits do not run (and render) twice
+idempotency = IdempotencyStore(state_store, IDEMPOTENCY)
+
+# A persistent session store lets the demo session resume after a restart
+DEFAULT_SESSION_ID = "demo_session" if SESSION_BACKEND == "sqlite" and not USE_VERTEX_SESSIONS else None
+
+def get_current_session_id() -> Optional[str]:
+    return state_store.get(APP, "current_session_id", DEFAULT_SESSION_ID)
+
+def set_current_session_id(session_id: Optional[str]):
+    if session_id:
+        state_store.set(APP, "current_session_id", session_id)
     else:
-        logger.warning("AGENT_ENGINE_ID not found but USE_MEMORY_BANK is true. Falling back to InMemory services.")
-    
-    from google.adk.sessions import InMemorySessionService
-    from google.adk.memory import InMemoryMemoryService
-    session_service = InMemorySessionService()
-    memory_service = InMemoryMemoryService()
-
-# Initialize Runner
-runner = Runner(
-    app_name="agents",
-    agent=christmas_agent,
-    session_service=session_service,
-    memory_service=memory_service,
-)
+        state_store.delete(APP, "current_session_id")
 
-# Global variable to store the current session ID
-CURRENT_SESSION_ID = None
+async def save_file_artifact(filename: str, user_id: str, session_id: str) -> Optional[int]:
+    """Saves a file under static/ as a versioned session artifact; returns its version."""
+    from local_artifact_service import artifact_name, read_file_part
+
+    path = os.path.join("static", filename)
+    if artifact_service is None or not os.path.exists(path):
+        return None
+    part = await asyncio.to_thread(read_file_part, path)
+    return await artifact_service.save_artifact(
+        app_name="agents", user_id=user_id, session_id=session_id, filename=artifact_name(filename), artifact=part
+    )
+
+async def save_job_images(job: Dict[str, Any], output: str):
+    """Job step hook: saves the images a background render wrote to the session that started it."""
+    if not job.get("session_id"):
+        return
+    for filename in image_filenames(output):
+        await save_file_artifact(filename, "demo_user", job["session_id"])
+
+async def _timed(name: str, coro):
+    t0 = time.perf_counter()
+    result = await coro
+    STARTUP_TIMINGS[name] = round(time.perf_counter() - t0, 3)
+    logger.info(f"Startup step '{name}' took {STARTUP_TIMINGS[name]:.3f}s")
+    return result
+
+async def _create_agent():
+    """Builds the agent off the event loop (the ADK import is slow) and spawns the MCP tool server."""
+    module = await asyncio.to_thread(__import__, "agent")
+    agent = await asyncio.to_thread(module.create_agent)
+    # Listing tools spawns the mcp_server.py subprocess and completes the MCP handshake
+    tools = await module.mcp_toolset.get_tools()
+    logger.info(f"MCP toolset ready with {len(tools)} tools")
+    return module, agent
+
+async def initialize_backend():
+    """
+    Imports the ADK, builds the session and memory services and the agent (including
+    the MCP server spawn) in parallel, then the Runner. Sets `backend_initialized` when done.
+    """
+    global session_service, memory_service, artifact_service, runner, agent_module, session_pool, job_pool, INIT_ERROR
+    t0 = time.perf_counter()
+    try:
+        # The builders below import overlapping parts of the ADK; importing it from several
+        # threads at once can deadlock on the module locks, so it is loaded once up front
+        await _timed("adk_import", asyncio.to_thread(__import__, "google.adk.runners"))
+        (session_service, memory_service, artifact_service, (agent_module, agent)) = await asyncio.gather(
+            _timed("session_service", asyncio.to_thread(services.create_session_service)),
+            _timed("memory_service", asyncio.to_thread(services.create_memory_service)),
+            _timed("artifact_service", asyncio.to_thread(services.create_artifact_service)),
+            _timed("agent_and_mcp", _create_agent()),
+        )
+        from google.adk.runners import Runner
+        runner = Runner(
+            app_name="agents",
+            agent=agent,
+            session_service=session_service,
+            memory_service=memory_service,
+            artifact_service=artifact_service,
+        )
+
+        # Warm-up: cached tool schemas, model connection and (optionally) pre-created sessions
+        if USE_VERTEX_SESSIONS and WARMUP_SESSION_POOL > 0:
+            session_pool = SessionPool(session_service, "agents", "demo_user", WARMUP_SESSION_POOL)
+        context_cache = agent_module.context_cache if CONTEXT_CACHE_ENABLED else None
+        await _timed("warmup", warm_up(warmup_state, agent, agent_module.mcp_toolset, session_pool, context_cache, runner))
+
+        # Background renders submitted via /api/jobs or the agent's start_render_job tool
+        job_pool = JobWorkerPool(job_store, agent_module.mcp_toolset.call_tool, on_output=save_job_images)
+        job_pool.start()
+        STARTUP_TIMINGS["total"] = round(time.perf_counter() - t0, 3)
+        logger.info(f"Backend ready in {STARTUP_TIMINGS['total']:.3f}s")
+    except Exception as e:
+        INIT_ERROR = str(e)
+        logger.error(f"Backend initialization failed: {e}", exc_info=True)
+    finally:
+        backend_initialized.set()
+
+@app.on_event("startup")
+async def start_initialization():
+    # Run initialization in the background so the server accepts connections right away
+    app.state.init_task = asyncio.create_task(initialize_backend())
+    artifact_store.start()
+
+async def wait_until_ready():
+    await backend_initialized.wait()
+    if INIT_ERROR:
+        raise HTTPException(status_code=503, detail=f"Backend failed to initialize: {INIT_ERROR}")
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness probe: the process is up and serving HTTP.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe: 200 only once services, agent, MCP server and warm-up are done,
+    i.e. when the first chat request will be served at steady-state latency.
+    """
+    body = {"startup_timings": STARTUP_TIMINGS, "warmup": warmup_state.steps, "tools": warmup_state.tool_names}
+    if backend_initialized.is_set() and not INIT_ERROR and warmup_state.done:
+        return {"status": "ready", **body}
+    status = "failed" if INIT_ERROR else "starting"
+    return JSONResponse(status_code=503, content={"status": status, "error": INIT_ERROR, **body})
+
+@app.on_event("shutdown")
+async def flush_memory_ingestion():
+    await asyncio.to_thread(artifact_store.stop)
+    if job_pool is not None:
+        # Unfinished jobs stay in the table and are requeued on the next start
+        await job_pool.stop()
+    if agent_module is None:
+        return
+    await agent_module.context_cache.close()
+    # Stops the MCP supervisor, which terminates the server process
+    await agent_module.mcp_toolset.close()
+    # Make sure queued memory bank writes are not lost on graceful shutdown
+    await agent_module.ingestion_worker.drain()
+    if hasattr(session_service, "close"):
+        session_service.close()
+
+def client_key(request: Request) -> str:
+    """Identifies the client for per-user fairness: the X-User-Id header, else the client address."""
+    return request.headers.get("x-user-id") or (request.client.host if request.client else "anonymous")
 
 @app.post("/api/chat")
 async def chat_endpoint(
+    request: Request,
     message: str = Form(...),
     file: Optional[UploadFile] = File(None)
 ):
     """
     Chat endpoint that accepts text and an optional image file.
+
+    With an `Idempotency-Key` header, a repeat of a request that is still running
+    attaches to it and a repeat of a completed one returns the stored result
+    (marked with `Idempotent-Replayed: true`) instead of running the turn again.
+
+    Turns beyond the concurrency limit wait briefly for a slot; when the queue is
+    full (or the wait or per-user limit is exceeded) the response is 429 with
+    Retry-After and the queue position.
     """
-    global CURRENT_SESSION_ID
-    
+    # Requests that arrive during startup wait for initialization instead of failing
+    await wait_until_ready()
+    user = client_key(request)
+    idempotency_key = request.headers.get("idempotency-key")
+
+    async def admitted_turn():
+        async with admission.admit(user):
+            return await run_chat_turn(message, file)
+
+    try:
+        if not idempotency_key:
+            return await admitted_turn()
+        fingerprint = request_fingerprint(message, file.filename if file else None, file.size if file else None)
+        result, replayed = await idempotency.run(f"{user}:{idempotency_key}", fingerprint, admitted_turn)
+        return JSONResponse(content=result, headers={"Idempotent-Replayed": "true"} if replayed else None)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    except IdempotencyTimeout:
+        # The original request is still running in another worker; its result is stored once it finishes
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still running. Please try again shortly.",
+            headers={"Retry-After": str(IDEMPOTENCY_RETRY_AFTER_SECONDS)},
+        )
+    except AdmissionRejected as e:
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+            content={
+                "detail": "The elves are busy with other requests. Please try again shortly.",
+                "reason": e.reason,
+                "queue_position": e.queue_position,
+                "retry_after": e.retry_after,
+            },
+        )
+
+async def run_chat_turn(message: str, file: Optional[UploadFile]):
+    """
+    Runs one agent turn: stores the upload, resolves the session and collects the
+    final response, generated image, jobs and usage.
+    """
+    from google.genai import types
+
     try:
         user_input = message
         uploaded_file_path = None
@@ -130,41 +335,54 @@ async def chat_endpoint(
             
             uploaded_file_path = abs_file_location
             logger.info(f"File saved to {abs_file_location}")
+            state_store.set(ARTIFACTS, f"uploads/{file.filename}", {"path": abs_file_location, "created_at": time.time()})
+            artifact_store.register(file_location)
             
             # Inject file path into the user message for the agent
             user_input += f"\n[System: User uploaded an image. It is saved at: {abs_file_location}]"
         
+        if agent_module.model_cassette is not None and agent_module.model_cassette.recording:
+            # The recorded turns drive replay_bench.py
+            agent_module.model_cassette.record_turn(message, uploaded_file_path)
+
         user_id = "demo_user"
         session = None
         
         # Try to retrieve existing session if we have an ID
-        if CURRENT_SESSION_ID:
+        current_session_id = get_current_session_id()
+        if current_session_id:
             try:
                 t0 = time.time()
-                session = await session_service.get_session(app_name="agents", session_id=CURRENT_SESSION_ID, user_id=user_id)
+                session = await session_service.get_session(app_name="agents", session_id=current_session_id, user_id=user_id)
                 logger.info(f"Session retrieval took {time.time() - t0:.4f}s")
                 logger.info(f"Session found: {session.id}")
             except Exception as e:
-                logger.warning(f"Failed to retrieve session {CURRENT_SESSION_ID}: {e}")
-                CURRENT_SESSION_ID = None
+                logger.warning(f"Failed to retrieve session {current_session_id}: {e}")
+                set_current_session_id(None)
         
         # Create new session if needed
         if not session:
             try:
                 t0 = time.time()
-                if isinstance(session_service, VertexAiSessionService):
-                     session = await session_service.create_session(app_name="agents", user_id=user_id)
+                if USE_VERTEX_SESSIONS:
+                     # Take a pre-created session from the warm-up pool when available
+                     session = session_pool.take() if session_pool else None
+                     if session is None:
+                         session = await session_service.create_session(app_name="agents", user_id=user_id)
                 else:
                      session = await session_service.create_session(app_name="agents", session_id="demo_session", user_id=user_id)
                 
                 logger.info(f"Session creation took {time.time() - t0:.4f}s")
-                CURRENT_SESSION_ID = session.id
+                set_current_session_id(session.id)
                 logger.info(f"New session created: {session.id}")
             except Exception as e:
                 logger.error(f"Failed to create session: {e}")
                 raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
         
-        session_id = CURRENT_SESSION_ID
+        session_id = session.id
+        if file:
+            # The upload becomes a versioned session artifact (identical photos are stored once)
+            await save_file_artifact(f"uploads/{file.filename}", user_id, session_id)
         
         logger.info(f"Calling runner.run with session_id={session_id}")
 
@@ -177,6 +395,10 @@ async def chat_endpoint(
         
         final_response_text = ""
         generated_image_url = None
+        turn_started_at = time.time()
+        turn_usage = TurnUsage(runner.agent.model)
+        # Artifacts saved during the turn (e.g. by the image tools), with their new versions
+        turn_artifacts: Dict[str, int] = {}
 
         # Iterate through events to find the final response
         async for event in runner.run_async(
@@ -185,49 +407,48 @@ async def chat_endpoint(
             new_message=content
         ):
             logger.info(f"Event received: {type(event)} - {event}")
+            turn_usage.observe(event)
+            turn_artifacts.update(event.actions.artifact_delta)
             if event.is_final_response():
                 # Extract text from the final response
                 if event.content and event.content.parts:
                     final_response_text = event.content.parts[0].text
-                    
-                    # Check for generated image in the response text OR if a new file was created recently
-                    # The agent/tool should return the path or filename
-                    # We look for "Saved at [filename]" pattern from the tool output
-                    # Or we can check the static directory for new files?
-                    # Better: The tool returns "Done! Saved at [filename]".
-                    # The agent might repeat this.
-                    
-                    # Simple heuristic: Look for known generated filenames in the text
-                    # generated_scene.png, generated_pattern.png, generated_selfie.png, generated_final_photo.png
-                    known_files = ["generated_scene.png", "generated_pattern.png", "generated_selfie.png", "generated_final_photo.png"]
-                    
-                    # Check if any of these files were modified recently (within last 10 seconds)
-                    # This is more robust than relying on the agent's text response
-                    for filename in known_files:
-                        filepath = os.path.join("static", filename)
-                        if os.path.exists(filepath):
-                            mtime = os.path.getmtime(filepath)
-                            if time.time() - mtime < 10: # Modified in last 10 seconds
-                                logger.info(f"Detected recently generated file: {filename}")
-                                # Construct URL
-                                # Assuming backend runs on port 8001
-                                generated_image_url = f"/static/{filename}"
-                                # Add a cache buster
-                                generated_image_url += f"?t={int(time.time())}"
-                                break
-                    
-                    # Fallback: Check text if file check didn't find anything (though file check should cover it)
-                    if not generated_image_url:
-                        for filename in known_files:
-                            if filename in final_response_text:
-                                # Construct URL
-                                generated_image_url = f"/static/{filename}"
-                                generated_image_url += f"?t={int(time.time())}"
-                                break
+
+        # Show the last known image the tools saved during this turn
+        known_files = ["generated_scene.png", "generated_pattern.png", "generated_selfie.png", "generated_final_photo.png", "generated_contact_sheet.png"]
+        generated = [filename for filename in turn_artifacts if filename in known_files]
+        if generated:
+            filename = generated[-1]
+            logger.info(f"Detected generated artifact: {filename} (version {turn_artifacts[filename]})")
+            state_store.set(ARTIFACTS, filename, {"session_id": session_id, "version": turn_artifacts[filename], "created_at": time.time()})
+            # Serve the smaller delivery copy once the MCP server has encoded it
+            generated_image_url = f"/static/{resolve_delivery(filename)}"
+            # Add a cache buster
+            generated_image_url += f"?t={int(time.time())}"
+
+        # Fallback: the agent may name an image that was generated earlier
+        if not generated_image_url and final_response_text:
+            for filename in known_files:
+                if filename in final_response_text:
+                    # Construct URL
+                    generated_image_url = f"/static/{resolve_delivery(filename)}"
+                    generated_image_url += f"?t={int(time.time())}"
+                    break
         
         if not final_response_text:
             final_response_text = "I'm sorry, I didn't get a response."
 
+        # Renders the agent handed off during this turn
+        job_ids = [job["id"] for job in job_store.list_for_session(session_id, created_after=turn_started_at)]
+        if job_ids and job_pool is not None:
+            job_pool.notify()
+
+        turn_summary = turn_usage.summary()
+        usage_tracker.record_turn(session_id, turn_summary)
+
+        # Summarize old history between turns so the next prompt stays small
+        agent_module.history_compactor.schedule(session_service, "agents", user_id, session_id)
+
         # Get the latest tree state to return to frontend
         from agent import get_tree_state
         current_state = get_tree_state()
@@ -235,40 +456,137 @@ async def chat_endpoint(
         return {
             "response": final_response_text,
             "tree_state": current_state,
-            "generated_image": generated_image_url
+            "generated_image": generated_image_url,
+            "jobs": job_ids,
+            "artifacts": turn_artifacts,
+            "usage": turn_summary
         }
         
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    """
+    Queues a generation job and returns its ID right away.
+    """
+    await wait_until_ready()
+    steps = request.steps if request.steps is not None else [{"tool": request.tool, "arguments": request.arguments}]
+    unknown = unknown_tools(steps, warmup_state.tool_names)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown MCP tools: {unknown}")
+    try:
+        job = job_store.submit(steps, session_id=get_current_session_id())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job_pool.notify()
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/api/jobs/{job['id']}"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, description="Long-poll: seconds to wait for the job to finish")):
+    """
+    Returns a job; with `wait`, holds the request until the job finishes or the wait expires.
+    """
+    if wait and job_pool is not None:
+        job = await job_pool.wait(job_id, wait)
+    else:
+        job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/api/sessions/{session_id}/usage")
+async def get_session_usage(session_id: str):
+    """
+    Returns the session's usage totals and its most recent turns (tokens, model and
+    tool latency, tool calls, image generations and estimated cost).
+    """
+    usage = usage_tracker.session_usage(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail=f"No usage recorded for session {session_id}")
+    return {"session_id": session_id, **usage}
+
 @app.get("/api/state")
 async def get_state():
     from agent import get_tree_state
     return get_tree_state()
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """
+    Returns runtime metrics of the backend components.
+    """
+    # Metrics are per worker process; the pid tells the workers apart
+    metrics = {"startup": STARTUP_TIMINGS, "worker_pid": os.getpid(), "state_backend": STATE_BACKEND}
+    if session_pool is not None:
+        metrics["session_pool"] = session_pool.stats()
+    if hasattr(session_service, "stats"):
+        metrics["session_cache"] = session_service.stats()
+    if hasattr(memory_service, "stats"):
+        metrics["memory_cache" if USE_VERTEX_SESSIONS else "memory"] = memory_service.stats()
+    if agent_module is not None:
+        metrics["history_compaction"] = agent_module.history_compactor.stats()
+        metrics["context_cache"] = agent_module.context_cache.stats()
+        if agent_module.mcp_toolset is not None:
+            metrics["mcp_supervisor"] = agent_module.mcp_toolset.supervisor.stats()
+        metrics["memory_ingestion"] = agent_module.ingestion_worker.stats()
+        if agent_module.model_cassette is not None:
+            metrics["cassette"] = agent_module.model_cassette.stats()
+    if job_pool is not None:
+        metrics["jobs"] = job_pool.stats()
+    metrics["usage"] = usage_tracker.stats()
+    metrics["admission"] = admission.stats()
+    metrics["idempotency"] = idempotency.stats()
+    metrics["artifacts"] = artifact_store.stats()
+    if hasattr(artifact_service, "stats"):
+        metrics["artifact_service"] = artifact_service.stats()
+    if agent_module is not None and warmup_state.done:
+        try:
+            metrics["encoding"] = json.loads(await agent_module.mcp_toolset.read_resource("metrics://encoding"))
+        except Exception as e:
+            metrics["encoding"] = {"error": str(e)}
+        try:
+            metrics["usage"]["tools"] = json.loads(await agent_module.mcp_toolset.read_resource("metrics://usage"))
+        except Exception as e:
+            metrics["usage"]["tools"] = {"error": str(e)}
+    return metrics
+
+@app.get("/api/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str):
+    """
+    Returns the bytes of an artifact version by its ID (the SHA-256 of its content).
+    """
+    info = artifact_service.blob_info(artifact_id) if hasattr(artifact_service, "blob_info") else None
+    if info is None or not os.path.exists(info[0]):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    path, mime_type = info
+    # Content-addressed: the bytes behind an ID never change
+    return FileResponse(path, media_type=mime_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+_static_assets: Optional[List[str]] = None
+
+def static_assets() -> List[str]:
+    """Images shipped in static/ (not artifacts); they never change, so the directory is listed once."""
+    global _static_assets
+    if _static_assets is None:
+        image_extensions = {".png", ".jpg", ".jpeg", ".webp", ".avif", ".svg"}
+        filenames = os.listdir("static") if os.path.exists("static") else []
+        _static_assets = sorted(
+            f for f in filenames
+            if os.path.splitext(f)[1].lower() in image_extensions and category_for(f) is None
+        )
+    return _static_assets
+
 @app.get("/api/photos")
 async def get_photos():
     """
-    Returns a list of image URLs from the static directory.
+    Returns the image URLs of static/: the app's own images, then the generated
+    images (newest first, delivery copies where available) from the artifact index.
     """
-    image_extensions = {".png", ".jpg", ".jpeg", ".webp", ".svg"}
-    static_dir = "static"
-    photos = []
-    
     # Base URL for static files (relative to current origin)
     base_url = "/static/"
-    
-    if os.path.exists(static_dir):
-        # Walk through the directory to find images
-        # Note: simplistic approach, just top level or recursive? 
-        # User request implies simplistic "the tree hanging picture from backend/static"
-        # Let's support top level files in static/
-        for filename in os.listdir(static_dir):
-            if any(filename.lower().endswith(ext) for ext in image_extensions):
-                photos.append(f"{base_url}{filename}")
-                
-    return photos
+    return [f"{base_url}{filename}" for filename in static_assets() + artifact_store.list_files()]
 
 if __name__ == "__main__":
     import uvicorn
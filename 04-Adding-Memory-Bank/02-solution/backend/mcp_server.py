@@ -1,13 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+import anyio
 from fastmcp import FastMCP
-from google import genai
 from google.genai import types
-from PIL import Image
+from PIL import Image, ImageDraw
+import functools
+import json
 import logging
+import math
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from model_backend import create_client
+from image_encoding import WRITE_STATS, DeliveryEncoder, write_image_bytes
+from image_parts import PreparedPartCache
+from artifact_store import ArtifactStore
+from usage import ModelCallLog
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -22,14 +33,44 @@ mcp = FastMCP("holidays")
 PROJECT_ID = os.getenv("PROJECT_ID")
 LOCATION = os.getenv("LOCATION", "us-central1")
 
-if PROJECT_ID:
-    genai_client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-else:
-    genai_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+genai_client = create_client(PROJECT_ID, LOCATION)
 TEXT_MODEL = "gemini-2.5-flash"
 IMAGE_MODEL = "gemini-2.5-flash-image"
 
-def generate_image(prompt: str, aspect_ratio: str, output_path: str, input_images=[]):
+# Parallel image generations per batch call, and variants per batch
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_VARIANTS = int(os.getenv("BATCH_MAX_VARIANTS", "8"))
+# Long edge in pixels of one contact sheet tile
+CONTACT_SHEET_TILE = 384
+
+# Index of generated images for the backend's quota sweeper; tools register what they write and touch what they read
+artifact_store = ArtifactStore()
+# Writes WebP/AVIF/JPEG delivery copies of the PNG masters off the tool's thread
+delivery_encoder = DeliveryEncoder(on_encoded=artifact_store.register)
+# Encoded request parts of recent images, so chained steps skip the disk read and re-encode
+part_cache = PreparedPartCache()
+# Tokens, latency and estimated cost of the model calls, per model and per tool
+model_calls = ModelCallLog()
+
+def call_model(tool: str, model: str, contents, config=None):
+    """Calls `generate_content` and records its usage under `tool`."""
+    started = time.perf_counter()
+    try:
+        response = genai_client.models.generate_content(model=model, contents=contents, config=config)
+    except Exception:
+        model_calls.record(model, None, time.perf_counter() - started, tool, failed=True)
+        raise
+    model_calls.record(model, response.usage_metadata, time.perf_counter() - started, tool)
+    return response
+
+def offload(fn):
+    """Runs a blocking tool in a worker thread, so the server keeps answering other requests (e.g. heartbeat pings)."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs))
+    return wrapper
+
+def generate_image(prompt: str, aspect_ratio: str, output_path: str, input_images=[], tool: str = None):
     """Take a prompt and input images (if any) and generate and save a resulting image using a model."""
     logger.info(f"Generating image with prompt: {prompt[:50]}...")
     logger.info(f"Output path: {output_path}")
@@ -38,12 +79,14 @@ def generate_image(prompt: str, aspect_ratio: str, output_path: str, input_image
 
     contents = [prompt]
     for image in input_images:
-        contents.append(Image.open(image))
+        artifact_store.touch(image)
+        contents.append(part_cache.get(image))
 
-    response = genai_client.models.generate_content(
-        model=IMAGE_MODEL,
-        contents=contents,
-        config=types.GenerateContentConfig(
+    response = call_model(
+        tool,
+        IMAGE_MODEL,
+        contents,
+        types.GenerateContentConfig(
             image_config=types.ImageConfig(
                 aspect_ratio=aspect_ratio,
             )
@@ -53,10 +96,16 @@ def generate_image(prompt: str, aspect_ratio: str, output_path: str, input_image
         if part.text is not None:
             print(part.text)
         elif part.inline_data is not None:
-            image = part.as_image()
-            image.save(output_path)
+            # Write the returned bytes as-is; they are only decoded if a transcode is needed
+            if write_image_bytes(part.inline_data.data, part.inline_data.mime_type, output_path):
+                logger.info(f"Transcoded {part.inline_data.mime_type} output to {output_path}")
+            else:
+                part_cache.put(output_path, part.inline_data.data, part.inline_data.mime_type)
+            artifact_store.register(output_path)
+            delivery_encoder.submit(output_path)
 
 @mcp.tool
+@offload
 def generate_holiday_scene(interest: str) -> str:
     """
     Generate a holiday scene image
@@ -64,7 +113,11 @@ def generate_holiday_scene(interest: str) -> str:
     Args:
         interest: A description of the user's interests (e.g., "birds", "music").
     """
-    prompt = (
+    generate_image(holiday_scene_prompt(interest), "16:9", "static/generated_scene.png", tool="generate_holiday_scene")
+    return "Done! Saved at generated_scene.png"
+
+def holiday_scene_prompt(interest: str) -> str:
+    return (
         f"""
         Create a cozy, high-fidelity 3D render of a winter holiday scene.
         The scene should be warm and inviting with soft cinematic lighting.
@@ -76,10 +129,9 @@ def generate_holiday_scene(interest: str) -> str:
         Aspect Ratio: 16:9 Landscape.
         """
     )
-    generate_image(prompt, "16:9", "static/generated_scene.png")
-    return "Done! Saved at generated_scene.png"
 
 @mcp.tool
+@offload
 def generate_sweater_pattern(motif: str) -> str:
     """
     Generate a holidays sweater pattern
@@ -87,7 +139,11 @@ def generate_sweater_pattern(motif: str) -> str:
     Args:
         motif: A description of the pattern on the sweater (e.g., "snowflake pattern", "reindeer pattern").
     """
-    prompt = (
+    generate_image(sweater_pattern_prompt(motif), "1:1", "static/generated_pattern.png", tool="generate_sweater_pattern")
+    return "Done! Saved at generated_pattern.png"
+
+def sweater_pattern_prompt(motif: str) -> str:
+    return (
         f"""
         Design a seamless, tileable "ugly holiday sweater" pattern.
         The design should mimic a knitted wool texture with visible stitching details.
@@ -98,8 +154,90 @@ def generate_sweater_pattern(motif: str) -> str:
         Do NOT show a shirt, a model, or folds. Show ONLY the rectangular pattern design.
         """
     )
-    generate_image(prompt, "1:1", "static/generated_pattern.png")
-    return "Done! Saved at generated_pattern.png"
+
+# Batch variant kinds: prompt builder, aspect ratio and file prefix
+VARIANT_KINDS = {
+    "sweater_pattern": (sweater_pattern_prompt, "1:1", "pattern"),
+    "holiday_scene": (holiday_scene_prompt, "16:9", "scene"),
+}
+
+def build_contact_sheet(tiles: list, output_path: str):
+    """Tiles (label, image path or None for a failed variant) into one labeled grid image."""
+    columns = math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / columns)
+    thumbnails = []
+    for label, path in tiles:
+        if path:
+            with Image.open(path) as image:
+                thumbnail = image.convert("RGB")
+            thumbnail.thumbnail((CONTACT_SHEET_TILE, CONTACT_SHEET_TILE))
+        else:
+            thumbnail = Image.new("RGB", (CONTACT_SHEET_TILE, CONTACT_SHEET_TILE), (60, 60, 60))
+            label = f"{label} (failed)"
+        thumbnails.append((label, thumbnail))
+
+    cell_width = max(t.width for _, t in thumbnails)
+    cell_height = max(t.height for _, t in thumbnails)
+    caption, padding = 24, 8
+    sheet = Image.new(
+        "RGB",
+        (columns * (cell_width + padding) + padding, rows * (cell_height + caption + padding) + padding),
+        (255, 255, 255),
+    )
+    draw = ImageDraw.Draw(sheet)
+    for index, (label, thumbnail) in enumerate(thumbnails):
+        x = padding + (index % columns) * (cell_width + padding)
+        y = padding + (index // columns) * (cell_height + caption + padding)
+        sheet.paste(thumbnail, (x + (cell_width - thumbnail.width) // 2, y + (cell_height - thumbnail.height) // 2))
+        draw.text((x + 4, y + cell_height + 6), f"{index + 1}. {label}"[:60], fill=(0, 0, 0))
+    sheet.save(output_path)
+    artifact_store.register(output_path)
+    delivery_encoder.submit(output_path)
+
+@mcp.tool
+@offload
+def generate_variants(kind: str, descriptions: list[str]) -> str:
+    """
+    Generate several sweater patterns or holiday scenes in parallel, plus a contact sheet comparing them.
+
+    Args:
+        kind: "sweater_pattern" (descriptions are motifs) or "holiday_scene" (descriptions are interests).
+        descriptions: The motifs or interests to compare (e.g., ["reindeer", "snowflakes", "penguins"]).
+    """
+    if kind not in VARIANT_KINDS:
+        return f"Error: Unknown kind '{kind}'. Use one of: {', '.join(VARIANT_KINDS)}."
+    if not descriptions:
+        return "Error: Please provide at least one motif or interest."
+    descriptions = descriptions[:BATCH_MAX_VARIANTS]
+    build_prompt, aspect_ratio, prefix = VARIANT_KINDS[kind]
+
+    def generate_variant(index: int, description: str):
+        filename = f"variants/{prefix}_{index + 1}.png"
+        # Drop the previous batch's file so a variant without image output is reported as failed
+        if os.path.exists(f"static/{filename}"):
+            os.remove(f"static/{filename}")
+        generate_image(build_prompt(description), aspect_ratio, f"static/{filename}", tool="generate_variants")
+        return filename
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_CONCURRENCY, len(descriptions))) as executor:
+        futures = [executor.submit(generate_variant, i, d) for i, d in enumerate(descriptions)]
+    results = []
+    for description, future in zip(descriptions, futures):
+        try:
+            filename = future.result()
+            results.append((description, filename if os.path.exists(f"static/{filename}") else None))
+        except Exception as e:
+            logger.error(f"Variant '{description}' failed: {e}")
+            results.append((description, None))
+
+    if not any(filename for _, filename in results):
+        return "Error: All variant generations failed. Please try again."
+
+    build_contact_sheet([(d, f"static/{f}" if f else None) for d, f in results], "static/generated_contact_sheet.png")
+    lines = ["Done! Saved at generated_contact_sheet.png", "Variants:"]
+    for index, (description, filename) in enumerate(results):
+        lines.append(f"{index + 1}. {description}: {filename or 'failed'}")
+    return "\n".join(lines)
 
 def analyze_person_features(image_path: str) -> str:
     """
@@ -111,7 +249,8 @@ def analyze_person_features(image_path: str) -> str:
             logger.warning(f"Image not found for analysis: {image_path}")
             return "a happy person"
 
-        image = Image.open(image_path)
+        artifact_store.touch(image_path)
+        image = part_cache.get(image_path)
         prompt = """
         Describe the physical appearance of the person in this image specifically for creating a cute, kawaii cartoon avatar.
         Focus on:
@@ -125,10 +264,7 @@ def analyze_person_features(image_path: str) -> str:
         Do not describe the clothing or background.
         """
         
-        response = genai_client.models.generate_content(
-            model=TEXT_MODEL,
-            contents=[prompt, image]
-        )
+        response = call_model("generate_wearing_sweater", TEXT_MODEL, [prompt, image])
         
         if response.text:
             description = response.text.strip()
@@ -141,6 +277,7 @@ def analyze_person_features(image_path: str) -> str:
     return "a happy person"
 
 @mcp.tool
+@offload
 def generate_wearing_sweater(image_path: str = None) -> str:
     """
     Generate a cute, kawaii, cartoon-style character wearing a sweater with the specified pattern.
@@ -175,10 +312,11 @@ def generate_wearing_sweater(image_path: str = None) -> str:
         """
     )
     
-    generate_image(prompt, "1:1", "static/generated_selfie.png", ["static/generated_pattern.png"])
+    generate_image(prompt, "1:1", "static/generated_selfie.png", ["static/generated_pattern.png"], tool="generate_wearing_sweater")
     return "Done! Saved at generated_selfie.png"
 
 @mcp.tool
+@offload
 def generate_final_photo() -> str:
     """
     Generate the final photo
@@ -206,8 +344,19 @@ def generate_final_photo() -> str:
         Ensure the perspective is grounded and realistic, as if taken with a 50mm lens.
         """
     )
-    generate_image(prompt, "16:9", "static/generated_final_photo.png", ["static/generated_selfie.png", "static/generated_scene.png"])
+    generate_image(prompt, "16:9", "static/generated_final_photo.png", ["static/generated_selfie.png", "static/generated_scene.png"], tool="generate_final_photo")
     return "Done! Saved at generated_final_photo.png"
 
+@mcp.resource("metrics://encoding")
+def encoding_metrics() -> str:
+    """Encoding counters: direct vs transcoded master writes, delivery copies, bytes saved and the part cache."""
+    return json.dumps({**delivery_encoder.stats(), **WRITE_STATS, "part_cache": part_cache.stats()})
+
+@mcp.resource("metrics://usage")
+def usage_metrics() -> str:
+    """Model calls made by the tools: count, failures, seconds, tokens and estimated cost per model and per tool."""
+    return json.dumps(model_calls.stats())
+
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    mcp.run()
+
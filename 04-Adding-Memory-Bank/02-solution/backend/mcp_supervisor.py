@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import AsyncExitStack
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+import anyio
+from google.adk.tools.mcp_tool.mcp_session_manager import MCPSessionManager
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, ErrorData, JSONRPCError
+
+logger = logging.getLogger(__name__)
+
+# Ping the MCP server this often, and count a ping as missed after the timeout
+MCP_HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("MCP_HEARTBEAT_INTERVAL_SECONDS", "5"))
+MCP_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("MCP_HEARTBEAT_TIMEOUT_SECONDS", "5"))
+# Consecutive missed pings after which the server counts as stuck and is restarted
+MCP_MAX_MISSED_HEARTBEATS = int(os.getenv("MCP_MAX_MISSED_HEARTBEATS", "2"))
+# Exponential backoff between restarts
+MCP_RESTART_BACKOFF_SECONDS = float(os.getenv("MCP_RESTART_BACKOFF_SECONDS", "1"))
+MCP_RESTART_BACKOFF_MAX_SECONDS = float(os.getenv("MCP_RESTART_BACKOFF_MAX_SECONDS", "30"))
+# How long the first connection (process spawn and handshake) may take
+MCP_STARTUP_TIMEOUT_SECONDS = float(os.getenv("MCP_STARTUP_TIMEOUT_SECONDS", "30"))
+
+# Circuit breaker states
+CLOSED = "closed"          # server healthy, calls go through
+OPEN = "open"              # server down, calls fail fast
+HALF_OPEN = "half_open"    # restart in progress, calls still fail fast until it answers
+
+UNAVAILABLE_MESSAGE = (
+    "The image tools are temporarily unavailable because the tool server is restarting. "
+    "Please tell the user to try again in a few seconds."
+)
+
+
+class McpUnavailableError(RuntimeError):
+    """Raised instead of waiting when the circuit breaker is open."""
+
+
+def is_transport_error(error: BaseException) -> bool:
+    """True for errors that mean the tool server did not answer, as opposed to a failing tool."""
+    if isinstance(error, (McpUnavailableError, anyio.ClosedResourceError, anyio.BrokenResourceError)):
+        return True
+    # Dropped connections and read timeouts (408) surface as McpError
+    return isinstance(error, McpError) and error.error.code in (CONNECTION_CLOSED, 408)
+
+
+def fail_pending_requests(session: ClientSession, reason: str) -> int:
+    """
+    Fails the calls waiting for responses on `session`. Tearing down the session
+    cancels its receive loop, which would leave them waiting for the read timeout.
+    """
+    failed = 0
+    for request_id, stream in list(session._response_streams.items()):
+        try:
+            stream.send_nowait(JSONRPCError(jsonrpc="2.0", id=request_id, error=ErrorData(code=CONNECTION_CLOSED, message=reason)))
+            failed += 1
+        except Exception:
+            pass
+    return failed
+
+
+class SupervisedSessionManager(MCPSessionManager):
+    """
+    MCP session manager that supervises the stdio tool server.
+
+    A single supervisor task owns the server process and its session (anyio
+    requires the stdio client to be closed by the task that opened it). It pings
+    the server every heartbeat interval; when the process exits or stops
+    answering, the session is torn down, which fails the calls in flight, and the
+    server is restarted with exponential backoff.
+
+    While the server is down the circuit breaker is open: `create_session` raises
+    `McpUnavailableError` at once instead of letting each tool call wait out the
+    read timeout, and `on_tool_error_callback` turns that into a tool error the
+    agent can relay to the user.
+    """
+
+    def __init__(
+        self,
+        connection_params,
+        heartbeat_interval: float = MCP_HEARTBEAT_INTERVAL_SECONDS,
+        heartbeat_timeout: float = MCP_HEARTBEAT_TIMEOUT_SECONDS,
+        max_missed_heartbeats: int = MCP_MAX_MISSED_HEARTBEATS,
+        **kwargs,
+    ):
+        super().__init__(connection_params, **kwargs)
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_missed_heartbeats = max_missed_heartbeats
+        self.state = HALF_OPEN
+        self._session: Optional[ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._check_now: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.starts = 0
+        self.restarts = 0
+        self.heartbeats = 0
+        self.missed_heartbeats = 0
+        self.breaker_trips = 0
+        self.fast_failures = 0
+        self.transport_errors = 0
+        self.opened_at: Optional[float] = None
+        self.downtime_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """Starts the supervisor task (idempotent; called on first use)."""
+        if self._task is None:
+            self._ready = asyncio.Event()
+            self._check_now = asyncio.Event()
+            self._task = asyncio.create_task(self._supervise())
+
+    async def create_session(self, headers: Optional[Dict[str, str]] = None) -> ClientSession:
+        self.start()
+        session = self._session
+        if session is not None and not self._is_session_disconnected(session):
+            return session
+        if self.starts == 0:
+            # First use: wait for the initial spawn rather than failing the warm-up
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=MCP_STARTUP_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                raise McpUnavailableError(f"MCP server did not start within {MCP_STARTUP_TIMEOUT_SECONDS}s: {self.last_error}")
+            if self._session is not None:
+                return self._session
+        self.fast_failures += 1
+        raise McpUnavailableError(UNAVAILABLE_MESSAGE)
+
+    def report_failure(self, error: BaseException):
+        """Called when a call failed at the transport level; triggers an immediate health check."""
+        self.transport_errors += 1
+        if self._check_now is not None:
+            self._check_now.set()
+
+    def _set_state(self, state: str, reason: str = ""):
+        if state == self.state:
+            return
+        if state == OPEN and self.state == CLOSED:
+            self.breaker_trips += 1
+            self.opened_at = time.monotonic()
+        if state == CLOSED and self.opened_at is not None:
+            self.downtime_seconds += time.monotonic() - self.opened_at
+            self.opened_at = None
+        logger.log(logging.WARNING if state == OPEN else logging.INFO, f"MCP circuit breaker {self.state} -> {state} {reason}".rstrip())
+        self.state = state
+
+    async def _supervise(self):
+        backoff = MCP_RESTART_BACKOFF_SECONDS
+        while not self._stopping:
+            self._set_state(HALF_OPEN)
+            reason = "session ended"
+            try:
+                async with AsyncExitStack() as stack:
+                    transports = await stack.enter_async_context(self._create_client())
+                    session = await stack.enter_async_context(
+                        ClientSession(*transports[:2], read_timeout_seconds=timedelta(seconds=self._connection_params.timeout))
+                    )
+                    await asyncio.wait_for(session.initialize(), timeout=MCP_STARTUP_TIMEOUT_SECONDS)
+                    if self.starts > 0:
+                        self.restarts += 1
+                    self.starts += 1
+                    self._session = session
+                    self._set_state(CLOSED)
+                    self._ready.set()
+                    backoff = MCP_RESTART_BACKOFF_SECONDS
+                    logger.info(f"MCP server session started (start #{self.starts})")
+                    reason = await self._heartbeat(session)
+                    if self._stopping:
+                        break
+                    # Open the breaker before failing the calls in flight, so their retries fail fast
+                    self._session = None
+                    self._set_state(OPEN, f"({reason})")
+                    failed = fail_pending_requests(session, f"MCP server stopped responding ({reason})")
+                    if failed:
+                        logger.warning(f"Failed {failed} MCP call(s) in flight")
+            except asyncio.CancelledError:
+                self._session = None
+                raise
+            except Exception as e:
+                # Also reached on cancellation, when the stdio client's task group reports the
+                # errors of its readers instead; the stop flag ends the loop in that case
+                reason = f"{type(e).__name__}: {e}"
+            self._session = None
+            if self._stopping:
+                break
+            self._ready.clear()
+            self.last_error = reason
+            self._set_state(OPEN, f"({reason})")
+            delay = backoff * random.uniform(0.8, 1.2)
+            backoff = min(backoff * 2, MCP_RESTART_BACKOFF_MAX_SECONDS)
+            logger.warning(f"MCP server down ({reason}); restarting in {delay:.1f}s")
+            try:
+                await asyncio.wait_for(self._check_now.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._check_now.clear()
+        self._session = None
+        self._set_state(OPEN, "(stopped)")
+
+    async def _heartbeat(self, session: ClientSession) -> str:
+        """Pings until the server stops answering; returns the reason."""
+        missed = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._check_now.wait(), timeout=self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._check_now.clear()
+            if self._stopping:
+                return "stopped"
+            if self._is_session_disconnected(session):
+                return "session closed"
+            try:
+                await asyncio.wait_for(session.send_ping(), timeout=self.heartbeat_timeout)
+                missed = 0
+                self.heartbeats += 1
+            except asyncio.TimeoutError:
+                missed += 1
+                self.missed_heartbeats += 1
+                logger.warning(f"MCP heartbeat missed ({missed}/{self.max_missed_heartbeats})")
+                if missed >= self.max_missed_heartbeats:
+                    return f"no heartbeat for {missed * self.heartbeat_timeout:.0f}s"
+            except Exception as e:
+                return f"heartbeat failed: {type(e).__name__}: {e}"
+
+    def on_tool_error_callback(self, tool, args: Dict[str, Any], tool_context, error: Exception) -> Optional[Dict[str, Any]]:
+        """Agent callback: replaces transport failures of MCP tools with a friendly tool error."""
+        if getattr(tool, "_mcp_session_manager", None) is not self or not is_transport_error(error):
+            return None
+        self.report_failure(error)
+        logger.warning(f"MCP tool {tool.name} unavailable: {type(error).__name__}: {error}")
+        return {"error": UNAVAILABLE_MESSAGE}
+
+    async def close(self, timeout: float = 10.0):
+        """Stops the supervisor, which closes the session and terminates the server process."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._check_now.set()
+        try:
+            # The owner task closes the stdio client itself; cancel only if that hangs
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        except Exception as e:
+            logger.warning(f"MCP supervisor stopped with an error: {e}")
+        self._task = None
+        self._session = None
+
+    def stats(self) -> Dict[str, Any]:
+        downtime = self.downtime_seconds + (time.monotonic() - self.opened_at if self.opened_at is not None else 0.0)
+        return {
+            "breaker": self.state,
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "breaker_trips": self.breaker_trips,
+            "heartbeats": self.heartbeats,
+            "missed_heartbeats": self.missed_heartbeats,
+            "fast_failures": self.fast_failures,
+            "transport_errors": self.transport_errors,
+            "downtime_seconds": round(downtime, 3),
+            "last_error": self.last_error,
+        }
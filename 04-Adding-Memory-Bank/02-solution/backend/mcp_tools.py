@@ -0,0 +1,61 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.mcp_tool import McpToolset
+
+from mcp_supervisor import SupervisedSessionManager, is_transport_error
+
+logger = logging.getLogger(__name__)
+
+
+class CachedMcpToolset(McpToolset):
+    """
+    McpToolset that lists the server's tools once and reuses them.
+
+    The plain toolset sends a `list_tools` request to the MCP server on every LLM
+    call. Our server's tools are fixed for the life of the process, so the listed
+    tools (and their schemas) are cached until `invalidate_tools` is called.
+
+    The server process is owned by a `SupervisedSessionManager`, which restarts it
+    when it dies or hangs and fails calls fast while it is down.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._cached_tools: Optional[List[BaseTool]] = None
+        self._mcp_session_manager = SupervisedSessionManager(self._connection_params, errlog=self._errlog)
+
+    @property
+    def supervisor(self) -> SupervisedSessionManager:
+        return self._mcp_session_manager
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        if self._cached_tools is None:
+            self._cached_tools = await super().get_tools(readonly_context)
+            logger.info(f"Cached {len(self._cached_tools)} MCP tool schemas")
+        return list(self._cached_tools)
+
+    def invalidate_tools(self):
+        self._cached_tools = None
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        """Calls an MCP tool outside of an agent turn (e.g. from a job worker) and returns its text output."""
+        session = await self._mcp_session_manager.create_session()
+        try:
+            result = await session.call_tool(name, arguments=arguments)
+        except Exception as e:
+            if is_transport_error(e):
+                self.supervisor.report_failure(e)
+            raise
+        text = "\n".join(c.text for c in result.content if getattr(c, "text", None))
+        if result.isError:
+            raise RuntimeError(text or f"MCP tool {name} failed")
+        return text
+
+    async def read_resource(self, uri: str) -> str:
+        """Reads a text resource (e.g. metrics://encoding) from the MCP server."""
+        session = await self._mcp_session_manager.create_session()
+        result = await session.read_resource(uri)
+        return "".join(c.text for c in result.contents if getattr(c, "text", None))
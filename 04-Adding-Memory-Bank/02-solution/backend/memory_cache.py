@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from google.adk.memory import BaseMemoryService, VertexAiMemoryBankService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.genai import types
+
+from local_memory_service import embed
+from state_store import CACHE_INDEX, StateStore
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBankService(VertexAiMemoryBankService):
+    """Vertex AI Memory Bank service that can also list all of a user's memories."""
+
+    async def list_memories(self, *, app_name: str, user_id: str) -> List[MemoryEntry]:
+        """
+        Fetches every memory in the (app, user) scope, without a similarity search.
+
+        Args:
+            app_name: The application the memories belong to.
+            user_id: The user the memories belong to.
+
+        Returns:
+            The user's memories, as search_memory would return them.
+        """
+        def fetch() -> List[MemoryEntry]:
+            retrieved = self._get_api_client().agent_engines.memories.retrieve(
+                name="reasoningEngines/" + self._agent_engine_id,
+                scope={"app_name": app_name, "user_id": user_id},
+            )
+            return [
+                MemoryEntry(
+                    author="user",
+                    content=types.Content(parts=[types.Part(text=item.memory.fact)], role="user"),
+                    timestamp=item.memory.update_time.isoformat(),
+                )
+                for item in retrieved
+            ]
+
+        # The pager issues blocking HTTP requests
+        return await asyncio.to_thread(fetch)
+
+
+class CachedMemoryService(BaseMemoryService):
+    """
+    Per-user cache of memories in front of the memory bank, ranked locally per query.
+
+    `PreloadMemoryTool` searches memories on every turn with the new user message as
+    the query, so a cache keyed by query would miss on every turn. Instead, a user's
+    whole memory set is fetched once, embedded, and ranked against each query
+    locally; the set is shared by all of that user's sessions until the TTL runs out
+    or the ingestion path writes a session to memory. At most `max_users` memory sets
+    are kept, least recently used first out.
+
+    With a shared `state_store`, invalidations bump a per-user generation counter so
+    that the caches of all workers drop the set, not just the writer's.
+    """
+
+    def __init__(
+        self,
+        inner: MemoryBankService,
+        ttl_seconds: float = 600.0,
+        state_store: Optional[StateStore] = None,
+        max_users: int = 1024,
+        top_k: int = 3,
+    ):
+        self.inner = inner
+        self.ttl_seconds = ttl_seconds
+        self.state_store = state_store
+        self.max_users = max_users
+        self.top_k = top_k
+        # (app_name, user_id) -> (memories, vectors, fetched_at, generation)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    async def add_session_to_memory(self, session):
+        await self.inner.add_session_to_memory(session)
+        self.invalidate(session.app_name, session.user_id)
+
+    def _generation(self, app_name: str, user_id: str) -> int:
+        if self.state_store is None:
+            return 0
+        return self.state_store.get(CACHE_INDEX, f"memory:{app_name}:{user_id}", 0)
+
+    def invalidate(self, app_name: str, user_id: str):
+        if self.state_store is not None:
+            self.state_store.incr(CACHE_INDEX, f"memory:{app_name}:{user_id}")
+        if self._entries.pop((app_name, user_id), None) is not None:
+            self.invalidations += 1
+
+    async def _memory_set(self, app_name: str, user_id: str) -> tuple:
+        key = (app_name, user_id)
+        entry = self._entries.get(key)
+        generation = self._generation(app_name, user_id)
+        if entry and time.monotonic() - entry[2] <= self.ttl_seconds and entry[3] == generation:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        memories = await self.inner.list_memories(app_name=app_name, user_id=user_id)
+        texts = [" ".join(part.text for part in m.content.parts if part.text) for m in memories]
+        vectors = np.stack([embed(text) for text in texts]) if texts else np.empty((0, 0), dtype=np.float32)
+        entry = (memories, vectors, time.monotonic(), generation)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        logger.info(f"Cached {len(memories)} memories for user {user_id}")
+        return entry
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        memories, vectors, _, _ = await self._memory_set(app_name, user_id)
+        if len(memories) <= self.top_k:
+            return SearchMemoryResponse(memories=list(memories))
+        scores = vectors @ embed(query)
+        # Stable sort keeps the memory bank's order among equally similar memories
+        ranked = np.argsort(-scores, kind="stable")[: self.top_k]
+        return SearchMemoryResponse(memories=[memories[i] for i in ranked])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "memories": sum(len(entry[0]) for entry in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
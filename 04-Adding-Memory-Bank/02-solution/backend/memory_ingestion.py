@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from state_store import CACHE_INDEX, StateStore, get_state_store
+
+logger = logging.getLogger(__name__)
+
+# Quiet period after the last turn of a session before its new events are ingested
+MEMORY_INGEST_DEBOUNCE_SECONDS = float(os.getenv("MEMORY_INGEST_DEBOUNCE_SECONDS", "5"))
+# Maximum number of concurrent memory bank writes
+MEMORY_INGEST_MAX_CONCURRENCY = int(os.getenv("MEMORY_INGEST_MAX_CONCURRENCY", "2"))
+
+
+@dataclass
+class PendingIngest:
+    memory_service: Any
+    session: Any
+    enqueued_at: float
+    timer: Optional[asyncio.Task] = None
+
+
+class MemoryIngestionWorker:
+    """
+    Debounced, bounded background ingestion of sessions into the memory service.
+
+    Each session is ingested at most once per debounce window, only with the events
+    added since its previous ingest. Writes are capped by a semaphore and every task
+    is tracked so `drain` can flush them on shutdown. Ingests of the same session
+    run one at a time, so two overlapping ones never both read the old watermark
+    and write the same events twice. The ingest watermark of each
+    session is kept in the shared state store, so workers never re-ingest events
+    another worker already wrote.
+    """
+
+    def __init__(
+        self,
+        debounce_seconds: float = MEMORY_INGEST_DEBOUNCE_SECONDS,
+        max_concurrency: int = MEMORY_INGEST_MAX_CONCURRENCY,
+        state_store: Optional[StateStore] = None,
+    ):
+        self.debounce_seconds = debounce_seconds
+        self.max_concurrency = max_concurrency
+        self.state_store = state_store
+        self._pending: Dict[tuple, PendingIngest] = {}
+        self._tasks = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Per-session locks, dropped once no ingest of the session holds or waits for them
+        self._key_locks: Dict[tuple, asyncio.Lock] = {}
+        self._key_users: Counter = Counter()
+        self._last_ingested: Dict[tuple, float] = {}
+        self.in_flight = 0
+        self.ingested_batches = 0
+        self.ingested_events = 0
+        self.failures = 0
+        self.last_lag_seconds = 0.0
+
+    @staticmethod
+    def _key(session) -> tuple:
+        return (session.app_name, session.user_id, session.id)
+
+    def _watermark(self, key: tuple) -> float:
+        if self.state_store is not None:
+            return self.state_store.get(CACHE_INDEX, "ingested:" + ":".join(key), 0.0)
+        return self._last_ingested.get(key, 0.0)
+
+    def _set_watermark(self, key: tuple, timestamp: float):
+        if self.state_store is not None:
+            self.state_store.set(CACHE_INDEX, "ingested:" + ":".join(key), timestamp)
+        else:
+            self._last_ingested[key] = timestamp
+
+    @staticmethod
+    def _accepts_deltas(memory_service) -> bool:
+        from google.adk.memory import InMemoryMemoryService
+        # InMemoryMemoryService replaces a session's events on every call, so it needs the full session
+        return not isinstance(memory_service, InMemoryMemoryService)
+
+    def _track(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def schedule(self, memory_service, session):
+        """Queues `session` for ingestion, restarting its debounce timer."""
+        key = self._key(session)
+        pending = self._pending.get(key)
+        if pending:
+            pending.session = session
+            pending.memory_service = memory_service
+            if pending.timer:
+                pending.timer.cancel()
+        else:
+            pending = PendingIngest(memory_service=memory_service, session=session, enqueued_at=time.monotonic())
+            self._pending[key] = pending
+        pending.timer = self._track(self._run_after_debounce(key))
+
+    async def _run_after_debounce(self, key: tuple):
+        await asyncio.sleep(self.debounce_seconds)
+        pending = self._pending.pop(key, None)
+        if pending:
+            await self._ingest(key, pending)
+
+    async def _ingest(self, key: tuple, pending: PendingIngest):
+        self._key_users[key] += 1
+        lock = self._key_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                await self._ingest_locked(key, pending)
+        finally:
+            self._key_users[key] -= 1
+            if not self._key_users[key]:
+                del self._key_users[key]
+                del self._key_locks[key]
+
+    async def _ingest_locked(self, key: tuple, pending: PendingIngest):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            session = pending.session
+            since = self._watermark(key)
+            new_events = [e for e in session.events if e.timestamp > since]
+            if not new_events:
+                return
+            if self._accepts_deltas(pending.memory_service):
+                session = session.model_copy(update={"events": new_events})
+
+            self.in_flight += 1
+            try:
+                await pending.memory_service.add_session_to_memory(session)
+                self._set_watermark(key, new_events[-1].timestamp)
+                self.ingested_batches += 1
+                self.ingested_events += len(new_events)
+                self.last_lag_seconds = time.monotonic() - pending.enqueued_at
+                logger.info(f"Ingested {len(new_events)} events of session {session.id} into memory")
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Failed to ingest session {session.id} into memory: {e}")
+            finally:
+                self.in_flight -= 1
+
+    async def drain(self, timeout: float = 30.0):
+        """Flushes pending sessions immediately and waits for all writes to finish."""
+        for key, pending in list(self._pending.items()):
+            if pending.timer:
+                pending.timer.cancel()
+            del self._pending[key]
+            self._track(self._ingest(key, pending))
+        if self._tasks:
+            logger.info(f"Draining {len(self._tasks)} memory ingestion tasks")
+            _, not_done = await asyncio.wait(list(self._tasks), timeout=timeout)
+            if not_done:
+                logger.warning(f"{len(not_done)} memory ingestion tasks did not finish before shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        oldest = min((p.enqueued_at for p in self._pending.values()), default=None)
+        return {
+            "queue_depth": len(self._pending),
+            "in_flight": self.in_flight,
+            "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "last_ingest_lag_seconds": round(self.last_lag_seconds, 3),
+            "ingested_batches": self.ingested_batches,
+            "ingested_events": self.ingested_events,
+            "failures": self.failures,
+        }
+
+
+ingestion_worker = MemoryIngestionWorker(state_store=get_state_store())
@@ -0,0 +1,216 @@
+import hashlib
+import io
+import logging
+import os
+import random
+import time
+from typing import Any, List
+
+from google import genai
+from google.genai import types
+from PIL import Image, ImageDraw
+
+from cassette import SUMMARY_CHARS, open_cassette
+
+logger = logging.getLogger(__name__)
+
+# Selects the model backend used by the MCP server:
+#   "genai" (default) -> real Gemini models via Vertex AI or an API key
+#   "local"           -> deterministic offline stand-in, no network or credentials
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "genai").lower()
+
+# Knobs for the local backend so pipelines can be exercised under realistic conditions
+LOCAL_MODEL_LATENCY_MS = float(os.getenv("LOCAL_MODEL_LATENCY_MS", "0"))
+LOCAL_MODEL_ERROR_RATE = float(os.getenv("LOCAL_MODEL_ERROR_RATE", "0"))
+LOCAL_MODEL_SEED = int(os.getenv("LOCAL_MODEL_SEED", "0"))
+
+# Long edge (in pixels) of synthesized images
+LOCAL_IMAGE_SIZE = int(os.getenv("LOCAL_IMAGE_SIZE", "1024"))
+
+PERSON_DESCRIPTIONS = [
+    "a young woman with long brown hair and round glasses",
+    "a smiling man with short black hair and a neat beard",
+    "a cheerful kid with curly red hair and freckles",
+    "an older man with grey hair and a warm smile",
+    "a young man with blond hair and a knitted beanie",
+    "a woman with a dark bob haircut and green eyes",
+]
+
+HOLIDAY_PALETTE = [
+    (178, 34, 34),
+    (0, 100, 0),
+    (245, 245, 245),
+    (212, 175, 55),
+    (25, 25, 112),
+    (139, 69, 19),
+]
+
+
+class LocalModelError(RuntimeError):
+    """Raised by the local backend when error injection triggers."""
+
+
+def _content_digest(contents: List[Any]) -> str:
+    """Builds a stable digest of the request contents (text and image bytes)."""
+    digest = hashlib.sha256()
+    for item in contents:
+        if isinstance(item, str):
+            digest.update(item.encode("utf-8"))
+        elif isinstance(item, Image.Image):
+            digest.update(item.tobytes())
+        elif isinstance(item, types.Part):
+            if item.text is not None:
+                digest.update(item.text.encode("utf-8"))
+            elif item.inline_data is not None and item.inline_data.data:
+                digest.update(item.inline_data.data)
+        else:
+            digest.update(repr(item).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _image_size(aspect_ratio: str) -> tuple:
+    """Returns (width, height) for an aspect ratio like '16:9' with the configured long edge."""
+    try:
+        w_ratio, h_ratio = (float(x) for x in aspect_ratio.split(":"))
+    except (AttributeError, ValueError):
+        w_ratio, h_ratio = 1.0, 1.0
+    if w_ratio >= h_ratio:
+        return LOCAL_IMAGE_SIZE, max(1, round(LOCAL_IMAGE_SIZE * h_ratio / w_ratio))
+    return max(1, round(LOCAL_IMAGE_SIZE * w_ratio / h_ratio)), LOCAL_IMAGE_SIZE
+
+
+def synthesize_png(seed: str, aspect_ratio: str) -> bytes:
+    """
+    Draws a deterministic festive placeholder image.
+
+    Args:
+        seed: Any string; the same seed always yields the same bytes.
+        aspect_ratio: Requested aspect ratio (e.g., '1:1', '16:9').
+
+    Returns:
+        PNG-encoded image bytes.
+    """
+    rng = random.Random(seed)
+    width, height = _image_size(aspect_ratio)
+    background = rng.choice(HOLIDAY_PALETTE)
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+
+    # Knitted-looking stripes and a scatter of "ornaments"
+    stripe = max(8, height // 12)
+    for y in range(0, height, stripe * 2):
+        draw.rectangle([0, y, width, y + stripe // 2], fill=rng.choice(HOLIDAY_PALETTE))
+    for _ in range(24):
+        r = rng.randint(max(4, width // 80), max(8, width // 20))
+        x, y = rng.randint(0, width), rng.randint(0, height)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=rng.choice(HOLIDAY_PALETTE))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LocalModels:
+    """Mimics the subset of `genai.Client.models` used by the MCP server."""
+
+    def __init__(self):
+        self._rng = random.Random(LOCAL_MODEL_SEED)
+        self.calls = 0
+
+    def _simulate_conditions(self, model: str):
+        self.calls += 1
+        if LOCAL_MODEL_LATENCY_MS > 0:
+            time.sleep(LOCAL_MODEL_LATENCY_MS / 1000.0)
+        if LOCAL_MODEL_ERROR_RATE > 0 and self._rng.random() < LOCAL_MODEL_ERROR_RATE:
+            raise LocalModelError(f"Injected failure for model {model}")
+
+    def generate_content(self, model: str, contents, config: types.GenerateContentConfig = None):
+        if not isinstance(contents, list):
+            contents = [contents]
+        self._simulate_conditions(model)
+        digest = _content_digest(contents)
+
+        image_config = getattr(config, "image_config", None) if config else None
+        if image_config is not None or "image" in model:
+            aspect_ratio = getattr(image_config, "aspect_ratio", None) or "1:1"
+            part = types.Part.from_bytes(data=synthesize_png(digest, aspect_ratio), mime_type="image/png")
+        else:
+            description = PERSON_DESCRIPTIONS[int(digest, 16) % len(PERSON_DESCRIPTIONS)]
+            part = types.Part.from_text(text=description)
+
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+        )
+
+
+class LocalClient:
+    """Offline, deterministic stand-in for `genai.Client`."""
+
+    def __init__(self):
+        self.models = LocalModels()
+
+
+class CassetteModels:
+    """Records `generate_content` calls of the wrapped models into a cassette, or replays them from it."""
+
+    def __init__(self, cassette, models=None):
+        self.cassette = cassette
+        self.models = models
+
+    def generate_content(self, model: str, contents, config: types.GenerateContentConfig = None):
+        if not isinstance(contents, list):
+            contents = [contents]
+        image_config = getattr(config, "image_config", None) if config else None
+        aspect_ratio = getattr(image_config, "aspect_ratio", None) or ""
+        key = hashlib.sha256(f"{model}|{aspect_ratio}|{_content_digest(contents)}".encode("utf-8")).hexdigest()
+        if self.cassette.replaying:
+            return types.GenerateContentResponse.model_validate(self.cassette.replay(key))
+        summary = next((item for item in contents if isinstance(item, str)), "")[:SUMMARY_CHARS]
+        return self.cassette.call(
+            key,
+            model,
+            summary,
+            lambda: self.models.generate_content(model=model, contents=contents, config=config),
+            lambda response: response.model_dump(mode="json", exclude_none=True),
+        )
+
+
+class CassetteClient:
+    """Client whose model calls go through a cassette (see cassette.py)."""
+
+    def __init__(self, cassette, client=None):
+        self.client = client
+        self.models = CassetteModels(cassette, client.models if client is not None else None)
+
+
+def create_client(project_id: str = None, location: str = "us-central1"):
+    """
+    Creates the model client for the configured MODEL_BACKEND.
+
+    Args:
+        project_id: Google Cloud project; when set the genai backend uses Vertex AI.
+        location: Vertex AI location.
+
+    Returns:
+        A `genai.Client` or a `LocalClient` exposing the same `models.generate_content` call,
+        wrapped in a `CassetteClient` while recording or replaying model calls.
+    """
+    cassette = open_cassette("mcp")
+    if cassette is None:
+        return _create_backend_client(project_id, location)
+    if cassette.replaying:
+        return CassetteClient(cassette)
+    return CassetteClient(cassette, _create_backend_client(project_id, location))
+
+
+def _create_backend_client(project_id: str, location: str):
+    if MODEL_BACKEND == "local":
+        logger.info(
+            f"Using local model backend (latency={LOCAL_MODEL_LATENCY_MS}ms, error_rate={LOCAL_MODEL_ERROR_RATE})"
+        )
+        return LocalClient()
+    if MODEL_BACKEND != "genai":
+        logger.warning(f"Unknown MODEL_BACKEND '{MODEL_BACKEND}'. Falling back to genai.")
+    if project_id:
+        return genai.Client(vertexai=True, project=project_id, location=location)
+    return genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
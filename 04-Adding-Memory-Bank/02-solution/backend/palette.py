@@ -0,0 +1,189 @@
+import logging
+import time
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Long edge of the downsampled image that is clustered
+ANALYSIS_SIZE = 96
+PALETTE_SIZE = 5
+KMEANS_ITERATIONS = 12
+# Clusters below this share of pixels do not count as a palette color
+MIN_SHARE = 0.08
+# Chroma (max - min channel) above which a color counts as colorful rather than neutral
+COLORFUL_CHROMA = 0.25
+
+# Reference palettes (RGB) and mood (brightness, saturation) of the tree themes
+THEMES: Dict[str, Dict[str, Any]] = {
+    "emerald_gold": {"colors": [(20, 90, 50), (212, 175, 55), (245, 230, 190)], "brightness": 0.55, "saturation": 0.55},
+    "ruby_red": {"colors": [(155, 17, 30), (230, 60, 60), (250, 240, 230)], "brightness": 0.55, "saturation": 0.7},
+    "frosted_silver": {"colors": [(200, 210, 220), (150, 170, 190), (245, 250, 255)], "brightness": 0.8, "saturation": 0.12},
+    "ice_blue": {"colors": [(60, 130, 200), (170, 210, 240), (240, 248, 255)], "brightness": 0.75, "saturation": 0.45},
+    "candy_cane": {"colors": [(220, 30, 50), (250, 250, 250), (30, 140, 70)], "brightness": 0.7, "saturation": 0.6},
+    "rustic_woodland": {"colors": [(110, 75, 45), (160, 120, 80), (70, 90, 50)], "brightness": 0.4, "saturation": 0.45},
+    "midnight_blue": {"colors": [(20, 30, 70), (60, 70, 130), (200, 200, 220)], "brightness": 0.3, "saturation": 0.5},
+    "pastel_dream": {"colors": [(250, 200, 215), (200, 225, 250), (225, 245, 210)], "brightness": 0.88, "saturation": 0.22},
+}
+
+# Light colors; "multicolor" is chosen separately for colorful, mixed palettes
+LIGHT_COLORS: Dict[str, Tuple[int, int, int]] = {
+    "warm_white": (255, 214, 170),
+    "cool_white": (215, 230, 255),
+    "gold": (255, 190, 60),
+    "red": (230, 40, 40),
+    "green": (40, 200, 80),
+    "blue": (50, 110, 240),
+    "purple": (150, 70, 210),
+    "pink": (245, 120, 180),
+}
+
+ORNAMENT_TEXTURES: Dict[str, Tuple[int, int, int]] = {
+    "default_gold": (212, 175, 55),
+    "red_velvet": (140, 20, 35),
+    "blue_ice": (120, 180, 230),
+    "silver_glitter": (192, 192, 200),
+    "emerald_glass": (30, 130, 80),
+    "rustic_wood": (130, 90, 55),
+    "matte_pastel": (235, 205, 220),
+    "midnight_satin": (35, 40, 90),
+    "snow_white": (245, 245, 250),
+}
+
+
+def _to_array(colors) -> np.ndarray:
+    return np.asarray(colors, dtype=np.float32) / 255.0
+
+
+THEME_COLORS = {name: _to_array(theme["colors"]) for name, theme in THEMES.items()}
+LIGHT_ARRAY = _to_array(list(LIGHT_COLORS.values()))
+TEXTURE_ARRAY = _to_array(list(ORNAMENT_TEXTURES.values()))
+
+
+def load_pixels(image_path: str, size: int = ANALYSIS_SIZE) -> np.ndarray:
+    """Decodes and downsamples an image to at most `size` pixels per edge; returns (N, 3) floats in [0, 1]."""
+    with Image.open(image_path) as image:
+        # JPEG can decode at a reduced scale directly
+        image.draft("RGB", (size * 2, size * 2))
+        image = image.convert("RGB")
+        image.thumbnail((size, size), Image.Resampling.BILINEAR)
+        return np.asarray(image, dtype=np.float32).reshape(-1, 3) / 255.0
+
+
+def kmeans(pixels: np.ndarray, k: int = PALETTE_SIZE, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized k-means with k-means++ seeding.
+
+    Returns:
+        (centers, shares): the cluster colors and the fraction of pixels in each,
+        sorted by share descending.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(pixels))
+    centers = [pixels[rng.integers(len(pixels))]]
+    closest = ((pixels - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(pixels), p=closest / total) if total > 0 else rng.integers(len(pixels))
+        centers.append(pixels[index])
+        closest = np.minimum(closest, ((pixels - pixels[index]) ** 2).sum(axis=1))
+    centers = np.stack(centers)
+
+    for _ in range(iterations):
+        # |x - c|^2 up to the per-pixel constant |x|^2, as one matrix product
+        distances = (centers ** 2).sum(axis=1)[None, :] - 2.0 * pixels @ centers.T
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k).astype(np.float32)
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=k) for c in range(3)], axis=1).astype(np.float32)
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(updated, centers, atol=1e-4):
+            break
+        centers = updated
+
+    shares = counts / counts.sum()
+    order = np.argsort(-shares)
+    return centers[order], shares[order]
+
+
+def saturation_of(colors: np.ndarray) -> np.ndarray:
+    high = colors.max(axis=-1)
+    low = colors.min(axis=-1)
+    return np.where(high > 0, (high - low) / np.maximum(high, 1e-6), 0.0)
+
+
+def hue_of(colors: np.ndarray) -> np.ndarray:
+    """Hue angle in [0, 1) of RGB colors."""
+    r, g, b = colors[..., 0], colors[..., 1], colors[..., 2]
+    return (np.arctan2(np.sqrt(3) * (g - b), 2 * r - g - b) / (2 * np.pi)) % 1.0
+
+
+def _nearest(color: np.ndarray, candidates: np.ndarray) -> int:
+    return int(((candidates - color) ** 2).sum(axis=1).argmin())
+
+
+def _to_hex(color: np.ndarray) -> str:
+    return "#" + "".join(f"{int(round(c * 255)):02x}" for c in color)
+
+
+def suggest_tree_config(image_path: str) -> Dict[str, Any]:
+    """
+    Derives a tree theme, light color and ornament texture from an image's colors.
+
+    Args:
+        image_path: Path of the image to analyze.
+
+    Returns:
+        The suggested `theme`, `lights_color` and `ornament_texture`, plus the
+        dominant palette and brightness / saturation statistics.
+    """
+    started = time.perf_counter()
+    pixels = load_pixels(image_path)
+    centers, shares = kmeans(pixels)
+
+    luma = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    brightness = float(luma.mean())
+    saturation = float(saturation_of(pixels).mean())
+
+    significant = shares >= MIN_SHARE
+    palette, weights = centers[significant], shares[significant] / shares[significant].sum()
+    # Chroma rather than HSV saturation, so near-black colors do not count as vivid
+    palette_chroma = palette.max(axis=1) - palette.min(axis=1)
+
+    # Theme: share-weighted distance of the palette to the theme colors, plus the mood difference
+    theme_scores = {}
+    for name, theme_colors in THEME_COLORS.items():
+        distances = np.sqrt(((palette[:, None, :] - theme_colors[None, :, :]) ** 2).sum(axis=2)).min(axis=1)
+        mood = abs(brightness - THEMES[name]["brightness"]) + abs(saturation - THEMES[name]["saturation"])
+        theme_scores[name] = float((weights * distances).sum() + 0.5 * mood)
+    theme = min(theme_scores, key=theme_scores.get)
+
+    # Lights: multicolor for several distinct vivid hues, the most vivid color otherwise,
+    # and warm or cool white for neutral images
+    colorful = palette_chroma > COLORFUL_CHROMA
+    vivid_hues = np.sort(hue_of(palette[colorful]))
+    hue_gaps = np.diff(np.concatenate([vivid_hues, vivid_hues[:1] + 1.0])) if len(vivid_hues) else np.array([])
+    if len(vivid_hues) >= 3 and (hue_gaps > 0.12).sum() >= 3:
+        lights_color = "multicolor"
+    elif colorful.any():
+        vivid = palette[colorful][np.argmax(palette_chroma[colorful] * weights[colorful])]
+        lights_color = list(LIGHT_COLORS)[_nearest(vivid, LIGHT_ARRAY)]
+    else:
+        mean = (palette * weights[:, None]).sum(axis=0)
+        lights_color = "warm_white" if mean[0] >= mean[2] else "cool_white"
+
+    # Ornaments: closest texture to the dominant palette color
+    ornament_texture = list(ORNAMENT_TEXTURES)[_nearest(palette[0], TEXTURE_ARRAY)]
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Analyzed {image_path} in {elapsed_ms:.1f}ms: {theme}, {lights_color}, {ornament_texture}")
+    return {
+        "theme": theme,
+        "lights_color": lights_color,
+        "ornament_texture": ornament_texture,
+        "palette": [{"color": _to_hex(c), "share": round(float(s), 3)} for c, s in zip(centers, shares)],
+        "brightness": round(brightness, 3),
+        "saturation": round(saturation, 3),
+        "analysis_ms": round(elapsed_ms, 1),
+    }
@@ -0,0 +1,106 @@
+"""
+Startup profiling for the backend.
+
+    python profile_startup.py imports [--top N]   # import-time report for `import main`
+    python profile_startup.py ttfr [--runs N]     # time-to-first-request benchmark
+
+`imports` runs `python -X importtime -c "import main"` and lists the modules with the
+largest cumulative import time. `ttfr` starts the server with uvicorn and measures how
+long it takes until the first request is served (`/api/state`) and until the backend
+reports ready (`/readyz`).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_report(top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = len(name) - len(name.lstrip()) - 1
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+
+    total_us = sum(cumulative for cumulative, _, depth, _ in rows if depth == 0)
+    print(f"Total import time of main: {total_us / 1e6:.3f}s\n")
+    print(f"{'cumulative (s)':>15} {'self (s)':>10}  module")
+    for cumulative_us, self_us, _, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1e6:>15.3f} {self_us / 1e6:>10.3f}  {name}")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, started: float, timeout: float) -> float:
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{url} did not respond within {timeout}s")
+
+
+def time_to_first_request(runs: int, timeout: float):
+    first_request, ready = [], []
+    for run in range(runs):
+        port = _free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            first_request.append(_wait_for(f"http://127.0.0.1:{port}/api/state", started, timeout))
+            ready.append(_wait_for(f"http://127.0.0.1:{port}/readyz", started, timeout))
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+        print(f"run {run + 1}: first request {first_request[-1]:.3f}s, ready {ready[-1]:.3f}s")
+
+    print(json.dumps({
+        "time_to_first_request_s": round(statistics.median(first_request), 3),
+        "time_to_ready_s": round(statistics.median(ready), 3),
+        "runs": runs,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    imports = sub.add_parser("imports", help="Import-time report for `import main`")
+    imports.add_argument("--top", type=int, default=20)
+    ttfr = sub.add_parser("ttfr", help="Time-to-first-request benchmark")
+    ttfr.add_argument("--runs", type=int, default=3)
+    ttfr.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if args.command == "imports":
+        import_report(args.top)
+    else:
+        time_to_first_request(args.runs, args.timeout)
@@ -0,0 +1,188 @@
+"""
+Offline performance regressions from recorded model calls.
+
+    python replay_bench.py run CASSETTE [--realtime] [--no-allocations] [--top N] [--output FILE]
+    python replay_bench.py compare BASELINE.json CANDIDATE.json
+
+Record a cassette once against the real models by running the backend with
+MODEL_CASSETTE=<dir> MODEL_CASSETTE_MODE=record and chatting through the scenario.
+`run` then starts the backend in-process with the cassette in replay mode and sends
+the recorded chat turns to /api/chat, so every model call (the agent's and the MCP
+server's) is answered from the cassette. It reports per-turn wall-clock time, CPU
+time, peak traced allocations and the top allocation sites, plus the MCP server's
+CPU time (including its startup), as JSON. `compare` diffs two reports, e.g. from two commits.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Longest wait for the backend to report ready
+STARTUP_TIMEOUT_SECONDS = 300
+
+# Replay runs without network side effects: no context cache or client warm-up,
+# in-memory state and sessions
+REPLAY_ENV = {
+    "CONTEXT_CACHE_ENABLED": "false",
+    "WARMUP_MODEL_CLIENT": "false",
+    "USE_MEMORY_BANK": "false",
+    "STATE_BACKEND": "memory",
+    "SESSION_BACKEND": "memory",
+    "LOCAL_MEMORY_BACKEND": "inmemory",
+}
+
+
+def _allocation_sites(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, top: int) -> list:
+    """Source lines whose live allocations grew the most between two snapshots."""
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    diffs = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    sites = []
+    for diff in diffs[:top]:
+        frame = diff.traceback[0]
+        filename = os.path.relpath(frame.filename, BACKEND_DIR) if frame.filename.startswith(BACKEND_DIR) else frame.filename
+        sites.append({"site": f"{filename}:{frame.lineno}", "kib": round(diff.size_diff / 1024, 1), "count": diff.count_diff})
+    return sites
+
+
+def run(cassette_dir: str, realtime: bool, allocations: bool, top: int) -> dict:
+    cassette_dir = os.path.abspath(cassette_dir)
+    for name, value in REPLAY_ENV.items():
+        os.environ.setdefault(name, value)
+    os.environ.update({
+        "MODEL_CASSETTE": cassette_dir,
+        "MODEL_CASSETTE_MODE": "replay",
+        "MODEL_CASSETTE_REALTIME": "true" if realtime else "false",
+    })
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+
+    from cassette import Cassette
+    from fastapi.testclient import TestClient
+
+    turns = Cassette(cassette_dir, "agent", "off").turns()
+    if not turns:
+        raise SystemExit(f"{cassette_dir} has no recorded turns (turns.jsonl)")
+
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if allocations:
+        tracemalloc.start()
+    started = time.perf_counter()
+    import main
+
+    results = []
+    with TestClient(main.app) as client:
+        while client.get("/readyz").status_code != 200:
+            if main.INIT_ERROR:
+                raise SystemExit(f"Backend failed to initialize: {main.INIT_ERROR}")
+            if time.perf_counter() - started > STARTUP_TIMEOUT_SECONDS:
+                raise SystemExit(f"Backend was not ready after {STARTUP_TIMEOUT_SECONDS}s")
+            time.sleep(0.05)
+        startup_seconds = time.perf_counter() - started
+
+        for index, turn in enumerate(turns):
+            files = None
+            if "upload" in turn:
+                with open(os.path.join(cassette_dir, "blobs", turn["upload"]["blob"]), "rb") as f:
+                    files = {"file": (turn["upload"]["filename"], f.read())}
+            if allocations:
+                before = tracemalloc.take_snapshot()
+                tracemalloc.reset_peak()
+                traced_at_start = tracemalloc.get_traced_memory()[0]
+            wall, cpu = time.perf_counter(), time.process_time()
+            response = client.post("/api/chat", data={"message": turn["message"]}, files=files)
+            result = {
+                "turn": index,
+                "status": response.status_code,
+                "wall_seconds": round(time.perf_counter() - wall, 4),
+                "cpu_seconds": round(time.process_time() - cpu, 4),
+            }
+            if allocations:
+                # Peak of traced memory above what was live when the turn started
+                result["peak_kib"] = round((tracemalloc.get_traced_memory()[1] - traced_at_start) / 1024, 1)
+                result["top_allocations"] = _allocation_sites(before, tracemalloc.take_snapshot(), top)
+            results.append(result)
+            print(f"turn {index}: {response.status_code} in {result['wall_seconds']:.3f}s wall, {result['cpu_seconds']:.3f}s CPU", file=sys.stderr)
+
+        cassette_stats = client.get("/api/metrics").json().get("cassette")
+    if allocations:
+        tracemalloc.stop()
+    # The MCP server was reaped when the TestClient shut the backend down
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return {
+        "cassette": cassette_dir,
+        "realtime": realtime,
+        "startup_seconds": round(startup_seconds, 4),
+        "turns": results,
+        "totals": {
+            "wall_seconds": round(sum(r["wall_seconds"] for r in results), 4),
+            "cpu_seconds": round(sum(r["cpu_seconds"] for r in results), 4),
+            "mcp_cpu_seconds": round(
+                (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime), 4
+            ),
+            **({"peak_kib": max(r["peak_kib"] for r in results)} if allocations else {}),
+        },
+        "agent_cassette": cassette_stats,
+    }
+
+
+def _change(baseline: float, candidate: float) -> str:
+    if not baseline:
+        return "n/a"
+    return f"{(candidate - baseline) / baseline * 100:+.1f}%"
+
+
+def compare(baseline_path: str, candidate_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    print(f"{'metric':<24} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    rows = [("startup_seconds", baseline["startup_seconds"], candidate["startup_seconds"])]
+    rows += [(name, value, candidate["totals"].get(name)) for name, value in baseline["totals"].items()]
+    for base_turn, cand_turn in zip(baseline["turns"], candidate["turns"]):
+        for name in ("wall_seconds", "cpu_seconds", "peak_kib"):
+            if name in base_turn and name in cand_turn:
+                rows.append((f"turn {base_turn['turn']} {name}", base_turn[name], cand_turn[name]))
+    for name, base_value, cand_value in rows:
+        if cand_value is None:
+            continue
+        print(f"{name:<24} {base_value:>12} {cand_value:>12} {_change(base_value, cand_value):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="replay a cassette and profile the backend")
+    run_parser.add_argument("cassette", help="cassette directory recorded with MODEL_CASSETTE_MODE=record")
+    run_parser.add_argument("--realtime", action="store_true", help="wait out the recorded model latencies")
+    run_parser.add_argument("--no-allocations", dest="allocations", action="store_false", help="skip tracemalloc (it slows the run down)")
+    run_parser.add_argument("--top", type=int, default=10, help="allocation sites listed per turn")
+    run_parser.add_argument("--output", help="write the report to this file instead of stdout")
+
+    compare_parser = subparsers.add_parser("compare", help="diff two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare(args.baseline, args.candidate)
+        return
+
+    report = run(args.cassette, args.realtime, args.allocations, args.top)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
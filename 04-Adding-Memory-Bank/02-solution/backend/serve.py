@@ -0,0 +1,66 @@
+"""
+Production launcher: runs the backend with several uvicorn worker processes.
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8000]
+
+Each worker is a separate process with its own agent, MCP server and caches, so
+state that must be consistent across requests lives in shared stores: sessions in
+Vertex AI or SQLite, tree state / current session / cache versions in the state
+store (SQLite by default, or Redis with STATE_BACKEND=redis).
+"""
+import argparse
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Default number of workers: one per core
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+
+def configure_shared_state(workers: int):
+    """
+    Picks shared backends for multi-worker runs unless they are configured explicitly.
+    Must run before `main` is imported by the workers (they inherit the environment).
+    """
+    if workers <= 1:
+        return
+    os.environ.setdefault("STATE_BACKEND", "sqlite")
+    if os.environ["STATE_BACKEND"].lower() == "memory":
+        sys.exit("STATE_BACKEND=memory cannot be shared between workers; use sqlite or redis.")
+
+    use_vertex_sessions = os.getenv("USE_MEMORY_BANK", "false").lower() == "true" and bool(os.getenv("AGENT_ENGINE_ID"))
+    if not use_vertex_sessions:
+        os.environ.setdefault("SESSION_BACKEND", "sqlite")
+        if os.environ["SESSION_BACKEND"].lower() != "sqlite":
+            sys.exit("In-memory sessions cannot be shared between workers; use SESSION_BACKEND=sqlite or Vertex AI sessions.")
+        if os.getenv("LOCAL_MEMORY_BACKEND", "inmemory").lower() == "vector":
+            sys.exit("LOCAL_MEMORY_BACKEND=vector is single-writer and would be corrupted by several workers; use inmemory or --workers 1.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    configure_shared_state(args.workers)
+    logger.info(
+        f"Starting {args.workers} workers on {args.host}:{args.port} "
+        f"(state: {os.getenv('STATE_BACKEND', 'memory')}, sessions: {os.getenv('SESSION_BACKEND', 'memory')})"
+    )
+
+    import uvicorn
+    # Workers must import the app by name so each process builds its own
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import logging
+
+from state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+# Heavy SDKs (google.adk, vertexai) are imported inside the factories below so that
+# importing this module stays cheap; the backend builds services in its startup hook.
+
+PROJECT_ID = os.getenv("PROJECT_ID")
+LOCATION = os.getenv("LOCATION", "us-central1")
+
+AGENT_ENGINE_ID = os.getenv("AGENT_ENGINE_ID")
+USE_MEMORY_BANK = os.getenv("USE_MEMORY_BANK", "false").lower() == "true"
+USE_VERTEX_SESSIONS = USE_MEMORY_BANK and bool(AGENT_ENGINE_ID)
+
+# Local write-through cache in front of the remote session service
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "256"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300"))
+# Per-user cache of memory bank memory sets, invalidated when new memories are ingested
+MEMORY_CACHE_TTL_SECONDS = float(os.getenv("MEMORY_CACHE_TTL_SECONDS", "600"))
+MEMORY_CACHE_MAX_USERS = int(os.getenv("MEMORY_CACHE_MAX_USERS", "1024"))
+# Memories returned per search, ranked locally against the query
+MEMORY_CACHE_TOP_K = int(os.getenv("MEMORY_CACHE_TOP_K", "3"))
+# Offline memory backend used when the Vertex AI Memory Bank is not configured: "inmemory" or "vector"
+LOCAL_MEMORY_BACKEND = os.getenv("LOCAL_MEMORY_BACKEND", "inmemory").lower()
+LOCAL_MEMORY_DIR = os.getenv("LOCAL_MEMORY_DIR", "memory_store")
+# Local session backend used without Vertex AI sessions: "memory" or "sqlite" (survives restarts)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SQLITE_SESSION_DB = os.getenv("SQLITE_SESSION_DB", "sessions.db")
+# Artifact service of the Runner: "local" (content-addressed files on disk) or "memory"
+ARTIFACT_SERVICE_BACKEND = os.getenv("ARTIFACT_SERVICE_BACKEND", "local").lower()
+ARTIFACT_SERVICE_DIR = os.getenv("ARTIFACT_SERVICE_DIR", "artifact_blobs")
+
+
+def create_session_service():
+    """
+    Builds the session service for the current configuration.
+    """
+    if USE_VERTEX_SESSIONS:
+        from google.adk.sessions import VertexAiSessionService
+        from session_cache import CachedSessionService
+        logger.info(f"Using Agent Engine ID: {AGENT_ENGINE_ID}")
+        return CachedSessionService(
+            VertexAiSessionService(
+                project=PROJECT_ID, location=LOCATION, agent_engine_id=AGENT_ENGINE_ID
+            ),
+            max_sessions=SESSION_CACHE_MAX_SESSIONS,
+            ttl_seconds=SESSION_CACHE_TTL_SECONDS,
+            state_store=get_state_store(),
+        )
+
+    if not USE_MEMORY_BANK:
+        logger.info("USE_MEMORY_BANK is false. Using InMemory services.")
+    else:
+        logger.warning("AGENT_ENGINE_ID not found but USE_MEMORY_BANK is true. Falling back to InMemory services.")
+
+    if SESSION_BACKEND == "sqlite":
+        from sqlite_session_service import SqliteSessionService
+        logger.info(f"Using SQLite session store at {SQLITE_SESSION_DB}")
+        return SqliteSessionService(SQLITE_SESSION_DB)
+    from google.adk.sessions import InMemorySessionService
+    return InMemorySessionService()
+
+
+def create_memory_service():
+    """
+    Builds the memory service for the current configuration.
+    """
+    if USE_VERTEX_SESSIONS:
+        from memory_cache import CachedMemoryService, MemoryBankService
+        return CachedMemoryService(
+            MemoryBankService(
+                project=PROJECT_ID, location=LOCATION, agent_engine_id=AGENT_ENGINE_ID
+            ),
+            ttl_seconds=MEMORY_CACHE_TTL_SECONDS,
+            state_store=get_state_store(),
+            max_users=MEMORY_CACHE_MAX_USERS,
+            top_k=MEMORY_CACHE_TOP_K,
+        )
+
+    if LOCAL_MEMORY_BACKEND == "vector":
+        from local_memory_service import LocalVectorMemoryService
+        logger.info(f"Using local vector memory store at {LOCAL_MEMORY_DIR}")
+        return LocalVectorMemoryService(LOCAL_MEMORY_DIR)
+    from google.adk.memory import InMemoryMemoryService
+    return InMemoryMemoryService()
+
+
+def create_artifact_service():
+    """
+    Builds the artifact service for the current configuration.
+    """
+    if ARTIFACT_SERVICE_BACKEND == "memory":
+        from google.adk.artifacts import InMemoryArtifactService
+        return InMemoryArtifactService()
+    if ARTIFACT_SERVICE_BACKEND != "local":
+        logger.warning(f"Unknown ARTIFACT_SERVICE_BACKEND '{ARTIFACT_SERVICE_BACKEND}'. Falling back to local.")
+    from local_artifact_service import LocalArtifactService
+    logger.info(f"Using local artifact store at {ARTIFACT_SERVICE_DIR}")
+    return LocalArtifactService(ARTIFACT_SERVICE_DIR)
@@ -0,0 +1,183 @@
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+from state_store import CACHE_INDEX, StateStore
+
+logger = logging.getLogger(__name__)
+
+
+class CachedSessionService(BaseSessionService):
+    """
+    Write-through cache in front of another session service (e.g. VertexAiSessionService).
+
+    Recently used sessions are kept in an LRU. New events are appended to the cached
+    copy and written through to the wrapped service, so a warm `get_session` never
+    leaves the process. A session is refetched only when its TTL expires or when the
+    caller holds a version (last_update_time) that does not match the cached one.
+
+    With a shared `state_store`, every write bumps a per-session version counter, so a
+    worker notices when another worker advanced a session and refetches it.
+    """
+
+    def __init__(
+        self,
+        inner: BaseSessionService,
+        max_sessions: int = 256,
+        ttl_seconds: float = 300.0,
+        state_store: Optional[StateStore] = None,
+    ):
+        self.inner = inner
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.state_store = state_store
+        # (app_name, user_id, session_id) -> (session, fetched_at, version)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_refetches = 0
+
+    @staticmethod
+    def _key(app_name: str, user_id: str, session_id: str) -> tuple:
+        return (app_name, user_id, session_id)
+
+    def _version(self, key: tuple) -> int:
+        if self.state_store is None:
+            return 0
+        return self.state_store.get(CACHE_INDEX, "session:" + ":".join(key), 0)
+
+    def _bump_version(self, key: tuple) -> int:
+        if self.state_store is None:
+            return 0
+        return self.state_store.incr(CACHE_INDEX, "session:" + ":".join(key))
+
+    def _store(self, session: Session, version: int):
+        key = self._key(session.app_name, session.user_id, session.id)
+        self._entries[key] = (copy.deepcopy(session), time.monotonic(), version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, key: tuple) -> Optional[Session]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        session, fetched_at, version = entry
+        if time.monotonic() - fetched_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        if version != self._version(key):
+            # Another worker wrote to this session since we cached it
+            self.stale_refetches += 1
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return session
+
+    def invalidate(self, app_name: str, user_id: str, session_id: str):
+        self._entries.pop(self._key(app_name, user_id, session_id), None)
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session = await self.inner.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        self._store(session, self._bump_version(self._key(app_name, user_id, session.id)))
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = self._key(app_name, user_id, session_id)
+        cached = self._lookup(key)
+        if cached is None:
+            self.misses += 1
+            # Read the version before fetching so a concurrent write makes the entry stale
+            version = self._version(key)
+            session = await self.inner.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            if session is None:
+                return None
+            self._store(session, version)
+            cached = session
+        else:
+            self.hits += 1
+
+        # Hand out a copy so callers cannot mutate the cached entry behind our back
+        session = copy.deepcopy(cached)
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [e for e in session.events if e.timestamp >= config.after_timestamp]
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        return await self.inner.list_sessions(app_name=app_name, user_id=user_id)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self.invalidate(app_name, user_id, session_id)
+        await self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._bump_version(self._key(app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        key = self._key(session.app_name, session.user_id, session.id)
+        cached = self._entries.get(key)
+        expected_version = session.last_update_time
+
+        # Write through first; the wrapped service updates `session` in place
+        event = await self.inner.append_event(session=session, event=event)
+        if event.partial:
+            return event
+        version = self._bump_version(key)
+
+        if cached is None:
+            return event
+        cached_session, fetched_at, cached_version = cached
+        if cached_session.last_update_time != expected_version or (
+            self.state_store is not None and cached_version != version - 1
+        ):
+            # Someone else advanced the session; drop it and refetch next time
+            self.stale_refetches += 1
+            self._entries.pop(key, None)
+            return event
+
+        cached_session.events.append(event)
+        if event.actions and event.actions.state_delta:
+            for state_key, value in event.actions.state_delta.items():
+                if not state_key.startswith("temp:"):
+                    cached_session.state[state_key] = value
+        cached_session.last_update_time = session.last_update_time
+        self._entries[key] = (cached_session, fetched_at, version)
+        self._entries.move_to_end(key)
+        return event
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_sessions": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "stale_refetches": self.stale_refetches,
+        }
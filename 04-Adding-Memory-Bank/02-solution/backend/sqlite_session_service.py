@@ -0,0 +1,310 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    last_update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (app_name, user_id, session_id, seq);
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+"""
+
+
+class SqliteSessionService(BaseSessionService):
+    """
+    Persistent session service for single-node deployments.
+
+    Sessions live in a SQLite database in WAL mode. Events are stored as append-only
+    rows indexed by (app, user, session). Appends are buffered and written in one
+    transaction per batch: when `batch_size` events are pending, after
+    `flush_interval` seconds, or before any read.
+    """
+
+    def __init__(self, db_path: str = "sessions.db", batch_size: int = 32, flush_interval: float = 0.05):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._pending_events: List[tuple] = []
+        self._pending_states: Dict[tuple, tuple] = {}
+        self._pending_app_states: Dict[str, Dict[str, Any]] = {}
+        self._pending_user_states: Dict[tuple, Dict[str, Any]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    # --- Write batching ---
+
+    def flush(self):
+        """Writes all buffered events and state updates in a single transaction."""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not (self._pending_events or self._pending_states or self._pending_app_states or self._pending_user_states):
+            return
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO events (app_name, user_id, session_id, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+                self._pending_events,
+            )
+            self._conn.executemany(
+                "UPDATE sessions SET state = ?, last_update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                [(state, ts, *key) for key, (state, ts) in self._pending_states.items()],
+            )
+            for app_name, delta in self._pending_app_states.items():
+                self._merge_state("app_states", "app_name = ?", (app_name,), delta)
+            for (app_name, user_id), delta in self._pending_user_states.items():
+                self._merge_state("user_states", "app_name = ? AND user_id = ?", (app_name, user_id), delta)
+        self._pending_events.clear()
+        self._pending_states.clear()
+        self._pending_app_states.clear()
+        self._pending_user_states.clear()
+
+    def _merge_state(self, table: str, where: str, key: tuple, delta: Dict[str, Any]):
+        row = self._conn.execute(f"SELECT state FROM {table} WHERE {where}", key).fetchone()
+        state = json.loads(row[0]) if row else {}
+        state.update(delta)
+        columns = "app_name, state" if table == "app_states" else "app_name, user_id, state"
+        placeholders = ", ".join("?" * (len(key) + 1))
+        self._conn.execute(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})", (*key, json.dumps(state)))
+
+    def _schedule_flush(self):
+        if len(self._pending_events) >= self.batch_size:
+            self.flush()
+            return
+        if self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    # --- State helpers ---
+
+    def _load_scoped_state(self, app_name: str, user_id: str) -> Dict[str, Any]:
+        state = {}
+        row = self._conn.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+        if row:
+            state.update({State.APP_PREFIX + k: v for k, v in json.loads(row[0]).items()})
+        row = self._conn.execute(
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        ).fetchone()
+        if row:
+            state.update({State.USER_PREFIX + k: v for k, v in json.loads(row[0]).items()})
+        return state
+
+    @staticmethod
+    def _split_state(state: Dict[str, Any]) -> tuple:
+        app_delta, user_delta, session_state = {}, {}, {}
+        for key, value in state.items():
+            if key.startswith(State.APP_PREFIX):
+                app_delta[key[len(State.APP_PREFIX):]] = value
+            elif key.startswith(State.USER_PREFIX):
+                user_delta[key[len(State.USER_PREFIX):]] = value
+            elif not key.startswith(State.TEMP_PREFIX):
+                session_state[key] = value
+        return app_delta, user_delta, session_state
+
+    # --- BaseSessionService ---
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        self.flush()
+        app_delta, user_delta, session_state = self._split_state(state or {})
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO sessions (app_name, user_id, id, state, last_update_time) VALUES (?, ?, ?, ?, ?)",
+                    (app_name, user_id, session_id, json.dumps(session_state), now),
+                )
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Session {session_id} already exists.")
+            if app_delta:
+                self._merge_state("app_states", "app_name = ?", (app_name,), app_delta)
+            if user_delta:
+                self._merge_state("user_states", "app_name = ? AND user_id = ?", (app_name, user_id), user_delta)
+        merged = {**session_state, **self._load_scoped_state(app_name, user_id)}
+        return Session(id=session_id, app_name=app_name, user_id=user_id, state=merged, last_update_time=now)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        self.flush()
+        row = self._conn.execute(
+            "SELECT state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        ).fetchone()
+        if row is None:
+            return None
+
+        query = "SELECT data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?"
+        params: list = [app_name, user_id, session_id]
+        if config and config.after_timestamp:
+            query += " AND timestamp >= ?"
+            params.append(config.after_timestamp)
+        if config and config.num_recent_events:
+            params.append(config.num_recent_events)
+            rows = self._conn.execute(query + " ORDER BY seq DESC LIMIT ?", params).fetchall()[::-1]
+        else:
+            rows = self._conn.execute(query + " ORDER BY seq", params).fetchall()
+
+        state = {**json.loads(row[0]), **self._load_scoped_state(app_name, user_id)}
+        return Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=state,
+            events=[Event.model_validate_json(data) for (data,) in rows],
+            last_update_time=row[1],
+        )
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        self.flush()
+        query = "SELECT user_id, id, state, last_update_time FROM sessions WHERE app_name = ?"
+        params: list = [app_name]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        sessions = [
+            Session(id=sid, app_name=app_name, user_id=uid, state=json.loads(state), last_update_time=ts)
+            for uid, sid, state, ts in self._conn.execute(query, params).fetchall()
+        ]
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self.flush()
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", (app_name, user_id, session_id)
+            )
+            self._conn.execute(
+                "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", (app_name, user_id, session_id)
+            )
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        event = await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        self._pending_events.append(
+            (session.app_name, session.user_id, session.id, event.timestamp, event.model_dump_json(exclude_none=True))
+        )
+        if event.actions and event.actions.state_delta:
+            app_delta, user_delta, _ = self._split_state(event.actions.state_delta)
+            if app_delta:
+                self._pending_app_states.setdefault(session.app_name, {}).update(app_delta)
+            if user_delta:
+                self._pending_user_states.setdefault((session.app_name, session.user_id), {}).update(user_delta)
+        _, _, session_state = self._split_state(session.state)
+        key = (session.app_name, session.user_id, session.id)
+        self._pending_states[key] = (json.dumps(session_state, default=str), session.last_update_time)
+        self._schedule_flush()
+        return event
+
+    def import_session(self, session: Session):
+        """Copies a complete session, including its events, into this store."""
+        self.flush()
+        app_delta, user_delta, session_state = self._split_state(session.state)
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (app_name, user_id, id, state, last_update_time) VALUES (?, ?, ?, ?, ?)",
+                (session.app_name, session.user_id, session.id, json.dumps(session_state, default=str), session.last_update_time),
+            )
+            self._conn.execute(
+                "DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (session.app_name, session.user_id, session.id),
+            )
+            self._conn.executemany(
+                "INSERT INTO events (app_name, user_id, session_id, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (session.app_name, session.user_id, session.id, e.timestamp, e.model_dump_json(exclude_none=True))
+                    for e in session.events
+                ],
+            )
+            if app_delta:
+                self._merge_state("app_states", "app_name = ?", (session.app_name,), app_delta)
+            if user_delta:
+                self._merge_state("user_states", "app_name = ? AND user_id = ?", (session.app_name, session.user_id), user_delta)
+
+
+async def migrate_sessions(
+    source: BaseSessionService,
+    target: SqliteSessionService,
+    app_name: str,
+    user_id: Optional[str] = None,
+) -> int:
+    """
+    Copies every session of `app_name` (optionally of a single user) from `source`
+    (e.g. an InMemorySessionService) into the SQLite store.
+
+    Returns:
+        The number of sessions migrated.
+    """
+    listed = await source.list_sessions(app_name=app_name, user_id=user_id)
+    migrated = 0
+    for summary in listed.sessions:
+        session = await source.get_session(app_name=app_name, user_id=summary.user_id, session_id=summary.id)
+        if session is None:
+            continue
+        target.import_session(session)
+        migrated += 1
+    logger.info(f"Migrated {migrated} sessions of app '{app_name}' to {target.db_path}")
+    return migrated
@@ -0,0 +1,232 @@
+import abc
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Where shared backend state lives: "memory" (single process), "sqlite" or "redis"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "xmas")
+
+# Namespaces used by the backend
+APP = "app"                # e.g. the current session id
+TREE = "tree"              # tree configuration
+ARTIFACTS = "artifacts"    # metadata of generated and uploaded images
+CACHE_INDEX = "cache"      # generation counters used to invalidate per-worker caches
+USAGE = "usage"            # token, latency and tool-call accounting per session
+IDEMPOTENCY = "idempotency"  # results of chat requests by idempotency key
+
+
+class StateStore(abc.ABC):
+    """
+    Key/value store for backend state that must be shared by all uvicorn workers.
+
+    Values are JSON-serializable and grouped in namespaces.
+    """
+
+    @abc.abstractmethod
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        ...
+
+    @abc.abstractmethod
+    def set(self, namespace: str, key: str, value: Any):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, namespace: str, key: str):
+        ...
+
+    @abc.abstractmethod
+    def get_all(self, namespace: str) -> Dict[str, Any]:
+        ...
+
+    @abc.abstractmethod
+    def incr(self, namespace: str, key: str) -> int:
+        """Atomically increments an integer counter and returns the new value."""
+
+    @abc.abstractmethod
+    def update(self, namespace: str, key: str, func: Callable[[Any], Any], default: Any = None) -> Any:
+        """
+        Atomically replaces a value with `func(value)`.
+
+        Args:
+            namespace: Namespace of the value.
+            key: Key of the value.
+            func: Computes the new value from the current one (`default` if unset); may run more than once.
+            default: Current value to pass when the key is unset.
+
+        Returns:
+            The new value.
+        """
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store; only correct with a single worker."""
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key, default=None):
+        return self._data.get(namespace, {}).get(key, default)
+
+    def set(self, namespace, key, value):
+        self._data.setdefault(namespace, {})[key] = value
+
+    def delete(self, namespace, key):
+        self._data.get(namespace, {}).pop(key, None)
+
+    def get_all(self, namespace):
+        return dict(self._data.get(namespace, {}))
+
+    def incr(self, namespace, key):
+        with self._lock:
+            value = int(self.get(namespace, key, 0)) + 1
+            self.set(namespace, key, value)
+            return value
+
+    def update(self, namespace, key, func, default=None):
+        with self._lock:
+            value = func(self.get(namespace, key, default))
+            self.set(namespace, key, value)
+            return value
+
+
+class SqliteStateStore(StateStore):
+    """Store in a local SQLite file (WAL mode), shared by workers on the same host."""
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._conn().execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time.time()),
+        )
+
+    def delete(self, namespace, key):
+        self._conn().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def get_all(self, namespace):
+        rows = self._conn().execute("SELECT key, value FROM kv WHERE namespace = ?", (namespace,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def incr(self, namespace, key):
+        return self.update(namespace, key, lambda value: value + 1, 0)
+
+    def update(self, namespace, key, func, default=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            value = func(json.loads(row[0]) if row else default)
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+
+class RedisStateStore(StateStore):
+    """
+    Store on any Redis-protocol server; each namespace is one hash.
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = STATE_KEY_PREFIX):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("STATE_BACKEND=redis requires the 'redis' package (pip install redis).") from e
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _hash(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}"
+
+    def get(self, namespace, key, default=None):
+        value = self._client.hget(self._hash(namespace), key)
+        return json.loads(value) if value is not None else default
+
+    def set(self, namespace, key, value):
+        self._client.hset(self._hash(namespace), key, json.dumps(value))
+
+    def delete(self, namespace, key):
+        self._client.hdel(self._hash(namespace), key)
+
+    def get_all(self, namespace):
+        return {k.decode(): json.loads(v) for k, v in self._client.hgetall(self._hash(namespace)).items()}
+
+    def incr(self, namespace, key):
+        return int(self._client.hincrby(self._hash(namespace), key, 1))
+
+    def update(self, namespace, key, func, default=None):
+        name = self._hash(namespace)
+
+        def apply(pipe):
+            # WATCH/MULTI: redis-py reruns this when the hash changed before EXEC
+            raw = pipe.hget(name, key)
+            value = func(json.loads(raw) if raw is not None else default)
+            pipe.multi()
+            pipe.hset(name, key, json.dumps(value))
+            return value
+
+        return self._client.transaction(apply, name, value_from_callable=True)
+
+
+def create_state_store() -> StateStore:
+    """
+    Builds the state store selected by STATE_BACKEND.
+    """
+    if STATE_BACKEND == "sqlite":
+        logger.info(f"Using SQLite state store at {STATE_DB_PATH}")
+        return SqliteStateStore(STATE_DB_PATH)
+    if STATE_BACKEND == "redis":
+        logger.info(f"Using Redis state store at {REDIS_URL}")
+        return RedisStateStore(REDIS_URL)
+    if STATE_BACKEND != "memory":
+        logger.warning(f"Unknown STATE_BACKEND '{STATE_BACKEND}'. Falling back to memory.")
+    return MemoryStateStore()
+
+
+_state_store: Optional[StateStore] = None
+
+
+def get_state_store() -> StateStore:
+    """Returns the process-wide state store, creating it on first use."""
+    global _state_store
+    if _state_store is None:
+        _state_store = create_state_store()
+    return _state_store
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens; JSON overrides via MODEL_PRICING, e.g. '{"gemini-2.5-flash": {"output": 2.5}}'
+PRICING: Dict[str, Dict[str, float]] = {
+    "gemini-2.5-flash": {"input": 0.30, "cached_input": 0.03, "output": 2.50},
+    "gemini-2.5-flash-image": {"input": 0.30, "cached_input": 0.03, "output": 30.0},
+}
+if os.getenv("MODEL_PRICING"):
+    for _model, _prices in json.loads(os.getenv("MODEL_PRICING")).items():
+        PRICING[_model] = {**PRICING.get(_model, {}), **_prices}
+
+# Turns kept per session for /api/sessions/{id}/usage, and per process for percentiles
+USAGE_TURNS_PER_SESSION = int(os.getenv("USAGE_TURNS_PER_SESSION", "50"))
+USAGE_WINDOW_TURNS = 1000
+
+# Image tools report "Done! Saved at <file>"; generate_variants also lists one line per variant
+SAVED_AT_PATTERN = re.compile(r"^Done! Saved at (\S+)", re.MULTILINE)
+VARIANT_LINE_PATTERN = re.compile(r"^\d+\. .+: (\S+\.png)$", re.MULTILINE)
+
+TOKEN_FIELDS = ("prompt_tokens", "cached_tokens", "output_tokens", "total_tokens")
+
+
+def tokens_from_metadata(usage_metadata) -> Dict[str, int]:
+    """Normalizes a genai `usage_metadata` (thinking tokens count as output)."""
+    if usage_metadata is None:
+        return dict.fromkeys(TOKEN_FIELDS, 0)
+    output = (usage_metadata.candidates_token_count or 0) + (usage_metadata.thoughts_token_count or 0)
+    prompt = usage_metadata.prompt_token_count or 0
+    return {
+        "prompt_tokens": prompt,
+        "cached_tokens": usage_metadata.cached_content_token_count or 0,
+        "output_tokens": output,
+        "total_tokens": usage_metadata.total_token_count or prompt + output,
+    }
+
+
+def estimate_cost(model: str, tokens: Dict[str, int]) -> float:
+    """Estimated USD cost of a call; 0.0 for models without a price."""
+    prices = PRICING.get(model)
+    if not prices:
+        return 0.0
+    uncached = tokens["prompt_tokens"] - tokens["cached_tokens"]
+    return (
+        uncached * prices.get("input", 0.0)
+        + tokens["cached_tokens"] * prices.get("cached_input", prices.get("input", 0.0))
+        + tokens["output_tokens"] * prices.get("output", 0.0)
+    ) / 1_000_000
+
+
+def count_images(tool_output: str) -> int:
+    """Number of images a tool output reports as generated."""
+    variants = len(VARIANT_LINE_PATTERN.findall(tool_output))
+    if variants:
+        return variants
+    return len(SAVED_AT_PATTERN.findall(tool_output))
+
+
+def image_filenames(tool_output: str) -> List[str]:
+    """Files (relative to static/) a tool output reports as written, including batch variants."""
+    return SAVED_AT_PATTERN.findall(tool_output) + VARIANT_LINE_PATTERN.findall(tool_output)
+
+
+def tool_output_text(response: Any) -> str:
+    # MCP tool responses arrive as {"content": [{"type": "text", "text": ...}], ...}
+    if isinstance(response, dict):
+        content = response.get("content")
+        if isinstance(content, list):
+            return "\n".join(item.get("text", "") for item in content if isinstance(item, dict))
+        return str(response.get("result", ""))
+    return str(response or "")
+
+
+class TurnUsage:
+    """
+    Accumulates the usage of one chat turn from the events of `runner.run_async`.
+
+    Latency is attributed by the gap before each event: the gap before a model
+    response is model time, the gap before a function response is tool time.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.perf_counter()
+        self._last_event = self.started
+        self.tokens = dict.fromkeys(TOKEN_FIELDS, 0)
+        self.model_calls = 0
+        self.model_seconds = 0.0
+        self.tool_seconds = 0.0
+        self.tool_calls: Counter = Counter()
+        self.image_generations = 0
+
+    def observe(self, event):
+        now = time.perf_counter()
+        gap, self._last_event = now - self._last_event, now
+        responses = event.get_function_responses()
+        if responses:
+            self.tool_seconds += gap
+            for response in responses:
+                self.image_generations += count_images(tool_output_text(response.response))
+        elif event.usage_metadata is not None:
+            # Partial (streamed) events carry no usage; each final model response carries one
+            self.model_calls += 1
+            self.model_seconds += gap
+            for field, value in tokens_from_metadata(event.usage_metadata).items():
+                self.tokens[field] += value
+        for call in event.get_function_calls():
+            self.tool_calls[call.name] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "finished_at": time.time(),
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "model_seconds": round(self.model_seconds, 3),
+            "tool_seconds": round(self.tool_seconds, 3),
+            "model_calls": self.model_calls,
+            **self.tokens,
+            "tool_calls": dict(self.tool_calls),
+            "image_generations": self.image_generations,
+            "estimated_cost_usd": round(estimate_cost(self.model, self.tokens), 6),
+        }
+
+
+def _add_turn(totals: Dict[str, Any], turn: Dict[str, Any]):
+    totals["turns"] = totals.get("turns", 0) + 1
+    for field in ("seconds", "model_seconds", "tool_seconds", "estimated_cost_usd"):
+        totals[field] = round(totals.get(field, 0.0) + turn[field], 6)
+    for field in ("model_calls", "image_generations", *TOKEN_FIELDS):
+        totals[field] = totals.get(field, 0) + turn[field]
+    tool_calls = totals.setdefault("tool_calls", {})
+    for name, count in turn["tool_calls"].items():
+        tool_calls[name] = tool_calls.get(name, 0) + count
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class UsageTracker:
+    """
+    Per-session usage (in the shared state store, so every worker can serve it) and
+    per-process aggregates for /api/metrics.
+    """
+
+    def __init__(self, state_store, namespace: str, turns_per_session: int = USAGE_TURNS_PER_SESSION):
+        self.state_store = state_store
+        self.namespace = namespace
+        self.turns_per_session = turns_per_session
+        self._lock = threading.Lock()
+        self.totals: Dict[str, Any] = {}
+        self._recent: deque = deque(maxlen=USAGE_WINDOW_TURNS)
+
+    def record_turn(self, session_id: str, turn: Dict[str, Any]):
+        with self._lock:
+            _add_turn(self.totals, turn)
+            self._recent.append(turn)
+
+        def add(usage: Dict[str, Any]) -> Dict[str, Any]:
+            _add_turn(usage["totals"], turn)
+            usage["turns"] = (usage["turns"] + [turn])[-self.turns_per_session:]
+            return usage
+
+        # Atomic in the store, so concurrent turns of the session in other workers are not lost
+        self.state_store.update(self.namespace, session_id, add, {"totals": {}, "turns": []})
+        logger.info(
+            f"Turn usage for {session_id}: {turn['total_tokens']} tokens, {turn['model_calls']} model calls, "
+            f"{sum(turn['tool_calls'].values())} tool calls, {turn['seconds']:.2f}s"
+        )
+
+    def session_usage(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.state_store.get(self.namespace, session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._recent)
+            totals = json.loads(json.dumps(self.totals))
+        tokens = [turn["total_tokens"] for turn in recent]
+        seconds = [turn["seconds"] for turn in recent]
+        turns = totals.get("turns", 0)
+        return {
+            **totals,
+            "avg_tokens_per_turn": round(totals.get("total_tokens", 0) / turns, 1) if turns else 0.0,
+            "p50_turn_tokens": _percentile(tokens, 0.5),
+            "p95_turn_tokens": _percentile(tokens, 0.95),
+            "p50_turn_seconds": _percentile(seconds, 0.5),
+            "p95_turn_seconds": _percentile(seconds, 0.95),
+        }
+
+
+class ModelCallLog:
+    """Thread-safe per-model and per-tool totals of direct `generate_content` calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self.by_tool: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, model: str, usage_metadata, seconds: float, tool: Optional[str] = None, failed: bool = False):
+        tokens = tokens_from_metadata(usage_metadata)
+        cost = estimate_cost(model, tokens)
+        with self._lock:
+            for table, key in ((self.by_model, model), (self.by_tool, tool)):
+                if key is None:
+                    continue
+                entry = table.setdefault(key, {"calls": 0, "failures": 0, "seconds": 0.0, "estimated_cost_usd": 0.0, **dict.fromkeys(TOKEN_FIELDS, 0)})
+                entry["calls"] += 1
+                entry["failures"] += int(failed)
+                entry["seconds"] = round(entry["seconds"] + seconds, 3)
+                entry["estimated_cost_usd"] = round(entry["estimated_cost_usd"] + cost, 6)
+                for field, value in tokens.items():
+                    entry[field] += value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps({"by_model": self.by_model, "by_tool": self.by_tool}))
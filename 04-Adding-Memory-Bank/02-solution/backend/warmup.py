@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of sessions created ahead of time (only useful with remote Vertex AI sessions)
+WARMUP_SESSION_POOL = int(os.getenv("WARMUP_SESSION_POOL", "0"))
+# Open a connection to the model endpoint during warm-up
+WARMUP_MODEL_CLIENT = os.getenv("WARMUP_MODEL_CLIENT", "true").lower() == "true"
+
+
+class SessionPool:
+    """
+    Pre-created sessions for one user, handed out when a chat needs a new session.
+
+    Creating a Vertex AI session is a remote call; taking one from the pool is not.
+    The pool refills itself in the background after each checkout.
+    """
+
+    def __init__(self, session_service, app_name: str, user_id: str, size: int):
+        self.session_service = session_service
+        self.app_name = app_name
+        self.user_id = user_id
+        self.size = size
+        self._sessions: List[Any] = []
+        self._refill_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    async def fill(self):
+        while len(self._sessions) < self.size:
+            session = await self.session_service.create_session(app_name=self.app_name, user_id=self.user_id)
+            self._sessions.append(session)
+
+    def take(self):
+        """Returns a pre-created session, or None when the pool is empty."""
+        if not self._sessions:
+            self.misses += 1
+            return None
+        self.hits += 1
+        session = self._sessions.pop()
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+        return session
+
+    async def _refill(self):
+        try:
+            await self.fill()
+        except Exception as e:
+            logger.warning(f"Failed to refill session pool: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"available": len(self._sessions), "size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+class WarmupState:
+    """Tracks warm-up progress for the readiness probe."""
+
+    def __init__(self):
+        self.done = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.tool_names: List[str] = []
+
+    def record(self, step: str, started: float, error: Optional[Exception] = None):
+        self.steps[step] = {"seconds": round(time.perf_counter() - started, 3), "ok": error is None}
+        if error is not None:
+            self.steps[step]["error"] = str(error)
+            logger.warning(f"Warm-up step '{step}' failed: {error}")
+        else:
+            logger.info(f"Warm-up step '{step}' took {self.steps[step]['seconds']:.3f}s")
+
+
+async def _warm_tools(state: WarmupState, toolset):
+    started = time.perf_counter()
+    try:
+        # The toolset caches the listed tools, so later LLM calls reuse these schemas
+        tools = await toolset.get_tools()
+        state.tool_names = [tool.name for tool in tools]
+        state.record("mcp_tools", started)
+    except Exception as e:
+        state.record("mcp_tools", started, e)
+        raise
+
+
+async def _warm_model_client(state: WarmupState, agent):
+    started = time.perf_counter()
+    try:
+        llm = agent.canonical_model
+        # A metadata lookup opens (and keeps alive) the TLS connection the first turn will reuse
+        await llm.api_client.aio.models.get(model=llm.model)
+        state.record("model_client", started)
+    except Exception as e:
+        # Best effort: a missing model connection only costs the first turn a handshake
+        state.record("model_client", started, e)
+
+
+async def _warm_session_pool(state: WarmupState, pool: SessionPool):
+    started = time.perf_counter()
+    try:
+        await pool.fill()
+        state.record("session_pool", started)
+    except Exception as e:
+        state.record("session_pool", started, e)
+
+
+async def _warm_context_cache(state: WarmupState, context_cache, runner, agent):
+    started = time.perf_counter()
+    try:
+        await context_cache.create(runner, agent)
+        state.record("context_cache", started)
+    except Exception as e:
+        # Best effort: without the cache every request carries the full prefix
+        state.record("context_cache", started, e)
+
+
+async def warm_up(state: WarmupState, agent, toolset, session_pool: Optional[SessionPool] = None, context_cache=None, runner=None):
+    """
+    Runs the warm-up steps concurrently. Raises if the MCP tools cannot be listed, since
+    the agent cannot serve image requests without them; other steps are best effort.
+    The context cache is created last, as it contains the listed tool schemas.
+    """
+    steps = [_warm_tools(state, toolset)]
+    if WARMUP_MODEL_CLIENT:
+        steps.append(_warm_model_client(state, agent))
+    if session_pool is not None and session_pool.size > 0:
+        steps.append(_warm_session_pool(state, session_pool))
+    await asyncio.gather(*steps)
+    if context_cache is not None and runner is not None:
+        await _warm_context_cache(state, context_cache, runner, agent)
+    state.done = True
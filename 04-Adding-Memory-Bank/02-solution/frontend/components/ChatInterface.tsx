@@ -13,6 +13,19 @@ interface ChatInterfaceProps {
     onStateUpdate: (newState: any) => void;
 }
 
+// crypto.randomUUID() only exists in secure contexts (https or localhost); getRandomValues works everywhere
+const newIdempotencyKey = (): string => {
+    if (typeof crypto.randomUUID === 'function') {
+        return crypto.randomUUID();
+    }
+    return Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('');
+};
+
+// Retries of one message after a dropped connection, a 409 (still running in another worker) or a 429 (busy)
+const MAX_SEND_RETRIES = 3;
+
+const sleep = (seconds: number) => new Promise(resolve => setTimeout(resolve, seconds * 1000));
+
 const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStateUpdate }) => {
     const [messages, setMessages] = useState<Message[]>([
         {
@@ -26,6 +39,8 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStateUpdate }) => {
     const [selectedImage, setSelectedImage] = useState<File | null>(null);
     const messagesEndRef = useRef<HTMLDivElement>(null);
     const fileInputRef = useRef<HTMLInputElement>(null);
+    // Key of the message being composed; every send and retry of it reuses the key
+    const idempotencyKeyRef = useRef<string | null>(null);
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
@@ -37,14 +52,76 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStateUpdate }) => {
 
     const handleImageSelect = (e: React.ChangeEvent<HTMLInputElement>) => {
         if (e.target.files && e.target.files[0]) {
+            idempotencyKeyRef.current = null;
             setSelectedImage(e.target.files[0]);
         }
     };
 
+    // Long-polls a background render job and posts its images to the chat when it is done
+    const followJob = async (jobId: string) => {
+        try {
+            while (true) {
+                const response = await fetch(`/api/jobs/${jobId}?wait=25`);
+                if (!response.ok) throw new Error('Failed to fetch job');
+                const job = await response.json();
+                if (job.status !== 'succeeded' && job.status !== 'failed') continue;
+
+                const images = (job.results || []).filter((r: any) => r.image_url);
+                setMessages(prev => [
+                    ...prev,
+                    ...images.map((r: any) => ({
+                        role: 'agent' as const,
+                        content: `Your ${r.tool.replace(/^generate_/, '').replace(/_/g, ' ')} is ready! ✨`,
+                        generatedImage: r.image_url,
+                        timestamp: new Date()
+                    })),
+                    ...(job.status === 'failed' ? [{
+                        role: 'agent' as const,
+                        content: `Sorry, the render did not finish: ${job.error}`,
+                        timestamp: new Date()
+                    }] : [])
+                ]);
+                return;
+            }
+        } catch (error) {
+            console.error('Error:', error);
+        }
+    };
+
     const formatTime = (date: Date) => {
         return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
     };
 
+    // Posts one message, retrying with the same key and form data
+    const postChat = async (formData: FormData, idempotencyKey: string): Promise<Response> => {
+        const headers = { 'Idempotency-Key': idempotencyKey };
+        for (let attempt = 0; ; attempt++) {
+            let response: Response;
+            try {
+                response = await fetch('/api/chat', { method: 'POST', body: formData, headers });
+            } catch (error) {
+                // The connection dropped; a retry with the same key attaches to the turn if it started
+                if (attempt >= MAX_SEND_RETRIES) throw error;
+                await sleep(2 ** attempt);
+                continue;
+            }
+            if ((response.status !== 429 && response.status !== 409) || attempt >= MAX_SEND_RETRIES) {
+                return response;
+            }
+            // Saturated backend or an original still running elsewhere: wait as long as it asks and try again
+            const busy = await response.json();
+            const retryAfter = Number(response.headers.get('Retry-After')) || busy.retry_after || 5;
+            if (response.status === 429) {
+                setMessages(prev => [...prev, {
+                    role: 'agent',
+                    content: `The elves are busy (you are #${busy.queue_position} in line). Retrying in ${retryAfter}s...`,
+                    timestamp: new Date()
+                }]);
+            }
+            await sleep(retryAfter);
+        }
+    };
+
     const handleSubmit = async (e: React.FormEvent) => {
         e.preventDefault();
         if ((!input.trim() && !selectedImage) || isLoading) return;
@@ -67,12 +144,11 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStateUpdate }) => {
                 formData.append('file', selectedImage);
             }
 
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                body: formData,
-            });
-
+            // One key per message: resubmits and retries of it are answered from the first run
+            const idempotencyKey = (idempotencyKeyRef.current ??= newIdempotencyKey());
+            const response = await postChat(formData, idempotencyKey);
             if (!response.ok) throw new Error('Failed to send message');
+            idempotencyKeyRef.current = null;
 
             const data = await response.json();
 
@@ -87,6 +163,8 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStateUpdate }) => {
                 onStateUpdate(data.tree_state);
             }
 
+            (data.jobs || []).forEach((jobId: string) => followJob(jobId));
+
         } catch (error) {
             console.error('Error:', error);
             setMessages(prev => [...prev, {
@@ -162,6 +240,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStateUpdate }) => {
                             <button
                                 type="button"
                                 onClick={() => {
+                                    idempotencyKeyRef.current = null;
                                     setSelectedImage(null);
                                     if (fileInputRef.current) fileInputRef.current.value = '';
                                 }}
@@ -189,7 +268,10 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStateUpdate }) => {
                     <input
                         type="text"
                         value={input}
-                        onChange={(e) => setInput(e.target.value)}
+                        onChange={(e) => {
+                            idempotencyKeyRef.current = null;
+                            setInput(e.target.value);
+                        }}
                         placeholder="Type a message..."
                         style={{ color: '#ffffff' }}
                         className="flex-1 bg-transparent border-none text-white caret-white placeholder-gray-400 focus:outline-none px-2 py-3"
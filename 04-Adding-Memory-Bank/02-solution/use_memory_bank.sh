@@ -58,6 +58,13 @@ echo "Deployment Successful!"
 echo "Captured Agent Engine ID: $AGENT_ID"
 echo "------------------------------------------------"
 
+# Registration is idempotent, so reruns usually return the same engine; leave .env alone then
+if grep -qE "^(export[[:space:]]+)?AGENT_ENGINE_ID=$AGENT_ID[[:space:]]*$" "$ENV_FILE" && \
+   grep -qiE "^(export[[:space:]]+)?USE_MEMORY_BANK=true[[:space:]]*$" "$ENV_FILE"; then
+    echo ".env is already up to date."
+    exit 0
+fi
+
 # Update .env file safely using a small Python script
 python3 -c "
 import sys